@@ -1,28 +1,77 @@
 import tkinter as tk
-from tkinter import ttk, scrolledtext
-import requests
+from tkinter import ttk, scrolledtext, filedialog, messagebox
 import json
-import re
+import os
+import queue
 import time
+import re
 import threading
 from datetime import datetime
-import uuid as uuid_lib
+from vz_detect import parse_rule
+from vz_engine import (DeletionEngine, MODE_SCAN, MODE_MAX_LOOP, is_valid_ip_or_domain,
+                       is_valid_uuid, convert_to_timestamp)
+from vz_archive import DEFAULT_ARCHIVE_DIR
+
+# Mode names shown in the GUI
+MODES = {
+    "Single Scan": MODE_SCAN,
+    "Max Loop": MODE_MAX_LOOP,
+}
+
+# Folder for the journals of interrupted runs
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".vz_delete_tool")
+
+# Full log file, written when enabled in the GUI
+LOG_FILE = os.path.join(JOURNAL_DIR, "vz_delete_tool.log")
+
+# Summary of the last run with its metrics
+LAST_RUN_FILE = os.path.join(JOURNAL_DIR, "last_run.json")
+
+# Log rendering: drain interval in ms, messages per drain and lines kept in the log area
+LOG_DRAIN_MS = 100
+LOG_BATCH = 20000
+LOG_MAX_LINES = 5000
+
+# Height of the scrolled input parameters in pixels, the log gets the rest of the window
+INPUT_HEIGHT = 330
+
+# Time windows for the streaming tuple reader
+SCAN_WINDOWS = {
+    "1 hour": 60 * 60 * 1000,
+    "6 hours": 6 * 60 * 60 * 1000,
+    "1 day": 24 * 60 * 60 * 1000,
+    "7 days": 7 * 24 * 60 * 60 * 1000,
+}
 
 class DataDeletionApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Data Deletion Tool v0.8b")
-        self.root.geometry("850x650")
-        self.processing = False
-        self.deleted_count = 0
+        self.root.geometry("900x780")
+        self.root.minsize(700, 560)
+        self.engine = DeletionEngine(log=self.log, on_status=self.show_status, on_rate=self.show_rate)
+        
+        # Worker threads only queue log lines and UI updates, the Tk loop applies them
+        self.log_queue = queue.Queue()
+        self.ui_updates = {}
+        self.log_file = None
         
         # Create main frame
         main_frame = ttk.Frame(root, padding="10")
         main_frame.pack(fill=tk.BOTH, expand=True)
         
-        # Create input frame
-        input_frame = ttk.LabelFrame(main_frame, text="Input Parameters", padding="10")
-        input_frame.pack(fill=tk.X, pady=5)
+        # Create input frame, its rows scroll in a canvas so they fit into small windows
+        input_box = ttk.LabelFrame(main_frame, text="Input Parameters", padding="10")
+        input_box.pack(fill=tk.X, pady=5)
+        input_canvas = tk.Canvas(input_box, height=INPUT_HEIGHT, highlightthickness=0)
+        input_scroll = ttk.Scrollbar(input_box, orient=tk.VERTICAL, command=input_canvas.yview)
+        input_canvas.configure(yscrollcommand=input_scroll.set)
+        input_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        input_canvas.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        input_frame = ttk.Frame(input_canvas)
+        input_canvas.create_window((0, 0), window=input_frame, anchor=tk.NW)
+        input_frame.bind("<Configure>", lambda event: input_canvas.configure(scrollregion=input_canvas.bbox("all")))
+        self.bind_mouse_wheel(input_canvas)
         
         # Server input
         ttk.Label(input_frame, text="Server Address:").grid(row=0, column=0, sticky=tk.W, pady=5)
@@ -69,13 +118,112 @@ class DataDeletionApp:
         self.max_value_entry.pack(side=tk.LEFT)
         self.create_tooltip(max_value_frame, "Enter max value as xxx.xx or whole number (e.g., 123.45 or 30000)\nUse the sign selector for negative thresholds")
         
-        # Delay selection
-        ttk.Label(input_frame, text="Processing Delay:").grid(row=5, column=0, sticky=tk.W, pady=5)
-        self.delay_var = tk.StringVar(value="1000")
-        delay_combo = ttk.Combobox(input_frame, textvariable=self.delay_var, width=38, state="readonly")
-        delay_combo["values"] = ["200", "500", "1000", "2000"]
-        delay_combo.grid(row=5, column=1, sticky=tk.W, pady=5)
-        self.create_tooltip(delay_combo, "Select delay between operations in milliseconds:\n200ms: Local x86 systems\n500ms: Server (local or remote)\n1000ms: Raspberry Pi\n2000ms: Slow systems")
+        # Optional min value for a band
+        ttk.Label(input_frame, text="Min Value (band):").grid(row=5, column=0, sticky=tk.W, pady=5)
+        min_value_frame = ttk.Frame(input_frame)
+        min_value_frame.grid(row=5, column=1, sticky=tk.W, pady=5)
+        self.min_value_sign_var = tk.StringVar(value="-")
+        min_sign_combo = ttk.Combobox(min_value_frame, textvariable=self.min_value_sign_var, width=3, state="readonly")
+        min_sign_combo["values"] = ["+", "-"]
+        min_sign_combo.pack(side=tk.LEFT, padx=(0, 5))
+        self.min_value_var = tk.StringVar()
+        self.min_value_entry = ttk.Entry(min_value_frame, textvariable=self.min_value_var, width=36)
+        self.min_value_entry.pack(side=tk.LEFT)
+        self.create_tooltip(min_value_frame, "Optional. With a min value the max value is the upper bound and every value\nbelow min or above max is deleted in the same run (e.g. -8000 and +8000 for import/export meters)")
+        
+        # Rate ceiling input
+        ttk.Label(input_frame, text="Max Rate (req/s):").grid(row=6, column=0, sticky=tk.W, pady=5)
+        self.max_rate_var = tk.StringVar()
+        self.max_rate_entry = ttk.Entry(input_frame, textvariable=self.max_rate_var, width=40)
+        self.max_rate_entry.grid(row=6, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(self.max_rate_entry, "Optional hard ceiling for delete requests per second (e.g. 5 or 0.5).\nLeave empty to let the tool find the fastest rate the server handles.")
+        
+        # Mode selection
+        ttk.Label(input_frame, text="Mode:").grid(row=7, column=0, sticky=tk.W, pady=5)
+        self.mode_var = tk.StringVar(value="Single Scan")
+        mode_combo = ttk.Combobox(input_frame, textvariable=self.mode_var, width=38, state="readonly")
+        mode_combo["values"] = list(MODES)
+        mode_combo.grid(row=7, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(mode_combo, "Single Scan: fetch the range once and delete every value beyond the threshold\nMax Loop: re-fetch the range after every delete and check only the current max (old behaviour)")
+        
+        # Scan window selection
+        ttk.Label(input_frame, text="Scan Window:").grid(row=8, column=0, sticky=tk.W, pady=5)
+        self.window_var = tk.StringVar(value="1 day")
+        window_combo = ttk.Combobox(input_frame, textvariable=self.window_var, width=38, state="readonly")
+        window_combo["values"] = list(SCAN_WINDOWS)
+        window_combo.grid(row=8, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(window_combo, "Single Scan reads the range in time windows of this size.\nSmaller windows keep memory low on long raw channels.")
+        
+        # Parallel delete selection
+        ttk.Label(input_frame, text="Max Parallel Deletes:").grid(row=9, column=0, sticky=tk.W, pady=5)
+        self.concurrency_var = tk.StringVar(value="4")
+        concurrency_combo = ttk.Combobox(input_frame, textvariable=self.concurrency_var, width=38, state="readonly")
+        concurrency_combo["values"] = ["1", "2", "4", "8"]
+        concurrency_combo.grid(row=9, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(concurrency_combo, "Upper limit of delete requests kept in flight at the same time (Single Scan only).\n1 deletes strictly one after another like the old versions.")
+        
+        # Range delete option
+        self.range_delete_var = tk.BooleanVar(value=True)
+        range_check = ttk.Checkbutton(input_frame, text="Delete consecutive values as one range", variable=self.range_delete_var)
+        range_check.grid(row=10, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(range_check, "Single Scan: runs of consecutive values beyond the threshold are deleted\nwith one from/to request instead of one request per value.\nFalls back to single deletes if the server refuses range deletes.")
+        
+        # Resume option
+        self.resume_var = tk.BooleanVar(value=False)
+        resume_check = ttk.Checkbutton(input_frame, text="Resume last run of this channel", variable=self.resume_var)
+        resume_check.grid(row=11, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(resume_check, "Single Scan: continue a stopped or interrupted run with the same server, UUID,\ntime range and max value without scanning or deleting again what was already done.")
+        
+        # Dry run option
+        self.dry_run_var = tk.BooleanVar(value=False)
+        dry_run_check = ttk.Checkbutton(input_frame, text="Dry run (only write a delete plan)", variable=self.dry_run_var)
+        dry_run_check.grid(row=12, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(dry_run_check, "Single Scan: scan the range and save every value that would be deleted to a plan file.\nNothing is deleted. Use \"Execute Plan\" to delete the values of a plan later.")
+        
+        # Probe option
+        probe_frame = ttk.Frame(input_frame)
+        probe_frame.grid(row=13, column=1, sticky=tk.W, pady=5)
+        self.probe_var = tk.BooleanVar(value=False)
+        probe_check = ttk.Checkbutton(probe_frame, text="Probe first, skip clean parts, values every", variable=self.probe_var)
+        probe_check.pack(side=tk.LEFT)
+        self.probe_interval_var = tk.StringVar()
+        probe_interval_entry = ttk.Entry(probe_frame, textvariable=self.probe_interval_var, width=6)
+        probe_interval_entry.pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Label(probe_frame, text="s or more").pack(side=tk.LEFT, padx=(5, 0))
+        self.create_tooltip(probe_frame, "Single Scan: ask the server for averages of big packets first and only download\nthe raw values of packets that may hold values beyond the threshold.\nOnly for channels without negative values (without positive values for negative thresholds).\nThe server weighs the values by time, enter the smallest time between two values\nof the channel in seconds (e.g. 1). Without it all values are scanned.")
+        
+        # Cache option
+        self.cache_var = tk.BooleanVar(value=False)
+        cache_check = ttk.Checkbutton(input_frame, text="Keep fetched data in a local cache", variable=self.cache_var)
+        cache_check.grid(row=14, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(cache_check, "Single Scan: keep the downloaded values on disk and only fetch the parts of the range\nnot cached yet. Scanning again with another max value then needs no download.")
+        
+        # Async I/O option
+        self.async_var = tk.BooleanVar(value=False)
+        async_check = ttk.Checkbutton(input_frame, text="Async I/O (remote servers)", variable=self.async_var)
+        async_check.grid(row=15, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(async_check, "Single Scan: download the next window while the values of the current one are deleted.\nFaster against remote servers with high latency. No resume, cache, probe or extra rules.")
+        
+        # Extra detection rules
+        ttk.Label(input_frame, text="Extra Rules:").grid(row=16, column=0, sticky=tk.W, pady=5)
+        self.rules_var = tk.StringVar()
+        self.rules_entry = ttk.Entry(input_frame, textvariable=self.rules_var, width=40)
+        self.rules_entry.grid(row=16, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(self.rules_entry, "Optional, Single Scan only, needs numpy. Separate rules with spaces, e.g.\nrate:500 spike:31:6 stuck:60 band:-4000:30000")
+        
+        # Scan shards selection
+        ttk.Label(input_frame, text="Scan Shards:").grid(row=17, column=0, sticky=tk.W, pady=5)
+        self.shards_var = tk.StringVar(value="1")
+        shards_combo = ttk.Combobox(input_frame, textvariable=self.shards_var, width=38, state="readonly")
+        shards_combo["values"] = ["1", "2", "4", "8"]
+        shards_combo.grid(row=17, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(shards_combo, "Single Scan: split the time range into this many parts that are downloaded\nat the same time. For very long ranges of one channel on a remote server,\nonly the network waits overlap. No probe or cache.")
+        
+        # Log file option
+        self.log_file_var = tk.BooleanVar(value=False)
+        log_file_check = ttk.Checkbutton(input_frame, text="Write full log file", variable=self.log_file_var, command=self.toggle_log_file)
+        log_file_check.grid(row=18, column=1, sticky=tk.W, pady=5)
+        self.create_tooltip(log_file_check, f"Append every log message to {LOG_FILE}.\nThe log area only keeps the last {LOG_MAX_LINES} lines.")
         
         # Button frame
         button_frame = ttk.Frame(main_frame)
@@ -89,6 +237,16 @@ class DataDeletionApp:
         self.stop_button = ttk.Button(button_frame, text="Stop Process", command=self.stop_process, state=tk.DISABLED)
         self.stop_button.pack(side=tk.LEFT, padx=5)
         
+        # Execute plan button
+        self.plan_button = ttk.Button(button_frame, text="Execute Plan", command=self.execute_plan)
+        self.plan_button.pack(side=tk.LEFT, padx=5)
+        
+        # Restore button
+        self.restore_button = ttk.Button(button_frame, text="Restore Archived", command=self.restore_archived)
+        self.restore_button.pack(side=tk.LEFT, padx=5)
+        self.create_tooltip(self.restore_button, f"Add the values deleted from the channel back from the archive in {DEFAULT_ARCHIVE_DIR}.\n"
+                            "Only those between start and end time if both are filled in.")
+        
         # Help button
         self.help_button = ttk.Button(button_frame, text="?", width=3, command=self.show_help)
         self.help_button.pack(side=tk.RIGHT, padx=5)
@@ -101,6 +259,16 @@ class DataDeletionApp:
         self.status_var = tk.StringVar(value="Ready")
         ttk.Label(status_frame, textvariable=self.status_var).pack(fill=tk.X)
         
+        # Live rate label
+        self.rate_var = tk.StringVar(value="")
+        ttk.Label(status_frame, textvariable=self.rate_var).pack(fill=tk.X)
+        
+        # Live metrics label
+        self.metrics_var = tk.StringVar(value="")
+        ttk.Label(status_frame, textvariable=self.metrics_var).pack(fill=tk.X)
+        self.metrics_shown = 0.0
+        self.running = False
+        
         # Log frame
         log_frame = ttk.LabelFrame(main_frame, text="Log", padding="10")
         log_frame.pack(fill=tk.BOTH, expand=True, pady=5)
@@ -121,6 +289,21 @@ class DataDeletionApp:
         
         # Initialize log
         self.log("Application started", "INFO")
+        self.root.after(LOG_DRAIN_MS, self.drain_log)
+    
+    def bind_mouse_wheel(self, canvas):
+        """Scroll the canvas with the mouse wheel while the pointer is over it or one of its widgets"""
+        def scroll(event):
+            if not str(event.widget).startswith(str(canvas)):
+                return
+            if event.num == 4 or event.delta > 0:
+                canvas.yview_scroll(-1, "units")
+            elif event.num == 5 or event.delta < 0:
+                canvas.yview_scroll(1, "units")
+        
+        # Windows and macOS send MouseWheel, X11 sends the buttons 4 and 5
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            canvas.bind_all(sequence, scroll, add="+")
     
     def create_tooltip(self, widget, text):
         """Create a tooltip for a given widget"""
@@ -148,7 +331,7 @@ class DataDeletionApp:
         help_window.geometry("600x400")
         
         help_text = """
-Data Deletion Tool v0.5b
+Data Deletion Tool v0.8b
 By Tobias aka Raptorsds (github.com/raptorsds)
 Created with Claude | MIT License
 
@@ -162,11 +345,69 @@ Instructions:
    - Use the +/- selector to set positive or negative thresholds
    - For negative thresholds, values below the threshold will be deleted
    - Example: With -4000, values like -6000 will be deleted, but -3990 will remain
-5. Processing Delay: Select appropriate delay based on your system:
-   - 200ms: Fast local x86 systems
-   - 500ms: Server environments (local or remote)
-   - 1000ms: Raspberry Pi or similar devices
-   - 2000ms: Slow systems or high-latency connections
+   Min Value (band): optional lower bound. With a min value the max value is the
+   upper bound and values below min or above max are deleted in the same run,
+   e.g. -8000 and +8000 clear both directions of an import/export meter at once.
+5. Max Rate: Optional ceiling for delete requests per second.
+   The tool measures the delete latency and errors and adjusts rate and
+   parallelism itself: it speeds up while the server answers as fast as before
+   and halves the rate when requests fail or take more than twice as long as
+   the fastest ones, then speeds up again. Always slow servers are not slowed down.
+   Leave empty for no ceiling, use e.g. 1 on a busy Raspberry Pi.
+6. Mode:
+   - Single Scan: fetch the range once, find all values beyond the threshold and delete them
+   - Max Loop: re-fetch the range after every delete and only check the current max value
+7. Scan Window: Single Scan streams the range window by window, so memory stays low
+   even for ranges spanning several years
+8. Max Parallel Deletes: upper limit of delete requests sent at the same time in
+   Single Scan mode. The current rate and parallelism are shown in the status area.
+9. Range deletes: consecutive values beyond the threshold (with no good value in
+   between) are deleted with a single from/to request. If the server refuses
+   range deletes the tool falls back to deleting them one by one.
+10. Resume: every Single Scan run keeps a journal of its progress. If a run was
+   stopped or the connection dropped, tick this box and start again with the same
+   inputs to continue where it stopped.
+11. Dry run: only scan and save every value that would be deleted, with the reason,
+   to a plan file. "Execute Plan" deletes the values of a saved plan later without
+   fetching the data again (server, UUID and range are taken from the plan).
+12. Probe: Single Scan first asks the server for averages of big packets and skips
+   every packet whose average proves that no value in it can be beyond the
+   threshold. Much less data is downloaded for long, mostly clean ranges.
+   Only use it for channels that never go below 0 (never above 0 for negative
+   thresholds), e.g. power or meter readings. The server weighs the values by
+   time, so enter the smallest time between two values of the channel in
+   seconds next to it. Without it all values are scanned.
+13. Cache: keep the downloaded values of the channel on disk (in ~/.vz_delete_tool/cache)
+   and only fetch the parts of the range that are not cached yet. Deleted values
+   are removed from the cache as well. If values were changed by other tools,
+   untick and tick again is not enough - delete the cache folder of the channel.
+14. Extra Rules (Single Scan, needs numpy), separated by spaces, checked together
+   with the max value in the same scan:
+   - band:LOW:HIGH  values below LOW or above HIGH
+   - rate:LIMIT     a single value jumping away by more than LIMIT per second and back
+   - spike:31:6     values more than 6 MADs away from the median of the 31 values around
+   - stuck:60       60 or more identical values in a row (all but the first are deleted)
+15. Async I/O: for remote servers with high latency. The next window is downloaded
+   while the values found in the current one are already being deleted. Works with
+   the max value / band only (no resume, dry run, cache, probe or extra rules).
+16. Write full log file: the log area keeps the last 5000 lines, tick this to append
+   every message to ~/.vz_delete_tool/vz_delete_tool.log as well.
+17. Scan Shards: Single Scan splits the time range into this many parts that are
+   downloaded at the same time, e.g. for years of 1-second values of one channel
+   on a remote server. Only the waiting for the server overlaps, reading and checking
+   the values still uses one CPU core, so against a fast local server it does not help.
+   The values found are deleted in time order as usual. Only band rules work with
+   shards, with rate, spike or stuck rules the range is scanned in one piece.
+   Not together with probe or cache.
+
+The status area shows live metrics: data fetched, values parsed and the parse time,
+deletes per second with the median latency and retries. The full summary of the
+last run (with p50/p95/p99 delete latency) is saved to ~/.vz_delete_tool/last_run.json.
+
+Every value is written to ~/.vz_delete_tool/archive/<uuid>.vza before it is deleted.
+Restore Archived adds the deleted values of the channel back in batches (only those
+between start and end time if both are filled in). The cache of the channel is
+dropped, the next cached scan fetches the channel again.
 
 The tool will fetch data points and delete any that exceed the specified max value.
 Progress and results will be shown in the log area.
@@ -178,36 +419,83 @@ Progress and results will be shown in the log area.
         help_scroll.config(state=tk.DISABLED)
     
     def log(self, message, level="INFO"):
-        """Add a message to the log with timestamp"""
+        """Add a message to the log with timestamp, safe to call from any thread"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_message = f"[{timestamp}] [{level}] {message}\n"
-        self.log_text.insert(tk.END, log_message, level)
-        self.log_text.see(tk.END)
+        self.log_queue.put((f"[{timestamp}] [{level}] {message}\n", level))
+    
+    def drain_log(self):
+        """Apply queued log lines and UI updates in one batch, runs on the Tk loop"""
+        lines = []
+        try:
+            while len(lines) < LOG_BATCH:
+                lines.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+        
+        if lines:
+            if self.log_file:
+                self.log_file.write("".join(line for line, level in lines))
+                self.log_file.flush()
+            # One insert call for the whole batch, older lines only go to the log file
+            chunks = []
+            for line, level in lines[-LOG_MAX_LINES:]:
+                chunks.extend((line, level))
+            self.log_text.insert(tk.END, *chunks)
+            excess = int(self.log_text.index("end-1c").split(".")[0]) - 1 - LOG_MAX_LINES
+            if excess > 0:
+                self.log_text.delete("1.0", f"{excess + 1}.0")
+            self.log_text.see(tk.END)
+        
+        # Only the latest status and rate matter
+        for name, var in (("status", self.status_var), ("rate", self.rate_var)):
+            if name in self.ui_updates:
+                var.set(self.ui_updates.pop(name))
+        if "finished" in self.ui_updates:
+            self.finish_process(self.ui_updates.pop("finished"))
+        elif self.running and time.monotonic() - self.metrics_shown >= 1.0:
+            self.metrics_var.set(self.engine.metrics.describe())
+            self.metrics_shown = time.monotonic()
+        
+        self.root.after(LOG_DRAIN_MS, self.drain_log)
+    
+    def toggle_log_file(self):
+        """Open or close the full log file"""
+        if self.log_file_var.get():
+            try:
+                os.makedirs(JOURNAL_DIR, exist_ok=True)
+                self.log_file = open(LOG_FILE, "a", encoding="utf-8")
+                self.log(f"Writing log to {LOG_FILE}", "INFO")
+            except OSError as e:
+                self.log_file_var.set(False)
+                self.log(f"Cannot open log file {LOG_FILE}: {str(e)}", "ERROR")
+        elif self.log_file:
+            self.log_file.close()
+            self.log_file = None
     
     def validate_inputs(self):
         """Validate all input fields"""
         # Validate server
         server = self.server_var.get().strip()
-        if not server or not self.is_valid_ip_or_domain(server) or server.endswith('/'):
+        if not server or not is_valid_ip_or_domain(server) or server.endswith('/'):
             self.log("Invalid server address. Please enter a valid IP or domain without trailing slash.", "ERROR")
             return False
         
         # Validate UUID
         uuid = self.uuid_var.get().strip()
-        if not uuid or not self.is_valid_uuid(uuid):
+        if not uuid or not is_valid_uuid(uuid):
             self.log("Invalid UUID format. Please enter a valid UUID.", "ERROR")
             return False
         
         # Validate start time
         start_time = self.start_time_var.get().strip()
-        start_timestamp = self.convert_to_timestamp(start_time)
+        start_timestamp = convert_to_timestamp(start_time)
         if start_timestamp is None:
             self.log("Invalid start time format. Use dd.MM.yyyy HH:mm or UNIX timestamp.", "ERROR")
             return False
         
         # Validate end time
         end_time = self.end_time_var.get().strip()
-        end_timestamp = self.convert_to_timestamp(end_time)
+        end_timestamp = convert_to_timestamp(end_time)
         if end_timestamp is None:
             self.log("Invalid end time format. Use dd.MM.yyyy HH:mm or UNIX timestamp.", "ERROR")
             return False
@@ -218,49 +506,34 @@ Progress and results will be shown in the log area.
             self.log("Invalid max value format. Please use xxx.xx format or whole number.", "ERROR")
             return False
         
-        return True
-    
-    def is_valid_ip_or_domain(self, value):
-        """Check if the value is a valid IP address or domain name"""
-        ip_pattern = r"\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b"
-        domain_pattern = r"^(?:(?!-)[A-Za-z0-9-]{1,63}(?<!-)\.)+[A-Za-z]{2,6}$"
-        return bool(re.match(ip_pattern, value) or re.match(domain_pattern, value))
-    
-    def is_valid_uuid(self, value):
-        """
-        Robuste Überprüfung, ob der Wert eine gültige UUID ist.
-        Verwendet sowohl Regex-Muster als auch die uuid-Bibliothek für maximale Sicherheit.
-        """
-        # Regex-Muster für UUID-Format
-        uuid_pattern = r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'
+        # Validate optional min value
+        min_value = self.min_value_var.get().strip()
+        if min_value:
+            if not self.is_valid_decimal_or_integer(min_value):
+                self.log("Invalid min value format. Please use xxx.xx format or whole number.", "ERROR")
+                return False
+            if self.signed_value(self.min_value_sign_var, self.min_value_var) >= self.signed_value(self.max_value_sign_var, self.max_value_var):
+                self.log("Min value must be below max value.", "ERROR")
+                return False
         
-        # Erste Überprüfung mit Regex
-        if not re.match(uuid_pattern, value):
+        # Validate rate ceiling
+        max_rate = self.max_rate_var.get().strip()
+        if max_rate and self.parse_max_rate(max_rate) is None:
+            self.log("Invalid max rate. Please enter a positive number or leave it empty.", "ERROR")
             return False
         
-        # Zweite Überprüfung mit der uuid-Bibliothek
-        try:
-            # Versuche, den String in ein UUID-Objekt zu konvertieren
-            uuid_obj = uuid_lib.UUID(value)
-            # Überprüfe, ob die String-Repräsentation mit dem Original übereinstimmt
-            return str(uuid_obj) == value.lower()
-        except ValueError:
-            # Wenn die Konvertierung fehlschlägt, ist es keine gültige UUID
+        # Validate extra rules
+        for rule in self.rules_var.get().split():
+            try:
+                parse_rule(rule)
+            except ValueError as e:
+                self.log(f"Invalid rule: {str(e)}", "ERROR")
+                return False
+        if self.rules_var.get().split() and MODES[self.mode_var.get()] == MODE_MAX_LOOP:
+            self.log("Extra rules only work in Single Scan mode.", "ERROR")
             return False
-    
-    def convert_to_timestamp(self, value):
-        """Convert a date string to UNIX timestamp or validate existing timestamp"""
-        # Check if it's already a timestamp
-        if value.isdigit():
-            return int(value)
         
-        # Try to convert from date format
-        try:
-            dt = datetime.strptime(value, "%d.%m.%Y %H:%M")
-            timestamp = int((dt - datetime(1970, 1, 1)).total_seconds() * 1000)
-            return timestamp
-        except ValueError:
-            return None
+        return True
     
     def is_valid_decimal_or_integer(self, value):
         """Check if the value is in xxx.xx format or a whole number"""
@@ -274,6 +547,19 @@ Progress and results will be shown in the log area.
             
         return False
     
+    def parse_max_rate(self, value):
+        """Convert the rate ceiling to a positive float, None if empty or invalid"""
+        try:
+            rate = float(value)
+        except ValueError:
+            return None
+        return rate if rate > 0 else None
+    
+    def parse_probe_interval(self, value):
+        """Convert the smallest time between two values from seconds to ms, None if empty or invalid"""
+        seconds = self.parse_max_rate(value.replace(",", "."))
+        return seconds * 1000 if seconds else None
+    
     def format_max_value(self, value):
         """Format max value to ensure it has two decimal places"""
         if value.isdigit():
@@ -281,42 +567,16 @@ Progress and results will be shown in the log area.
             return f"{value}.00"
         return value
     
-    def get_json_data(self, url):
-        """Fetch JSON data from the given URL"""
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                self.log(f"Failed to fetch data: HTTP {response.status_code}", "ERROR")
-                return None
-        except Exception as e:
-            self.log(f"Error fetching JSON data: {str(e)}", "ERROR")
-            return None
-    
-    def delete_data(self, url):
-        """Delete data using the given URL"""
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                return True
-            else:
-                self.log(f"Failed to delete data: HTTP {response.status_code}", "ERROR")
-                return False
-        except Exception as e:
-            self.log(f"Error deleting data: {str(e)}", "ERROR")
-            return False
+    def signed_value(self, sign_var, value_var):
+        """Return the value of an entry with its sign selector as float"""
+        value = float(self.format_max_value(value_var.get().strip()))
+        return -value if sign_var.get() == "-" else value
     
     def start_process(self):
         """Start the data deletion process"""
         if not self.validate_inputs():
             return
         
-        self.processing = True
-        self.start_button.config(state=tk.DISABLED)
-        self.stop_button.config(state=tk.NORMAL)
-        self.status_var.set("Processing...")
-        
         # Prepare parameters
         max_value_raw = self.max_value_var.get().strip()
         max_value_formatted = self.format_max_value(max_value_raw)
@@ -331,87 +591,125 @@ Progress and results will be shown in the log area.
         params = {
             "server": self.server_var.get().strip(),
             "uuid": self.uuid_var.get().strip(),
-            "start_time": self.convert_to_timestamp(self.start_time_var.get().strip()),
-            "end_time": self.convert_to_timestamp(self.end_time_var.get().strip()),
-            "max_value": max_value_with_sign,
-            "delay_ms": int(self.delay_var.get())
+            "start_time": convert_to_timestamp(self.start_time_var.get().strip()),
+            "end_time": convert_to_timestamp(self.end_time_var.get().strip()),
+            "max_value": float(max_value_with_sign),
+            "min_value": self.signed_value(self.min_value_sign_var, self.min_value_var) if self.min_value_var.get().strip() else None,
+            "max_rate": self.parse_max_rate(self.max_rate_var.get().strip()),
+            "mode": MODES[self.mode_var.get()],
+            "window_ms": SCAN_WINDOWS[self.window_var.get()],
+            "concurrency": int(self.concurrency_var.get()),
+            "range_delete": self.range_delete_var.get(),
+            "journal": None if self.async_var.get() else os.path.join(JOURNAL_DIR, f"{self.uuid_var.get().strip()}.journal"),
+            "resume": self.resume_var.get(),
+            "dry_run": self.dry_run_var.get(),
+            "probe": self.probe_var.get(),
+            "probe_interval": self.parse_probe_interval(self.probe_interval_var.get().strip()),
+            "rules": [rule.lower() for rule in self.rules_var.get().split()] or None,
+            "shards": int(self.shards_var.get()),
+            "cache": os.path.join(JOURNAL_DIR, "cache") if self.cache_var.get() else None,
+            "async_io": self.async_var.get(),
+            "archive": DEFAULT_ARCHIVE_DIR
         }
         
-        # Start processing in a separate thread
+        # Ask where to save the plan of a dry run
+        if params["dry_run"]:
+            params["mode"] = MODES["Single Scan"]
+            params["plan_out"] = filedialog.asksaveasfilename(title="Save delete plan", defaultextension=".json.gz",
+                                                              filetypes=[("Delete plan", "*.json.gz *.json")])
+            if not params["plan_out"]:
+                return
+        
+        self.run_in_background(params)
+    
+    def execute_plan(self):
+        """Delete the values of a plan file written by a dry run"""
+        path = filedialog.askopenfilename(title="Open delete plan", filetypes=[("Delete plan", "*.json.gz *.json")])
+        if not path:
+            return
+        params = {
+            "plan_in": path,
+            "max_rate": self.parse_max_rate(self.max_rate_var.get().strip()),
+            "concurrency": int(self.concurrency_var.get()),
+            "range_delete": self.range_delete_var.get(),
+            "cache": os.path.join(JOURNAL_DIR, "cache") if self.cache_var.get() else None,
+            "archive": DEFAULT_ARCHIVE_DIR
+        }
+        self.run_in_background(params)
+    
+    def restore_archived(self):
+        """Add the archived values of the channel back, within the time range if one is given"""
+        server = self.server_var.get().strip()
+        uuid_value = self.uuid_var.get().strip()
+        if not server or not is_valid_ip_or_domain(server) or server.endswith('/') or not is_valid_uuid(uuid_value):
+            self.log("Restore needs a valid server address and UUID.", "ERROR")
+            return
+        start_time = convert_to_timestamp(self.start_time_var.get().strip())
+        end_time = convert_to_timestamp(self.end_time_var.get().strip())
+        if start_time is None or end_time is None:
+            start_time = end_time = None
+        scope = "all archived values" if start_time is None else f"the archived values from {self.start_time_var.get().strip()} to {self.end_time_var.get().strip()}"
+        if not messagebox.askyesno("Restore archived values", f"Add {scope} of {uuid_value} back to {server}?"):
+            return
+        self.run_in_background({
+            "server": server,
+            "uuid": uuid_value,
+            "start_time": start_time,
+            "end_time": end_time,
+            "max_value": None,
+            "restore": True,
+            "archive": DEFAULT_ARCHIVE_DIR,
+            # The cache of the channel lists the restored values as deleted, it is dropped
+            "cache": os.path.join(JOURNAL_DIR, "cache")
+        })
+    
+    def run_in_background(self, params):
+        """Start processing in a separate thread"""
+        self.start_button.config(state=tk.DISABLED)
+        self.plan_button.config(state=tk.DISABLED)
+        self.restore_button.config(state=tk.DISABLED)
+        self.stop_button.config(state=tk.NORMAL)
+        self.status_var.set("Processing...")
+        self.running = True
         threading.Thread(target=self.process_data_deletion, args=(params,), daemon=True).start()
     
     def stop_process(self):
         """Stop the data deletion process"""
-        self.processing = False
+        self.engine.stop()
         self.stop_button.config(state=tk.DISABLED)
         self.status_var.set("Stopped")
         self.log("Process stopped by user", "WARNING")
     
+    def show_status(self, message):
+        """Show a status message from the engine"""
+        self.ui_updates["status"] = message
+    
+    def show_rate(self, controller):
+        """Show the live request rate and parallelism in the status frame"""
+        self.ui_updates["rate"] = f"Rate: {controller.rate:.1f} req/s | Parallel: {controller.concurrency}"
+    
     def process_data_deletion(self, params):
-        """Process data deletion based on the given parameters"""
-        server = params["server"]
-        uuid_value = params["uuid"]
-        start_time = params["start_time"]
-        end_time = params["end_time"]
-        max_value_str = params["max_value"]
-        delay_ms = params["delay_ms"]
-        
-        # Convert max_value to float for comparison
-        max_value = float(max_value_str)
-        
-        base_url = f"http://{server}/data/{uuid_value}.json?from={start_time}&to={end_time}"
-        self.deleted_count = 0
-        
-        self.log("Starting data deletion process...", "INFO")
-        self.log(f"Using URL: {base_url}", "INFO")
-        self.log(f"Max value threshold: {max_value_str}", "INFO")
-        self.log(f"Processing delay: {delay_ms}ms", "INFO")
-        
-        # Process loop
-        while self.processing:
-            json_data = self.get_json_data(base_url)
-            
-            if not json_data or "data" not in json_data or "max" not in json_data["data"]:
-                self.log("Invalid JSON data structure or no data found", "ERROR")
-                break
-            
-            max_entry = json_data["data"]["max"]
-            timestamp = max_entry[0]
-            current_max_value = float(max_entry[1])
-            
-            self.log(f"Current max value: {current_max_value}, Threshold: {max_value}", "INFO")
-            
-            # Check if value exceeds threshold (considering sign)
-            value_exceeds_threshold = False
-            if max_value >= 0:
-                # For positive thresholds, delete if value is greater
-                value_exceeds_threshold = current_max_value > max_value
-            else:
-                # For negative thresholds, delete if value is less (more negative)
-                value_exceeds_threshold = current_max_value < max_value
-            
-            if value_exceeds_threshold:
-                self.log(f"Found value exceeding threshold: [{timestamp}, {current_max_value}]", "WARNING")
-                delete_url = f"http://{server}/data/{uuid_value}.json?operation=delete&ts={timestamp}"
-                
-                if self.delete_data(delete_url):
-                    self.deleted_count += 1
-                    self.log(f"Successfully deleted entry with timestamp {timestamp}", "SUCCESS")
-                    self.status_var.set(f"Deleted: {self.deleted_count}")
-                else:
-                    self.log("Failed to delete entry. Stopping process.", "ERROR")
-                    break
-                
-                # Pause according to selected delay
-                time.sleep(delay_ms / 1000)
-            else:
-                self.log(f"No values exceeding threshold found. Process complete.", "INFO")
-                break
-        
-        self.log(f"Total entries deleted: {self.deleted_count}", "INFO")
-        self.status_var.set(f"Completed. Deleted: {self.deleted_count}")
-        self.processing = False
+        """Run the engine, the buttons are reset by the Tk loop afterwards"""
+        self.ui_updates["finished"] = self.engine.run(params)
+    
+    def finish_process(self, result):
+        """Show the result, save the summary and reset the buttons"""
+        self.running = False
+        if "restored" in result:
+            self.status_var.set(f"{result['status'].capitalize()}. Restored: {result['restored']}")
+        else:
+            self.status_var.set(f"{result['status'].capitalize()}. Deleted: {result['deleted']}")
+        if "metrics" in result:
+            self.metrics_var.set(self.engine.metrics.describe())
+            try:
+                os.makedirs(JOURNAL_DIR, exist_ok=True)
+                with open(LAST_RUN_FILE, "w", encoding="utf-8") as f:
+                    json.dump(result, f, indent=2)
+            except OSError as e:
+                self.log(f"Cannot write {LAST_RUN_FILE}: {str(e)}", "WARNING")
         self.start_button.config(state=tk.NORMAL)
+        self.plan_button.config(state=tk.NORMAL)
+        self.restore_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+"""
+Fixtures of the tests: a fake middleware (vz_fakeserver.py) serving a small synthetic
+channel on a free local port, and the params of an engine run against it.
+"""
+import functools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vz_engine
+from vz_engine import DeletionEngine
+from vz_fakeserver import DEFAULT_START, FakeMiddleware, generate_data, serve
+
+UUID = "12345678-1234-1234-1234-123456789abc"
+ROWS = 20000
+MAX_VALUE = 5000.0
+
+@pytest.fixture(scope="session")
+def channel_data():
+    """(timestamps, values) of the synthetic channel, one value per second with spikes"""
+    return generate_data(ROWS, spike_rate=0.002)
+
+@pytest.fixture(autouse=True)
+def fast_start(monkeypatch):
+    """Start deleting at full speed, the slow start of the rate controller paces real servers"""
+    monkeypatch.setattr(vz_engine, "RateController", functools.partial(vz_engine.RateController, start_rate=1000.0))
+
+@pytest.fixture
+def fake_server(channel_data):
+    """
+    Start a fake middleware, returns a factory (data=None, **settings) -> (middleware, "host:port")
+    serving data or the synthetic channel.
+    """
+    servers = []
+    
+    def start(data=None, **settings):
+        middleware = FakeMiddleware(*(data or channel_data), **settings)
+        server = serve(middleware)
+        servers.append(server)
+        return middleware, f"127.0.0.1:{server.server_address[1]}"
+    
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def run_engine(address, engine=None, **params):
+    """Run the engine on the whole channel with the given params, returns its summary"""
+    engine = engine or DeletionEngine()
+    return engine.run(dict({
+        "server": address,
+        "uuid": UUID,
+        "start_time": DEFAULT_START,
+        "end_time": DEFAULT_START + ROWS * 1000,
+        "max_value": MAX_VALUE,
+        "window_ms": 3600 * 1000,
+        "concurrency": 4,
+    }, **params))
+
+def channel_rows(middleware):
+    """Return the rows left on the fake middleware as a list of (timestamp, value)"""
+    channel = middleware.channel(UUID)
+    return list(zip(channel.timestamps, channel.values))
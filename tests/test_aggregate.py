@@ -0,0 +1,72 @@
+"""Re-aggregation: recomputing the touched buckets gives the aggregates of a full rebuild"""
+import shutil
+import sqlite3
+
+import pytest
+
+from conftest import MAX_VALUE, UUID, run_engine
+from vz_aggregate import bucket_bounds
+from vz_db import VolkszaehlerDatabase, create_sqlite_database
+
+TYPES = {"minute": 2, "hour": 3, "day": 4}
+
+def rebuild_all(path, timestamps, summed=False):
+    """Rebuild the aggregates of every bucket the timestamps fall into"""
+    database = VolkszaehlerDatabase(f"sqlite:///{path}")
+    try:
+        channel_id = database.channel_id(UUID)
+        for level, type_id in TYPES.items():
+            buckets = sorted({bucket_bounds(level, timestamp) for timestamp in timestamps})
+            database.rebuild_aggregates(channel_id, type_id, buckets, summed)
+    finally:
+        database.close()
+
+def aggregate_rows(path):
+    connection = sqlite3.connect(path)
+    try:
+        rows = connection.execute("SELECT type, timestamp, value, count FROM aggregate ORDER BY type, timestamp").fetchall()
+    finally:
+        connection.close()
+    return [(type_id, timestamp, round(value, 6), count) for type_id, timestamp, value, count in rows]
+
+@pytest.fixture(params=["powersensor", "electric meter"])
+def aggregated(request, tmp_path, channel_data):
+    """SQLite sensor or meter channel with full aggregates and deleted runs at and across hour borders"""
+    timestamps, values = channel_data
+    values = list(values)
+    first_hour = bucket_bounds("hour", timestamps[0])[1]
+    border = (first_hour - timestamps[0]) // 1000
+    # The last values of an hour, the first value of the next hour loses the value before it
+    values[border - 3:border] = [100000.0] * 3
+    # A run across the next hour border
+    values[border + 3600 - 2:border + 3600 + 2] = [100000.0] * 4
+    path = str(tmp_path / "volkszaehler.db")
+    create_sqlite_database(path, UUID, timestamps, values)
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("UPDATE entities SET type = ?", (request.param,))
+    connection.close()
+    summed = "meter" in request.param
+    rebuild_all(path, timestamps, summed)
+    return path, timestamps, summed
+
+def test_incremental_matches_full_rebuild(aggregated):
+    path, timestamps, summed = aggregated
+    result = run_engine(None, db=f"sqlite:///{path}", reaggregate=True, aggregate_types=TYPES)
+    assert result["status"] == "completed"
+    assert result["reaggregated"] > 0
+    full = path + ".full"
+    shutil.copyfile(path, full)
+    rebuild_all(full, timestamps, summed)
+    assert aggregate_rows(path) == aggregate_rows(full)
+
+def test_reaggregate_needs_window_functions(aggregated, monkeypatch):
+    path = aggregated[0]
+    database = VolkszaehlerDatabase(f"sqlite:///{path}")
+    assert database.supports_window_functions()
+    database.close()
+    monkeypatch.setattr(VolkszaehlerDatabase, "supports_window_functions", lambda self: False)
+    before = aggregate_rows(path)
+    result = run_engine(None, db=f"sqlite:///{path}", reaggregate=True, aggregate_types=TYPES, max_value=MAX_VALUE)
+    assert (result["status"], result["deleted"]) == ("failed", 0)
+    assert aggregate_rows(path) == before
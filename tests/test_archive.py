@@ -0,0 +1,77 @@
+"""Delete archive: records round trip, torn members and restoring deleted values"""
+import os
+
+from conftest import channel_rows, run_engine
+from vz_archive import DeleteArchive
+
+def write_archive(directory):
+    archive = DeleteArchive(directory, "uuid")
+    archive.add([(1, 1.5, "> 1"), (2, 2.5, "> 1")])
+    archive.add([(3, -3.5, "< 0")])
+    archive.sync()
+    archive.add([(4, 4.5, "> 1")])
+    archive.cancel([2])
+    archive.close()
+    return archive
+
+def test_round_trip(tmp_path):
+    archive = write_archive(str(tmp_path))
+    records = [(kind, list(timestamps), values and list(values)) for kind, timestamps, values in archive.iter_records()]
+    assert records == [(b"ADD1", [1, 2], [1.5, 2.5]), (b"ADD1", [3], [-3.5]), (b"ADD1", [4], [4.5]), (b"DEL1", [2], None)]
+    assert [list(column) for column in archive.load()] == [[1, 3, 4], [1.5, -3.5, 4.5]]
+    assert [list(column) for column in archive.load(2, 3)] == [[3], [-3.5]]
+
+def test_archived_again_after_cancel(tmp_path):
+    archive = DeleteArchive(str(tmp_path), "uuid")
+    archive.add([(1, 1.0)])
+    archive.cancel([1])
+    archive.add([(1, 2.0)])
+    archive.close()
+    assert [list(column) for column in archive.load()] == [[1], [2.0]]
+
+def test_queued_records_need_a_sync(tmp_path):
+    archive = DeleteArchive(str(tmp_path), "uuid")
+    archive.add([(1, 1.0)])
+    assert not os.path.exists(archive.path)
+    archive.sync()
+    assert [list(column) for column in archive.load()] == [[1], [1.0]]
+    archive.close()
+
+def test_cut_off_members_are_ignored(tmp_path):
+    archive = write_archive(str(tmp_path))
+    with open(archive.path, "rb") as f:
+        data = f.read()
+    for size in range(len(data)):
+        with open(archive.path, "wb") as f:
+            f.write(data[:size])
+        # Only whole members count, the first holds values 1-3, the second value 4 and the cancel
+        assert list(archive.load()[0]) in ([], [1, 2, 3]), size
+    for tail in (b"\x1f", b"\x1f\x8b\x08\x00", b"\x1f\x8b\x00garbage"):
+        with open(archive.path, "wb") as f:
+            f.write(data + tail)
+        assert list(archive.load()[0]) == [1, 3, 4], tail
+
+def test_restore_after_delete(fake_server, channel_data, tmp_path):
+    middleware, address = fake_server()
+    directory = str(tmp_path)
+    for options in ({}, {"range_delete": False}, {"async_io": True}):
+        middleware.reset()
+        deleted = run_engine(address, archive=directory, **options)["deleted"]
+        assert deleted > 0 and len(channel_rows(middleware)) == len(channel_data[0]) - deleted
+        
+        restored = run_engine(address, archive=directory, restore=True)
+        assert restored["restored"] == deleted
+        assert channel_rows(middleware) == list(zip(*channel_data))
+        # Restored values are marked, a second restore adds nothing
+        assert run_engine(address, archive=directory, restore=True)["restored"] == 0
+
+def test_cached_scan_after_restore(fake_server, tmp_path):
+    middleware, address = fake_server()
+    archive, cache = str(tmp_path / "archive"), str(tmp_path / "cache")
+    deleted = run_engine(address, archive=archive, cache=cache)["deleted"]
+    assert deleted > 0
+    assert run_engine(address, archive=archive, cache=cache, restore=True)["restored"] == deleted
+    # The cache listed the restored values as deleted, it is dropped and the scan sees them again
+    planned = run_engine(address, cache=cache, dry_run=True, plan_out=str(tmp_path / "plan.json"))
+    assert planned["offenders"] == deleted
+    assert len(channel_rows(middleware)) == len(middleware.template[0])
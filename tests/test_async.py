@@ -0,0 +1,24 @@
+"""Async client: deletes the same values as the threaded engine"""
+import pytest
+
+from conftest import MAX_VALUE, channel_rows, run_engine
+from vz_engine import DeletionEngine
+
+@pytest.mark.parametrize("params", [{}, {"min_value": -MAX_VALUE}, {"range_delete": False}, {"window_ms": 600 * 1000}])
+def test_async_deletes_like_sync(fake_server, params):
+    asynchronous, async_address = fake_server()
+    threaded, threaded_address = fake_server()
+    result = run_engine(async_address, async_io=True, **params)
+    expected = run_engine(threaded_address, **params)
+    assert result["status"] == "completed" and result["deleted"] > 0
+    assert (result["deleted"], result["offenders"], result["scanned"]) == (expected["deleted"], expected["offenders"], expected["scanned"])
+    assert channel_rows(asynchronous) == channel_rows(threaded)
+
+def test_unsupported_options_use_the_regular_scan(fake_server, tmp_path):
+    _, address = fake_server()
+    messages = []
+    engine = DeletionEngine(log=lambda message, level="INFO": messages.append(message))
+    result = run_engine(address, engine, async_io=True, journal=str(tmp_path / "run.journal"))
+    assert result["status"] == "completed"
+    assert "Async I/O does not support journal, using the regular scan" in messages
+    assert "Using async I/O, fetching ahead while deleting" not in messages
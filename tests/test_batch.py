@@ -0,0 +1,104 @@
+"""Batch mode: job files and round-robin scheduling across servers"""
+import json
+import threading
+import time
+
+import pytest
+
+import vz_batch
+from conftest import MAX_VALUE, ROWS, UUID, channel_rows
+from vz_batch import BatchScheduler, load_jobs
+from vz_fakeserver import DEFAULT_START
+
+DEFAULTS = {"mode": "scan", "window": 6.0, "parallel": 4, "max_rate": None, "range_delete": True, "probe": False,
+            "probe_bound": 0.0, "probe_interval": None, "shards": 1, "archive": None}
+
+def write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def test_json_jobs(tmp_path):
+    path = write(tmp_path, "jobs.json", json.dumps({"jobs": [
+        {"server": "192.168.1.100", "uuid": UUID, "from": "01.05.2025 00:00", "to": 1746144000000, "max": 30000},
+        {"server": "vz.example.com", "uuid": UUID, "from": 1746057600000, "to": 1746144000000, "min": -8000, "max": 8000,
+         "mode": "max-loop", "window": 1, "parallel": 2, "range_delete": False, "probe_interval": 10},
+    ]}))
+    first, second = load_jobs(path, DEFAULTS)
+    assert first["server"] == "192.168.1.100" and first["max_value"] == 30000.0 and first["min_value"] is None
+    assert (first["mode"], first["window_ms"], first["concurrency"], first["range_delete"]) == ("scan", 6 * 3600000, 4, True)
+    assert first["end_time"] == 1746144000000 and first["start_time"] < first["end_time"]
+    assert (second["mode"], second["window_ms"], second["concurrency"], second["range_delete"]) == ("max-loop", 3600000, 2, False)
+    assert (second["min_value"], second["probe_interval"]) == (-8000.0, 10000.0)
+
+def test_csv_jobs_use_defaults_for_empty_cells(tmp_path):
+    path = write(tmp_path, "jobs.csv", "server,uuid,from,to,max,min,range_delete,shards\n"
+                                       f"10.0.0.1,{UUID},1746057600000,1746144000000,500,,no,\n"
+                                       f"10.0.0.2,{UUID},1746057600000,1746144000000,500,-500,yes,4\n")
+    first, second = load_jobs(path, DEFAULTS)
+    assert (first["min_value"], first["range_delete"], first["shards"]) == (None, False, 1)
+    assert (second["min_value"], second["range_delete"], second["shards"]) == (-500.0, True, 4)
+
+def test_yaml_jobs(tmp_path):
+    pytest.importorskip("yaml")
+    path = write(tmp_path, "jobs.yaml", f"- server: 10.0.0.1\n  uuid: {UUID}\n  from: 1746057600000\n  to: 1746144000000\n  max: -4000\n")
+    assert load_jobs(path, DEFAULTS)[0]["max_value"] == -4000.0
+
+@pytest.mark.parametrize("job, message", [
+    ({"uuid": UUID, "from": 1, "to": 2, "max": 1}, "invalid server"),
+    ({"server": "10.0.0.1", "uuid": "nope", "from": 1, "to": 2, "max": 1}, "invalid UUID"),
+    ({"server": "10.0.0.1", "uuid": UUID, "from": 2, "to": 1, "max": 1}, "from must be before to"),
+    ({"server": "10.0.0.1", "uuid": UUID, "from": 1, "to": 2, "max": "x"}, "max must be a number"),
+    ({"server": "10.0.0.1", "uuid": UUID, "from": 1, "to": 2, "max": 1, "min": 5}, "min must be below max"),
+    ({"server": "10.0.0.1", "uuid": UUID, "from": 1, "to": 2, "max": 1, "mode": "fast"}, "mode must be"),
+])
+def test_invalid_jobs(tmp_path, job, message):
+    path = write(tmp_path, "jobs.json", json.dumps([{"server": "10.0.0.9", "uuid": UUID, "from": 1, "to": 2, "max": 1}, job]))
+    with pytest.raises(ValueError, match=f"job 2: {message}"):
+        load_jobs(path, DEFAULTS)
+
+class RecordingScheduler(BatchScheduler):
+    """Scheduler running fake jobs, recording their order and the jobs running per server"""
+
+    def __init__(self, jobs, **options):
+        super().__init__(jobs, None, lambda message, level="INFO": None, **options)
+        self.order = []
+        self.running = {}
+        self.peak = {}
+        self.lock = threading.Lock()
+
+    def run_job(self, number, params):
+        server = params["server"]
+        with self.lock:
+            self.order.append(server)
+            self.running[server] = self.running.get(server, 0) + 1
+            self.peak[server] = max(self.peak.get(server, 0), self.running[server])
+        time.sleep(0.01)
+        with self.lock:
+            self.running[server] -= 1
+        return {"status": "completed", "deleted": number}
+
+def test_round_robin_across_servers():
+    jobs = [{"server": server} for server in "aaaabbc"]
+    scheduler = RecordingScheduler(jobs, workers=1)
+    results = scheduler.run()
+    assert scheduler.order == list("abcabaa")
+    assert [result["deleted"] for result in results] == list(range(1, 8))
+
+def test_jobs_per_server_cap():
+    jobs = [{"server": server} for server in "aaaaaabbbbbc"]
+    scheduler = RecordingScheduler(jobs, workers=6, jobs_per_server=2)
+    assert len(scheduler.run()) == len(jobs)
+    assert scheduler.peak == {"a": 2, "b": 2, "c": 1}
+
+def test_batch_against_fake_servers(fake_server, tmp_path, capsys):
+    servers = [fake_server(), fake_server()]
+    job = {"uuid": UUID, "from": DEFAULT_START, "to": DEFAULT_START + ROWS * 1000, "max": MAX_VALUE}
+    path = write(tmp_path, "jobs.json", json.dumps([dict(job, server=address) for _, address in servers] * 2))
+    assert vz_batch.main([path, "--no-archive", "--json", "--quiet", "--workers", "4"]) == vz_batch.EXIT_OK
+    summary = json.loads(capsys.readouterr().out)
+    assert (summary["jobs"], summary["completed"]) == (4, 4)
+    # The second job of a channel finds nothing left
+    assert sorted(result["deleted"] for result in summary["results"])[:2] == [0, 0]
+    assert channel_rows(servers[0][0]) == channel_rows(servers[1][0])
+    assert max(value for _, value in channel_rows(servers[0][0])) < MAX_VALUE
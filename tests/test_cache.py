@@ -0,0 +1,45 @@
+"""Local cache: range bookkeeping and cached scans giving the same results as fresh ones"""
+from conftest import MAX_VALUE, channel_rows, run_engine
+from vz_cache import ChannelCache, merge_ranges
+
+def test_merge_ranges():
+    assert merge_ranges([]) == []
+    assert merge_ranges([[5, 9], [1, 3]]) == [[1, 3], [5, 9]]
+    # Overlapping and adjacent ranges are merged, contained ones vanish
+    assert merge_ranges([[1, 3], [4, 6], [10, 20], [12, 15], [5, 11]]) == [[1, 20]]
+    assert merge_ranges([[1, 3], [5, 6]]) == [[1, 3], [5, 6]]
+
+def test_missing_parts(tmp_path):
+    cache = ChannelCache(str(tmp_path), "server", "uuid")
+    cache.segments = [[10, 19, 0, 0], [30, 39, 0, 0], [40, 49, 0, 0]]
+    assert cache.missing(0, 100) == [(0, 9), (20, 29), (50, 100)]
+    assert cache.missing(12, 45) == [(20, 29)]
+    assert cache.missing(30, 49) == []
+
+def test_cached_scan_matches_fresh_scan(fake_server, tmp_path):
+    cached, cached_address = fake_server()
+    fresh, fresh_address = fake_server()
+    cache = str(tmp_path / "cache")
+    
+    first = run_engine(cached_address, cache=cache, max_value=150000.0)
+    assert first["status"] == "completed" and first["deleted"] > 0
+    assert run_engine(fresh_address, max_value=150000.0)["deleted"] == first["deleted"]
+    assert channel_rows(cached) == channel_rows(fresh)
+    
+    # The whole range is cached now, a band is checked without fetching and sees no deleted values
+    fetches = cached.stats["fetches"]
+    second = run_engine(cached_address, cache=cache, min_value=-MAX_VALUE)
+    assert cached.stats["fetches"] == fetches
+    assert second["scanned"] == first["scanned"] - first["deleted"]
+    assert second["deleted"] > 0
+    assert run_engine(fresh_address, min_value=-MAX_VALUE)["deleted"] == second["deleted"]
+    assert channel_rows(cached) == channel_rows(fresh)
+
+def test_cache_blocks_equal_server_rows(fake_server, tmp_path):
+    middleware, address = fake_server()
+    run_engine(address, cache=str(tmp_path), dry_run=True, plan_out=str(tmp_path / "plan.json"))
+    cache = ChannelCache(str(tmp_path), address, "12345678-1234-1234-1234-123456789abc")
+    cache.load()
+    rows = [row for timestamps, values in cache.blocks(0, 2 ** 62, 333) for row in zip(timestamps, values)]
+    cache.close()
+    assert rows == channel_rows(middleware)
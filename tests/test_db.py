@@ -0,0 +1,45 @@
+"""Database backend: batched deletes on a SQLite stand-in of the Volkszaehler tables"""
+import sqlite3
+
+from conftest import MAX_VALUE, UUID, run_engine
+from vz_db import DB_DELETE_BATCH, DB_MAX_PARAMETERS, VolkszaehlerDatabase, create_sqlite_database
+
+def data_rows(path):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT timestamp, value FROM data ORDER BY timestamp").fetchall()
+    finally:
+        connection.close()
+
+def test_full_batch_is_one_statement(tmp_path):
+    assert DB_DELETE_BATCH < DB_MAX_PARAMETERS
+    path = str(tmp_path / "volkszaehler.db")
+    timestamps = list(range(1000, 1000 + 4000 * 1000, 1000))
+    channel_id = create_sqlite_database(path, UUID, timestamps, [1.0] * len(timestamps))
+    database = VolkszaehlerDatabase(f"sqlite:///{path}")
+    statements = []
+    database.connection.set_trace_callback(lambda sql: statements.append(sql) if sql.startswith("DELETE") else None)
+    try:
+        assert database.delete(channel_id, timestamps[:DB_DELETE_BATCH]) == DB_DELETE_BATCH
+        assert len(statements) == 1
+        # More values than one statement binds are split, all in one transaction
+        assert database.delete(channel_id, timestamps[DB_DELETE_BATCH:DB_DELETE_BATCH + 2500]) == 2500
+        assert len(statements) == 1 + 3
+    finally:
+        database.close()
+    assert len(data_rows(path)) == 4000 - DB_DELETE_BATCH - 2500
+
+def test_engine_deletes_in_the_database(tmp_path, channel_data):
+    path = str(tmp_path / "volkszaehler.db")
+    timestamps, values = channel_data
+    values = list(values)
+    # A run longer than two batches
+    for index in range(5000, 7500):
+        values[index] = 100000.0
+    create_sqlite_database(path, UUID, timestamps, values)
+    expected = [(timestamp, value) for timestamp, value in zip(timestamps, values) if value <= MAX_VALUE]
+    result = run_engine(None, db=f"sqlite:///{path}")
+    assert result["status"] == "completed"
+    assert result["deleted"] == len(timestamps) - len(expected)
+    assert result["metrics"]["delete_requests"] == -(-result["deleted"] // DB_DELETE_BATCH)
+    assert data_rows(path) == expected
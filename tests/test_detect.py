@@ -0,0 +1,63 @@
+"""Detection: the plain threshold and the rules give the same results for any block size"""
+import array
+
+import pytest
+
+import vz_detect
+from conftest import MAX_VALUE
+from vz_detect import build_detector, iter_threshold
+
+RULES = ["spike:15:6", "stuck:5", "rate:5000"]
+
+def split_blocks(timestamps, values, size):
+    return [(timestamps[index:index + size], values[index:index + size]) for index in range(0, len(timestamps), size)]
+
+def offenders(classified):
+    """Return the (timestamp, reason) of every offender of classified blocks"""
+    found = []
+    for block in classified:
+        if block is not None:
+            timestamps, _, block_offenders = block
+            found.extend((timestamps[index], reason) for index, reason in block_offenders)
+    return found
+
+@pytest.fixture(scope="module")
+def detector_data(channel_data):
+    """The channel with a stuck stretch and a gap of ten minutes added"""
+    timestamps, values = array.array("q", channel_data[0]), array.array("d", channel_data[1])
+    values[5000:5010] = array.array("d", [123.0] * 10)
+    del timestamps[9000:9600]
+    del values[9000:9600]
+    return timestamps, values
+
+def test_threshold_numpy_and_fallback(channel_data, monkeypatch):
+    blocks = split_blocks(*channel_data, 1000)
+    found = offenders(iter_threshold(blocks, MAX_VALUE, -MAX_VALUE))
+    assert found and all(abs(channel_data[1][(timestamp - channel_data[0][0]) // 1000]) > MAX_VALUE for timestamp, _ in found)
+    monkeypatch.setattr(vz_detect, "numpy_module", False)
+    assert offenders(iter_threshold(blocks, MAX_VALUE, -MAX_VALUE)) == found
+
+def test_detector_independent_of_block_size(detector_data):
+    pytest.importorskip("numpy")
+    detector = build_detector(MAX_VALUE, RULES)
+    whole = offenders(detector.iter_classified([detector_data]))
+    assert any(reason.startswith("stuck") for _, reason in whole)
+    for size, block_rows in [(1000, 1000), (333, 4096), (4096, 1000), (70000, 2048)]:
+        blocks = split_blocks(*detector_data, size)
+        assert offenders(detector.iter_classified(blocks, block_rows)) == whole, (size, block_rows)
+
+def test_detector_hands_out_every_row_once(detector_data):
+    pytest.importorskip("numpy")
+    detector = build_detector(MAX_VALUE, RULES)
+    blocks = split_blocks(*detector_data, 777)
+    rows = [timestamp for block in detector.iter_classified(blocks, 1000) for timestamp in block[0]]
+    assert rows == list(detector_data[0])
+
+def test_detector_gap_starts_new_neighbourhood():
+    pytest.importorskip("numpy")
+    detector = build_detector(MAX_VALUE, ["stuck:5"])
+    # Three equal values on both sides of a gap are no stuck run of five
+    before = (array.array("q", range(0, 3000, 1000)), array.array("d", [7.0] * 3))
+    after = (array.array("q", range(3000, 6000, 1000)), array.array("d", [7.0] * 3))
+    assert offenders(detector.iter_classified([before, None, after])) == []
+    assert offenders(detector.iter_classified([before, after])) != []
@@ -0,0 +1,56 @@
+"""Concurrent deletes: the in-flight window of the controller and the per-server limit"""
+import threading
+
+from conftest import UUID, channel_rows
+from vz_engine import MAX_REQUESTS_PER_SERVER, DeleteDispatcher, DeletionEngine, RateController
+from vz_fakeserver import DEFAULT_START
+
+class InFlight:
+    """Delete function counting the requests in flight at the same time"""
+
+    def __init__(self):
+        self.engine = DeletionEngine()
+        self.lock = threading.Lock()
+        self.current = self.peak = 0
+
+    def __call__(self, url):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        try:
+            return self.engine.delete_data(url)
+        finally:
+            with self.lock:
+                self.current -= 1
+
+def delete_jobs(address, first, count):
+    url = f"http://{address}/data/{UUID}.json?operation=delete&ts="
+    return [(address, url + str(DEFAULT_START + 1000 * index), index) for index in range(first, first + count)]
+
+def dispatch(delete, controller, jobs):
+    results = []
+    ok = DeleteDispatcher(delete, controller).run(jobs, lambda key, ok: results.append(ok))
+    return ok, results
+
+def test_controller_window_bounds_requests(fake_server):
+    middleware, address = fake_server(latency=0.02)
+    delete = InFlight()
+    ok, results = dispatch(delete, RateController(max_concurrency=3, start_rate=1000.0), delete_jobs(address, 0, 60))
+    assert ok and results == [True] * 60
+    assert delete.peak == 3
+    assert len(channel_rows(middleware)) == 20000 - 60
+
+def test_server_limit_shared_by_dispatchers(fake_server):
+    middleware, address = fake_server(latency=0.02)
+    delete = InFlight()
+    outcomes = []
+    threads = [threading.Thread(target=lambda first=first: outcomes.append(
+                   dispatch(delete, RateController(max_concurrency=16, start_rate=1000.0), delete_jobs(address, first, 100))[0]))
+               for first in (0, 100)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert outcomes == [True, True]
+    assert delete.peak == MAX_REQUESTS_PER_SERVER
+    assert middleware.stats["deleted_rows"] == 200
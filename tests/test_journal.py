@@ -0,0 +1,60 @@
+"""Run journal: replay of the records and resuming a stopped run"""
+import json
+
+from conftest import channel_rows, run_engine
+from vz_engine import DeletionEngine
+from vz_journal import RunJournal, read_journal
+
+PARAMS = {"server": "host", "uuid": "uuid", "start_time": 0, "end_time": 100, "max_value": 10.0}
+
+def test_replay(tmp_path):
+    path = str(tmp_path / "run.journal")
+    journal = RunJournal(path, PARAMS)
+    journal.scanned(50, 48, 49, [[[10, 11.0, "> 10.0"]], [[20, 12.0, "> 10.0"], [21, 13.0, "> 10.0"]]], [[48, 14.0, "> 10.0"]])
+    journal.scanned(100, 99, 99, [[[48, 14.0, "> 10.0"], [49, 15.0, "> 10.0"]]], None)
+    journal.planned()
+    journal.deleted(20, 21)
+    journal.deleted(48, 48)
+    journal.close()
+    # A torn record of a crash is ignored
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"type": "deleted", "fr')
+    
+    state = read_journal(path)
+    assert state.matches(PARAMS) and not state.matches(dict(PARAMS, max_value=11.0))
+    assert (state.scanned_to, state.last_timestamp, state.scanned, state.planned) == (100, 99, 99, True)
+    assert state.open_run is None and state.status is None
+    assert state.remaining_runs(state.runs) == [[(10, 11.0, "> 10.0")], [(49, 15.0, "> 10.0")]]
+
+def test_open_run_becomes_a_run_when_planned(tmp_path):
+    path = str(tmp_path / "run.journal")
+    journal = RunJournal(path, PARAMS)
+    journal.scanned(100, 99, 99, [], [[99, 11.0, "> 10.0"]])
+    journal.planned()
+    journal.end("completed")
+    state = read_journal(path)
+    assert state.runs == [[(99, 11.0, "> 10.0")]] and state.status == "completed"
+
+def test_resume_stopped_run(fake_server, tmp_path):
+    stopped, stopped_address = fake_server()
+    complete, complete_address = fake_server()
+    path = str(tmp_path / "run.journal")
+    
+    # Stop after the first confirmed delete
+    engine = DeletionEngine(log=lambda message, level="INFO": engine.stop() if level == "SUCCESS" else None)
+    first = run_engine(stopped_address, engine, journal=path)
+    assert first["status"] == "stopped"
+    with open(path, encoding="utf-8") as f:
+        assert json.loads(f.readlines()[-1]) == {"type": "end", "status": "stopped"}
+    
+    resumed = run_engine(stopped_address, journal=path, resume=True)
+    assert resumed["status"] == "completed"
+    # The count of a resumed run includes the values deleted before the stop
+    assert 0 < first["deleted"] < resumed["deleted"] == run_engine(complete_address)["deleted"]
+    assert channel_rows(stopped) == channel_rows(complete)
+
+def test_resume_refuses_other_params(fake_server, tmp_path):
+    _, address = fake_server()
+    path = str(tmp_path / "run.journal")
+    RunJournal(path, dict(PARAMS, server=address)).close()
+    assert run_engine(address, journal=path, resume=True)["status"] == "failed"
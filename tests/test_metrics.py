@@ -0,0 +1,73 @@
+"""Run metrics: counters, latency percentiles, Prometheus text and the metrics port"""
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import run_engine
+from vz_metrics import COUNTERS, PERCENTILES, RunMetrics, percentile, serve_metrics
+
+def test_percentile_is_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile([], 50) is None
+    assert percentile([0.5], 99) == 0.5
+    assert [percentile(values, percent) for percent in PERCENTILES] == [50.0, 95.0, 99.0]
+
+def test_counters_and_deletes_add_up():
+    metrics = RunMetrics()
+    metrics.add(fetch_requests=2, bytes_fetched=300)
+    metrics.add(bytes_fetched=200, tuples_parsed=10)
+    metrics.count_retry(None, None)
+    for latency in (0.1, 0.2, 0.3, 0.4):
+        metrics.record_delete(latency, True, wait=0.05)
+    metrics.record_delete(1.0, False)
+    summary = metrics.summary()
+    assert set(COUNTERS) <= set(summary)
+    assert (summary["fetch_requests"], summary["bytes_fetched"], summary["tuples_parsed"], summary["retries"]) == (2, 500, 10, 1)
+    assert (summary["delete_requests"], summary["delete_failures"]) == (5, 1)
+    assert summary["delete_seconds"] == pytest.approx(2.0)
+    assert summary["wait_seconds"] == pytest.approx(0.2)
+    assert (summary["delete_latency_p50"], summary["delete_latency_p95"], summary["delete_latency_p99"]) == (0.3, 1.0, 1.0)
+    assert "Deletes: 5" in metrics.describe()
+
+def test_prometheus_text():
+    metrics = RunMetrics()
+    lines = metrics.prometheus().splitlines()
+    assert 'vz_delete_latency_seconds{quantile="0.5"} NaN' in lines
+    metrics.record_delete(0.25, True)
+    lines = metrics.prometheus().splitlines()
+    for name in COUNTERS:
+        assert f"# TYPE vz_delete_{name}_total counter" in lines
+    assert "vz_delete_delete_requests_total 1" in lines
+    assert 'vz_delete_latency_seconds{quantile="0.99"} 0.25' in lines
+    assert "vz_delete_latency_seconds_count 1" in lines
+    assert "vz_delete_latency_seconds_sum 0.25" in lines
+
+def test_serve_metrics():
+    metrics = RunMetrics()
+    metrics.add(fetch_requests=3)
+    server = serve_metrics(lambda: metrics, 0)
+    port = server.server_address[1]
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            text = response.read().decode("utf-8")
+        assert "vz_delete_fetch_requests_total 3" in text.splitlines()
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other")
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_engine_metrics_match_the_server(fake_server):
+    middleware, address = fake_server()
+    result = run_engine(address, range_delete=False)
+    metrics = result["metrics"]
+    # The value on a window border comes with both windows
+    assert result["scanned"] <= metrics["tuples_parsed"] <= result["scanned"] + 5
+    assert metrics["fetch_requests"] == middleware.stats["fetches"]
+    assert metrics["delete_requests"] == middleware.stats["deletes"] == result["deleted"]
+    assert metrics["delete_failures"] == 0
+    assert metrics["bytes_fetched"] == result["fetched_bytes"] > 0
+    assert metrics["delete_latency_p50"] <= metrics["delete_latency_p99"]
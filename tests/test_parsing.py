@@ -0,0 +1,56 @@
+"""Tuple parsing of middleware responses: decode_block and iter_json_blocks"""
+import urllib.request
+
+import pytest
+
+import vz_detect
+from conftest import UUID, channel_rows
+from vz_engine import decode_block, iter_json_blocks
+from vz_fakeserver import DEFAULT_START
+
+RESPONSE = ('{"version":"0.3","data":{"uuid":"%s","from":1,"to":6,"min":[4,-2250,1],"max":[2,1.5e5,1],'
+            '"tuples":[[1,1.5,1],[2,1.5e5,1],[3,null,1],[4,-2250,1],[5,0.125,1],[6,300,1]],"rows":6}}' % UUID)
+EXPECTED = [(1, 1.5), (2, 150000.0), (4, -2250.0), (5, 0.125), (6, 300.0)]
+
+@pytest.fixture(params=["numpy", "fallback"])
+def numpy_mode(request, monkeypatch):
+    """Run the test with NumPy (if installed) and with the pure Python fallback"""
+    if request.param == "numpy":
+        if vz_detect.load_numpy() is None:
+            pytest.skip("NumPy not installed")
+    else:
+        monkeypatch.setattr(vz_detect, "numpy_module", False)
+    return request.param
+
+def parsed(chunks):
+    return [row for timestamps, values in iter_json_blocks(chunks) for row in zip(timestamps, values)]
+
+def test_decode_block(numpy_mode):
+    timestamps, values = decode_block("[1,1.5,1],[2,2e3,1], [3,-4.25,1],")
+    assert timestamps.typecode == "q" and values.typecode == "d"
+    assert list(zip(timestamps, values)) == [(1, 1.5), (2, 2000.0), (3, -4.25)]
+
+def test_decode_block_skips_null_values(numpy_mode):
+    timestamps, values = decode_block("[1,null,1],[2,7,1]")
+    assert list(zip(timestamps, values)) == [(2, 7.0)]
+
+def test_decode_block_without_items(numpy_mode):
+    assert [list(column) for column in decode_block(" ,")] == [[], []]
+
+def test_every_chunk_boundary(numpy_mode):
+    for split in range(1, len(RESPONSE)):
+        assert parsed([RESPONSE[:split], RESPONSE[split:]]) == EXPECTED, split
+
+def test_single_character_chunks(numpy_mode):
+    assert parsed(list(RESPONSE)) == EXPECTED
+
+def test_empty_tuples():
+    assert parsed(['{"data":{"tuples":[],"rows":0}}']) == []
+
+def test_fake_server_response(fake_server, numpy_mode):
+    middleware, address = fake_server()
+    url = f"http://{address}/data/{UUID}.json?from={DEFAULT_START}&to={DEFAULT_START + 3000 * 1000}"
+    with urllib.request.urlopen(url) as response:
+        text = response.read().decode("utf-8")
+    chunks = [text[index:index + 997] for index in range(0, len(text), 997)]
+    assert parsed(chunks) == channel_rows(middleware)[:3001]
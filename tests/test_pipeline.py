@@ -0,0 +1,42 @@
+"""Pipeline: fetching, detection and deletes overlap and delete what the plain scan deletes"""
+import pytest
+
+import vz_engine
+from conftest import channel_rows, run_engine
+from vz_engine import DeletionEngine
+
+def logged_run(address, **params):
+    messages = []
+    engine = DeletionEngine(log=lambda message, level="INFO": messages.append(message))
+    return run_engine(address, engine, **params), messages
+
+@pytest.mark.parametrize("params", [{}, {"range_delete": False}])
+def test_pipeline_deletes_like_plain_scan(fake_server, params):
+    piped, piped_address = fake_server()
+    plain, plain_address = fake_server()
+    result, _ = logged_run(piped_address, **params)
+    expected, _ = logged_run(plain_address, pipeline=False, **params)
+    assert result["status"] == expected["status"] == "completed"
+    assert (result["deleted"], result["runs"], result["scanned"]) == (expected["deleted"], expected["runs"], expected["scanned"])
+    assert channel_rows(piped) == channel_rows(plain)
+
+def test_deletes_start_during_the_scan(fake_server):
+    _, piped_address = fake_server(latency=0.01)
+    _, plain_address = fake_server(latency=0.01)
+
+    def first_delete_before_scan_end(messages):
+        first_delete = next(index for index, message in enumerate(messages) if message.startswith("Successfully deleted"))
+        scan_end = next(index for index, message in enumerate(messages) if message.startswith("Scanned "))
+        return first_delete < scan_end
+
+    assert first_delete_before_scan_end(logged_run(piped_address, window_ms=600 * 1000)[1])
+    assert not first_delete_before_scan_end(logged_run(plain_address, window_ms=600 * 1000, pipeline=False)[1])
+
+def test_full_run_queue_blocks_the_scan(fake_server, monkeypatch):
+    # With room for two runs the scan waits for the deleter most of the time
+    monkeypatch.setattr(vz_engine, "PIPELINE_RUNS", 2)
+    piped, piped_address = fake_server(latency=0.005)
+    plain, plain_address = fake_server()
+    result, _ = logged_run(piped_address, range_delete=False)
+    assert result["deleted"] == run_engine(plain_address, range_delete=False)["deleted"]
+    assert channel_rows(piped) == channel_rows(plain)
@@ -0,0 +1,48 @@
+"""Delete plans: dry runs leave the data alone, plans round trip and execute like a regular run"""
+import gzip
+import json
+
+import pytest
+
+from conftest import channel_rows, run_engine
+from vz_plan import read_plan, write_plan
+
+PARAMS = {"server": "host", "uuid": "uuid", "start_time": 0, "end_time": 100, "max_value": 10.0, "min_value": -10.0}
+RUNS = [[(5, 11.0, "> 10.0")], [(20, 12.0, "> 10.0"), (21, -13.0, "< -10.0")]]
+
+@pytest.mark.parametrize("name", ["plan.json", "plan.json.gz"])
+def test_round_trip(tmp_path, name):
+    path = str(tmp_path / name)
+    summary = write_plan(path, PARAMS, RUNS, 100)
+    assert summary["offenders"] == 3 and summary["runs"] == 2 and summary["longest_run"] == 2
+    assert (summary["first"], summary["last"], summary["min_value"], summary["max_value"]) == (5, 21, -13.0, 12.0)
+    assert summary["reasons"] == {"> 10.0": 2, "< -10.0": 1}
+    params, runs, read_summary = read_plan(path)
+    assert params == PARAMS and runs == RUNS and read_summary == summary
+    if name.endswith(".gz"):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            assert json.load(f)["version"] == 1
+
+def test_unknown_version(tmp_path):
+    path = tmp_path / "plan.json"
+    path.write_text(json.dumps({"version": 99, "runs": []}), encoding="utf-8")
+    with pytest.raises(ValueError, match="unsupported plan version"):
+        read_plan(str(path))
+
+def test_dry_run_then_execute(fake_server, channel_data, tmp_path):
+    planned, planned_address = fake_server()
+    scanned, scanned_address = fake_server()
+    path = str(tmp_path / "plan.json.gz")
+    
+    dry = run_engine(planned_address, dry_run=True, plan_out=path)
+    assert dry["status"] == "completed" and dry["deleted"] == 0
+    assert planned.stats["deletes"] == 0 and channel_rows(planned) == list(zip(*channel_data))
+    params, runs, summary = read_plan(path)
+    assert params["server"] == planned_address and summary["offenders"] == dry["offenders"]
+    
+    fetches = planned.stats["fetches"]
+    executed = run_engine(planned_address, plan_in=path)
+    assert executed["status"] == "completed" and executed["deleted"] == dry["offenders"]
+    assert planned.stats["fetches"] == fetches
+    assert run_engine(scanned_address)["deleted"] == executed["deleted"]
+    assert channel_rows(planned) == channel_rows(scanned)
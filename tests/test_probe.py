@@ -0,0 +1,28 @@
+"""Probe: packed averages narrow the scan down without missing values"""
+from conftest import channel_rows, run_engine
+from vz_engine import DeletionEngine
+from vz_fakeserver import DEFAULT_START, generate_data
+
+# Larger than one probe response of raw values, with few spikes
+PROBE_ROWS = 200000
+
+def test_probe_finds_what_a_full_scan_finds(fake_server):
+    data = generate_data(PROBE_ROWS, spike_rate=0.0002)
+    probed, probed_address = fake_server(data)
+    scanned, scanned_address = fake_server(data)
+    
+    end_time = DEFAULT_START + PROBE_ROWS * 1000
+    probe = run_engine(probed_address, probe=True, probe_interval=1000, end_time=end_time, window_ms=86400 * 1000)
+    full = run_engine(scanned_address, end_time=end_time, window_ms=86400 * 1000)
+    assert probe["status"] == full["status"] == "completed"
+    assert probe["deleted"] == full["deleted"] > 0
+    assert probe["scanned"] < full["scanned"] / 10
+    assert channel_rows(probed) == channel_rows(scanned)
+
+def test_probe_needs_the_interval(fake_server):
+    middleware, address = fake_server()
+    messages = []
+    engine = DeletionEngine(log=lambda message, level="INFO": messages.append((level, message)))
+    result = run_engine(address, engine, probe=True)
+    assert any(level == "WARNING" and message.startswith("Probe skipped") for level, message in messages)
+    assert result["scanned"] == len(channel_rows(middleware)) + result["deleted"]
@@ -0,0 +1,24 @@
+"""Range deletes: consecutive offenders go in one request, refused ranges fall back to single deletes"""
+from conftest import channel_rows, run_engine
+from vz_engine import DeletionEngine
+
+def test_range_deletes(fake_server):
+    ranged, ranged_address = fake_server()
+    single, single_address = fake_server()
+    result = run_engine(ranged_address)
+    assert result["runs"] < result["deleted"]
+    assert ranged.stats["deletes"] == result["runs"]
+    assert run_engine(single_address, range_delete=False)["deleted"] == result["deleted"]
+    assert single.stats["deletes"] == result["deleted"]
+    assert channel_rows(ranged) == channel_rows(single)
+
+def test_refused_range_deletes(fake_server):
+    refusing, refusing_address = fake_server(range_delete=False)
+    ranged, ranged_address = fake_server()
+    messages = []
+    engine = DeletionEngine(log=lambda message, level="INFO": messages.append(message))
+    result = run_engine(refusing_address, engine)
+    assert result["status"] == "completed"
+    assert "Range delete refused, falling back to single deletes" in messages
+    assert result["deleted"] == run_engine(ranged_address)["deleted"]
+    assert channel_rows(refusing) == channel_rows(ranged)
@@ -0,0 +1,48 @@
+"""Rate control: slow servers are not mistaken for congested ones, the rate recovers after a cut"""
+import time
+
+import vz_engine
+from conftest import channel_rows, run_engine
+from vz_engine import RateController
+from vz_fakeserver import DEFAULT_START
+
+def test_constant_slow_latency_is_no_congestion():
+    controller = RateController(max_concurrency=4)
+    for _ in range(20):
+        controller.record(0.6, True)
+    assert controller.slow_start and controller.rate > 10 and controller.concurrency == 4
+
+def test_rate_climbs_back_after_a_cut():
+    controller = RateController(max_concurrency=4, start_rate=8.0)
+    controller.record(0.6, True)
+    controller.record(0.6, False)
+    cut = controller.rate
+    assert cut < 9.0 and not controller.slow_start
+    for _ in range(50):
+        controller.record(0.6, True)
+    assert controller.rate > 2 * cut
+
+def test_slow_answers_cut_the_rate():
+    controller = RateController(max_concurrency=4, start_rate=8.0)
+    for _ in range(5):
+        controller.record(0.2, True)
+    rate = controller.rate
+    controller.record(1.5, True)
+    assert controller.rate == rate / 2
+
+def test_fixed_target_latency():
+    controller = RateController(target_latency=0.5, start_rate=8.0)
+    controller.record(0.6, True)
+    assert controller.rate == 4.0
+
+def test_slow_server(fake_server, monkeypatch):
+    # The real slow start, not the fast one of the other tests
+    monkeypatch.setattr(vz_engine, "RateController", RateController)
+    middleware, address = fake_server(latency=0.6, range_delete=False)
+    started = time.monotonic()
+    result = run_engine(address, end_time=DEFAULT_START + 7000 * 1000, range_delete=False)
+    elapsed = time.monotonic() - started
+    assert result["status"] == "completed" and result["deleted"] == 19
+    assert max(value for _, value in channel_rows(middleware)[:7001]) < 5000
+    # The old fixed delay of one second per delete needed about 30 s here
+    assert elapsed < 10
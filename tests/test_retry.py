@@ -0,0 +1,60 @@
+"""Retries: failed fetches and deletes are repeated with backoff, sent POST requests are not"""
+import asyncio
+
+from conftest import UUID, channel_rows, run_engine
+from vz_async import AsyncMiddlewareClient
+from vz_engine import DeletionEngine, MiddlewareClient
+from vz_fakeserver import DEFAULT_START
+
+def test_backoff_delay():
+    client = MiddlewareClient(backoff=0.5)
+    for attempt in range(5):
+        delays = [client.backoff_delay(attempt) for _ in range(50)]
+        assert all(0 <= delay <= 0.5 * 2 ** attempt for delay in delays)
+        assert len(set(delays)) > 1
+    assert AsyncMiddlewareClient.backoff_delay is MiddlewareClient.backoff_delay
+
+def check_failing_server(fake_server, **params):
+    flaky, flaky_address = fake_server(fail_rate=0.3)
+    healthy, healthy_address = fake_server()
+    # Ten retries: a request failing eleven times in a row is about 2e-6 likely
+    engine = DeletionEngine(client=MiddlewareClient(retries=10, backoff=0.001))
+    result = run_engine(flaky_address, engine, **params)
+    assert result["status"] == "completed"
+    assert flaky.stats["failures"] > 0 and result["metrics"]["retries"] == flaky.stats["failures"]
+    assert result["deleted"] == run_engine(healthy_address, **params)["deleted"]
+    assert channel_rows(flaky) == channel_rows(healthy)
+
+def test_retries_sync(fake_server):
+    check_failing_server(fake_server)
+
+def test_retries_async(fake_server):
+    check_failing_server(fake_server, async_io=True)
+
+def test_get_retried_until_given_up(fake_server):
+    middleware, address = fake_server(fail_rate=1.0)
+    retries = []
+    client = MiddlewareClient(retries=3, backoff=0.001)
+    response = client.get(f"http://{address}/data/{UUID}.json?operation=delete&ts={DEFAULT_START}", on_retry=lambda: retries.append(1))
+    assert response.status_code == 503
+    assert middleware.stats["requests"] == 4 and len(retries) == 3
+
+def test_async_get_retried_until_given_up(fake_server):
+    middleware, address = fake_server(fail_rate=1.0)
+    
+    async def get():
+        client = AsyncMiddlewareClient(retries=3, backoff=0.001)
+        try:
+            return await client.get(f"http://{address}/data/{UUID}.json?operation=delete&ts={DEFAULT_START}")
+        finally:
+            await client.close()
+    
+    assert asyncio.run(get()).status_code == 503
+    assert middleware.stats["requests"] == 4
+
+def test_sent_post_not_retried(fake_server):
+    middleware, address = fake_server(fail_rate=1.0)
+    client = MiddlewareClient(retries=3, backoff=0.001)
+    response = client.post(f"http://{address}/data/{UUID}.json", [[DEFAULT_START - 1000, 1.0]])
+    assert response.status_code == 503
+    assert middleware.stats["requests"] == 1
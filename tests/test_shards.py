@@ -0,0 +1,38 @@
+"""Sharded scans: runs across shard borders are joined and match the scan in one piece"""
+import pytest
+
+from conftest import ROWS, channel_rows, run_engine
+from vz_engine import DeletionEngine
+from vz_fakeserver import generate_data
+
+SHARDS = 8
+
+@pytest.fixture(scope="module")
+def border_data():
+    """The synthetic channel with spikes and a stuck meter right at the shard borders"""
+    timestamps, values = generate_data(ROWS, spike_rate=0.002)
+    borders = [ROWS * index // SHARDS for index in range(1, SHARDS)]
+    # A run across the border, a run ending on it, a single spike right behind it
+    for index in range(borders[0] - 2, borders[0] + 3):
+        values[index] = 100000.0
+    for index in range(borders[1] - 3, borders[1] + 1):
+        values[index] = 100000.0
+    values[borders[2] + 1] = 100000.0
+    # Identical values around the border, each shard on its own sees too few of them
+    for index in range(borders[3] - 3, borders[3] + 3):
+        values[index] = 123.0
+    return timestamps, values
+
+@pytest.mark.parametrize("rules", [None, ["band:-1000:5000"], ["stuck:5"], ["rate:1000"]])
+def test_sharded_scan_matches_one_piece(fake_server, border_data, rules):
+    sharded, sharded_address = fake_server(border_data)
+    whole, whole_address = fake_server(border_data)
+    messages = []
+    engine = DeletionEngine(log=lambda message, level="INFO": messages.append(message))
+    result = run_engine(sharded_address, engine, shards=SHARDS, rules=rules)
+    expected = run_engine(whole_address, rules=rules)
+    assert result["status"] == expected["status"] == "completed"
+    assert (result["deleted"], result["runs"], result["scanned"]) == (expected["deleted"], expected["runs"], expected["scanned"])
+    assert channel_rows(sharded) == channel_rows(whole)
+    sharded_scan = f"Scanning in {SHARDS} shards at the same time" in messages
+    assert sharded_scan == (rules is None or rules[0].startswith("band"))
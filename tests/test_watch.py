@@ -0,0 +1,54 @@
+"""Watch mode: only values newer than the high-water mark are checked, the mark survives a restart"""
+import time
+
+import pytest
+
+from conftest import MAX_VALUE, ROWS, UUID, channel_rows
+from vz_engine import DeletionEngine
+from vz_fakeserver import generate_data
+from vz_watch import HighWaterMark, Watcher
+
+@pytest.fixture(scope="module")
+def recent_data():
+    """The synthetic channel ending a minute ago, the watcher checks up to now"""
+    return generate_data(ROWS, start=(int(time.time()) - ROWS - 60) * 1000, spike_rate=0.002)
+
+def watch_once(address, directory, start_time, lookback_ms=0):
+    watcher = Watcher(DeletionEngine(), directory, interval=0, lookback_ms=lookback_ms, max_cycles=1)
+    return watcher.run({
+        "server": address,
+        "uuid": UUID,
+        "start_time": start_time,
+        "max_value": MAX_VALUE,
+        "window_ms": 3600 * 1000,
+        "concurrency": 4,
+    })
+
+def test_only_new_values_are_checked_after_a_restart(fake_server, recent_data, tmp_path):
+    middleware, address = fake_server(recent_data)
+    timestamps, values = recent_data
+    first, last = timestamps[0], timestamps[-1]
+    summary = watch_once(address, tmp_path, first)
+    assert (summary["status"], summary["cycles"], summary["scanned"]) == ("completed", 1, ROWS)
+    assert summary["deleted"] == sum(1 for value in values if value > MAX_VALUE)
+    assert summary["high_water"] == last
+    assert HighWaterMark(tmp_path, address, UUID).load() == last
+    
+    # New values arrive behind the mark, a late spike before it is not looked at again
+    channel = middleware.channel(UUID)
+    channel.add([(last + 1000, 100000.0), (last + 2000, 300.0), (last + 3000, 100000.0)])
+    channel.add([(first + 500, 100000.0)])
+    summary = watch_once(address, tmp_path, first)
+    assert (summary["scanned"], summary["deleted"], summary["high_water"]) == (3, 2, last + 3000)
+    assert HighWaterMark(tmp_path, address, UUID).load() == last + 3000
+    assert (first + 500, 100000.0) in channel_rows(middleware)
+
+def test_lookback_checks_older_values_again(fake_server, recent_data, tmp_path):
+    middleware, address = fake_server(recent_data)
+    timestamps = recent_data[0]
+    last = timestamps[-1]
+    watch_once(address, tmp_path, timestamps[0])
+    middleware.channel(UUID).add([(last - 1500, 100000.0)])
+    summary = watch_once(address, tmp_path, timestamps[0], lookback_ms=2000)
+    assert (summary["scanned"], summary["deleted"], summary["high_water"]) == (3, 1, last)
+    assert (last - 1500, 100000.0) not in channel_rows(middleware)
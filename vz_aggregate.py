@@ -0,0 +1,99 @@
+"""
+Incremental re-aggregation of the Volkszaehler Data Deletion Tool.
+The middleware keeps pre-aggregated values per hour, day, ... in the aggregate table.
+Deleting raw values leaves them stale, rebuilding them for a whole channel takes
+hours. The buckets touched by the deletes of a run are tracked here and only those
+are recomputed from the remaining raw values afterwards (direct database backend).
+
+Levels are given as NAME=TYPE pairs, TYPE being the value of aggregate.type the
+middleware uses for the level, e.g. "hour=3,day=4,month=6". Only the levels that
+already have rows for the channel are recomputed. Buckets follow local time, like
+the middleware's aggregation on a database server in the same time zone.
+"""
+from datetime import datetime, timedelta
+
+# Aggregation levels of the middleware and their aggregate.type ids
+DEFAULT_AGGREGATE_TYPES = {"minute": 2, "hour": 3, "day": 4, "week": 5, "month": 6, "year": 7}
+
+# Buckets recomputed per transaction
+AGGREGATE_BATCH = 100
+
+def parse_aggregate_types(text):
+    """Parse NAME=TYPE pairs like "hour=3,day=4", raises ValueError for unknown levels or types"""
+    types = {}
+    for pair in text.split(","):
+        if not pair.strip():
+            continue
+        name, _, type_id = pair.partition("=")
+        name = name.strip().lower()
+        if name not in DEFAULT_AGGREGATE_TYPES:
+            raise ValueError(f"unknown aggregation level '{name}', choose from {', '.join(DEFAULT_AGGREGATE_TYPES)}")
+        try:
+            types[name] = int(type_id)
+        except ValueError:
+            raise ValueError(f"aggregation level '{name}' needs a numeric type, e.g. {name}={DEFAULT_AGGREGATE_TYPES[name]}")
+    if not types:
+        raise ValueError("no aggregation levels given")
+    return types
+
+def bucket_start(level, moment):
+    """Return the local datetime the bucket of the level containing moment starts at"""
+    if level == "minute":
+        return moment.replace(second=0, microsecond=0)
+    if level == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if level == "day":
+        return day
+    if level == "week":
+        return day - timedelta(days=day.weekday())
+    if level == "month":
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+def bucket_end(level, start):
+    """Return the local datetime the bucket starting at start ends at"""
+    if level == "minute":
+        return start + timedelta(minutes=1)
+    if level == "hour":
+        return start + timedelta(hours=1)
+    if level == "day":
+        return start + timedelta(days=1)
+    if level == "week":
+        return start + timedelta(days=7)
+    if level == "month":
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return start.replace(year=start.year + 1)
+
+def bucket_bounds(level, timestamp):
+    """Return (start, end) in ms of the bucket of the level containing the timestamp, end exclusive"""
+    start = bucket_start(level, datetime.fromtimestamp(timestamp / 1000))
+    return int(start.timestamp() * 1000), int(bucket_end(level, start).timestamp() * 1000)
+
+class AggregateTracker:
+    """Buckets of every level touched by the deletes of one run"""
+
+    def __init__(self, levels=DEFAULT_AGGREGATE_TYPES):
+        self.levels = list(levels)
+        self.buckets = {level: set() for level in self.levels}
+        # Last bucket per level, deletes come mostly in time order
+        self.current = {level: (0, 0) for level in self.levels}
+
+    def add(self, timestamps):
+        """Record the buckets of deleted timestamps"""
+        for timestamp in timestamps:
+            for level in self.levels:
+                start, end = self.current[level]
+                if not start <= timestamp < end:
+                    self.current[level] = bounds = bucket_bounds(level, timestamp)
+                    self.buckets[level].add(bounds)
+
+    def count(self):
+        """Number of buckets touched over all levels"""
+        return sum(len(buckets) for buckets in self.buckets.values())
+
+    def iter_batches(self, level, size=AGGREGATE_BATCH):
+        """Yield the buckets of one level in time order, size at a time"""
+        buckets = sorted(self.buckets[level])
+        for index in range(0, len(buckets), size):
+            yield buckets[index:index + size]
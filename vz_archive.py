@@ -0,0 +1,174 @@
+"""
+Archive of deleted values of the Volkszaehler Data Deletion Tool.
+Every value is appended to the archive of its channel before its delete is sent,
+so a mistake can be undone with a restore (vz_cli.py --restore).
+
+One file per channel: <archive dir>/<uuid>.vza, a series of gzip members, each
+holding the records of one batch of deletes:
+    header   4 bytes kind (b"ADD1" values archived before deleting them,
+             b"DEL1" values not deleted after all or restored again), 4 bytes count
+    body     count int64 timestamps, then (ADD1 only) count float64 values, little endian
+Records are collected and written as one member with one sync before the deletes of
+the batch are sent. Members are only appended. A member cut off by a crash is ignored,
+none of its deletes were sent.
+"""
+import array
+import gzip
+import os
+import struct
+import sys
+import threading
+import zlib
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.expanduser("~"), ".vz_delete_tool", "archive")
+
+ARCHIVE_ADD = b"ADD1"
+ARCHIVE_CANCEL = b"DEL1"
+HEADER = struct.Struct("<4sI")
+
+# Values per restore request or insert transaction
+RESTORE_BATCH = 1000
+
+# Values of queued runs archived together with one sync before their deletes
+ARCHIVE_BATCH = 1000
+
+# Bytes read at a time when reading an archive
+READ_SIZE = 1 << 16
+
+def little_endian(items):
+    """Return the array in little endian byte order"""
+    if sys.byteorder != "little":
+        items = array.array(items.typecode, items)
+        items.byteswap()
+    return items
+
+class DeleteArchive:
+    """Append-only archive of the values deleted from one channel, safe to call from the dispatcher threads"""
+
+    def __init__(self, directory, uuid_value):
+        self.path = os.path.join(directory, f"{uuid_value}.vza")
+        self.lock = threading.Lock()
+        self.file = None
+        # Records not written yet
+        self.pending = []
+
+    def record(self, kind, timestamps, values=None):
+        """Queue one record for the next sync"""
+        data = HEADER.pack(kind, len(timestamps)) + little_endian(array.array("q", timestamps)).tobytes()
+        if values is not None:
+            data += little_endian(array.array("d", values)).tobytes()
+        with self.lock:
+            self.pending.append(data)
+
+    def add(self, entries):
+        """Queue (timestamp, value, ...) entries, they may be deleted once sync returned"""
+        entries = list(entries)
+        if entries:
+            self.record(ARCHIVE_ADD, [entry[0] for entry in entries], [entry[1] for entry in entries])
+
+    def cancel(self, timestamps):
+        """Mark archived values as present again (delete failed or value restored), written with the next sync"""
+        timestamps = list(timestamps)
+        if timestamps:
+            self.record(ARCHIVE_CANCEL, timestamps)
+
+    def sync(self):
+        """Append the queued records as one gzip member and force it to disk, nothing to do without records"""
+        with self.lock:
+            if not self.pending:
+                return
+            data = gzip.compress(b"".join(self.pending), compresslevel=6)
+            if self.file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self.file = open(self.path, "ab")
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = []
+
+    def close(self):
+        """Write the queued records and close the archive file"""
+        try:
+            self.sync()
+        finally:
+            with self.lock:
+                if self.file is not None:
+                    self.file.close()
+                    self.file = None
+
+    def iter_members(self):
+        """Yield the data of every complete gzip member, stops at a member cut off or torn by a crash"""
+        with open(self.path, "rb") as f:
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            parts = []
+            chunk = f.read(READ_SIZE)
+            while chunk:
+                try:
+                    parts.append(decompressor.decompress(chunk))
+                except zlib.error:
+                    # Torn header or body, none of the deletes of this member were sent
+                    return
+                if decompressor.eof:
+                    yield b"".join(parts)
+                    parts = []
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                    if chunk:
+                        continue
+                chunk = f.read(READ_SIZE)
+
+    def iter_records(self):
+        """Yield (kind, timestamps, values) for every record, values is None for cancel records"""
+        for data in self.iter_members():
+            position = 0
+            while position < len(data):
+                if len(data) - position < HEADER.size:
+                    raise ValueError("archive member ends in the middle of a record")
+                kind, count = HEADER.unpack_from(data, position)
+                if kind not in (ARCHIVE_ADD, ARCHIVE_CANCEL):
+                    raise ValueError(f"unknown archive record {kind!r}")
+                position += HEADER.size
+                size = 8 * count
+                if len(data) - position < (2 * size if kind == ARCHIVE_ADD else size):
+                    raise ValueError("archive member ends in the middle of a record")
+                timestamps = array.array("q", data[position:position + size])
+                position += size
+                values = None
+                if kind == ARCHIVE_ADD:
+                    values = array.array("d", data[position:position + size])
+                    position += size
+                if sys.byteorder != "little":
+                    timestamps.byteswap()
+                    if values is not None:
+                        values.byteswap()
+                yield kind, timestamps, values
+
+    def load(self, start_time=None, end_time=None):
+        """
+        Return the (timestamps, values) arrays of the archived values still deleted, in time
+        order, optionally only those from start_time to end_time. A value archived again
+        after a cancel counts, the last archived value of a timestamp wins.
+        """
+        timestamps, values, sequence = array.array("q"), array.array("d"), array.array("q")
+        # Cancelled timestamps with the record number of their last cancel
+        cancelled = {}
+        if not os.path.exists(self.path):
+            return timestamps, values
+        for number, (kind, record_timestamps, record_values) in enumerate(self.iter_records()):
+            if kind == ARCHIVE_CANCEL:
+                cancelled.update(dict.fromkeys(record_timestamps, number))
+                continue
+            for timestamp, value in zip(record_timestamps, record_values):
+                if (start_time is None or timestamp >= start_time) and (end_time is None or timestamp <= end_time):
+                    timestamps.append(timestamp)
+                    values.append(value)
+                    sequence.append(number)
+
+        latest = {}
+        for index, timestamp in enumerate(timestamps):
+            if cancelled.get(timestamp, -1) < sequence[index]:
+                latest[timestamp] = index
+            else:
+                latest.pop(timestamp, None)
+        order = sorted(latest.values(), key=timestamps.__getitem__)
+        return array.array("q", (timestamps[index] for index in order)), array.array("d", (values[index] for index in order))
@@ -0,0 +1,143 @@
+"""
+Asyncio HTTP/1.1 client for the middleware, built on asyncio streams only.
+Keeps a pool of keep-alive connections per server, so many fetches and deletes
+can wait on the network at the same time from one thread. Meant for remote
+middleware where the round trip, not the server, limits the throughput.
+"""
+import asyncio
+import json
+import ssl
+from urllib.parse import urlsplit
+from vz_engine import MiddlewareClient, DEFAULT_TIMEOUT, MAX_REQUESTS_PER_SERVER, RETRY_STATUS_CODES
+
+class AsyncResponse:
+    """Status code and body of a finished request"""
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+class AsyncMiddlewareClient:
+    """
+    Connection-pooled asyncio client with the same retry policy as MiddlewareClient:
+    connection errors, timeouts and retryable HTTP codes are retried with jittered
+    exponential backoff. It only sends GET requests, fetches and deletes, which are safe
+    to repeat. Restores POST through MiddlewareClient, which does not repeat them.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=3, backoff=0.5, pool_size=MAX_REQUESTS_PER_SERVER, log=None, on_retry=None):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.log = log or (lambda message, level="INFO": None)
+        self.on_retry = on_retry or (lambda: None)
+        self.idle = {}
+        self.slots = {}
+
+    backoff_delay = MiddlewareClient.backoff_delay
+
+    async def get(self, url):
+        """Send a GET request, retrying connection errors, timeouts and retryable HTTP codes"""
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self.request(url)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    return response
+                reason = f"HTTP {response.status_code}"
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                if attempt == self.retries:
+                    raise
+                reason = str(e) or type(e).__name__
+
+            delay = self.backoff_delay(attempt)
+            self.log(f"Request failed ({reason}), retry {attempt + 1}/{self.retries} in {delay:.1f}s", "WARNING")
+            self.on_retry()
+            await asyncio.sleep(delay)
+
+    async def request(self, url):
+        """Send one request over a pooled connection"""
+        parts = urlsplit(url)
+        secure = parts.scheme == "https"
+        key = (parts.hostname, parts.port or (443 if secure else 80), secure)
+        target = parts.path + ("?" + parts.query if parts.query else "")
+        head = (f"GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: keep-alive\r\n"
+                f"Accept: application/json\r\nAccept-Encoding: identity\r\n\r\n").encode("ascii")
+
+        if key not in self.slots:
+            self.slots[key] = asyncio.Semaphore(self.pool_size)
+        async with self.slots[key]:
+            # An idle connection may have been closed by the server meanwhile, then retry on a new one
+            while True:
+                reused = bool(self.idle.get(key))
+                reader, writer = self.idle[key].pop() if reused else await self.connect(key)
+                try:
+                    writer.write(head)
+                    await writer.drain()
+                    status, keep_alive, content = await asyncio.wait_for(self.read_response(reader), self.timeout[1])
+                    break
+                except (OSError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if not reused:
+                        raise
+                except BaseException:
+                    writer.close()
+                    raise
+
+            if keep_alive:
+                self.idle.setdefault(key, []).append((reader, writer))
+            else:
+                writer.close()
+        return AsyncResponse(status, content)
+
+    async def connect(self, key):
+        """Open a new connection to the server"""
+        host, port, secure = key
+        return await asyncio.wait_for(asyncio.open_connection(host, port, ssl=ssl.create_default_context() if secure else None),
+                                      self.timeout[0])
+
+    async def read_response(self, reader):
+        """Read status, headers and body, returns (status, keep_alive, body)"""
+        status_line = await reader.readline()
+        if not status_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        version, status = status_line.split(None, 2)[:2]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # Skip trailers up to the final empty line
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+            content = bytes(body)
+        elif "content-length" in headers:
+            content = await reader.readexactly(int(headers["content-length"]))
+        else:
+            # No length, the body ends with the connection
+            return int(status), False, await reader.read()
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == b"HTTP/1.1" else connection == "keep-alive"
+        return int(status), keep_alive, content
+
+    async def close(self):
+        """Close all pooled connections"""
+        for connections in self.idle.values():
+            for reader, writer in connections:
+                writer.close()
+        self.idle.clear()
@@ -0,0 +1,298 @@
+"""
+Batch mode of the Volkszaehler Data Deletion Tool.
+Runs many (server, uuid, range, threshold) jobs from a YAML, JSON or CSV job file
+on a worker pool, with a cap of concurrent jobs per server and round-robin
+interleaving of the servers.
+
+Job file (JSON, YAML list or "jobs" key, or CSV with header row):
+    [{"server": "192.168.1.100", "uuid": "...", "from": "01.05.2025 00:00", "to": "02.05.2025 00:00", "max": 30000},
+     {"server": "vz.example.com", "uuid": "...", "from": 1746057600000, "to": 1746144000000, "max": -4000, "mode": "max-loop"},
+     {"server": "vz.example.com", "uuid": "...", "from": 1746057600000, "to": 1746144000000, "min": -8000, "max": 8000}]
+
+Example:
+    python vz_batch.py jobs.yaml --workers 8 --jobs-per-server 2 --json
+
+Exit codes: 0 all completed, 1 a job failed, 2 invalid job file, 3 stopped (Ctrl+C)
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from vz_engine import (DeletionEngine, MiddlewareClient, MODE_SCAN, MODE_MAX_LOOP, DEFAULT_WINDOW_MS,
+                       is_valid_ip_or_domain, is_valid_uuid, convert_to_timestamp)
+from vz_archive import DEFAULT_ARCHIVE_DIR
+from vz_cli import make_logger, positive_float, EXIT_OK, EXIT_FAILED, EXIT_USAGE, EXIT_STOPPED
+
+# Job keys that may override the command line defaults
+OPTIONAL_KEYS = ["mode", "window", "parallel", "max_rate", "range_delete", "probe", "probe_bound", "probe_interval", "shards"]
+
+def read_job_file(path):
+    """Read the raw job dicts from a YAML, JSON or CSV file"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="", encoding="utf-8") as f:
+        if extension == ".csv":
+            return [row for row in csv.DictReader(f)]
+        if extension in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("YAML job files need PyYAML (pip install pyyaml), or use JSON / CSV")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("jobs", [])
+    if not isinstance(data, list):
+        raise ValueError("job file must contain a list of jobs")
+    return data
+
+def parse_bool(value):
+    """Parse booleans from JSON/YAML values or CSV text"""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+def build_params(raw, defaults, number):
+    """Validate one raw job and turn it into engine params"""
+    def fail(message):
+        raise ValueError(f"job {number}: {message}")
+
+    # Drop empty CSV cells so the defaults apply
+    raw = {key: value for key, value in raw.items() if value not in (None, "")}
+
+    server = str(raw.get("server", "")).strip()
+    if not is_valid_ip_or_domain(server) or server.endswith("/"):
+        fail(f"invalid server address '{server}'")
+    uuid_value = str(raw.get("uuid", "")).strip()
+    if not is_valid_uuid(uuid_value):
+        fail(f"invalid UUID '{uuid_value}'")
+    start_time = convert_to_timestamp(str(raw.get("from", "")).strip())
+    end_time = convert_to_timestamp(str(raw.get("to", "")).strip())
+    if start_time is None or end_time is None:
+        fail("from/to must be dd.MM.yyyy HH:mm or UNIX timestamp in ms")
+    if start_time >= end_time:
+        fail("from must be before to")
+    try:
+        max_value = float(raw["max"])
+    except (KeyError, ValueError):
+        fail("max must be a number")
+    try:
+        min_value = float(raw["min"]) if "min" in raw else None
+    except ValueError:
+        fail("min must be a number")
+    if min_value is not None and min_value >= max_value:
+        fail("min must be below max")
+
+    options = dict(defaults)
+    options.update({key: raw[key] for key in OPTIONAL_KEYS if key in raw})
+    if options["mode"] not in (MODE_SCAN, MODE_MAX_LOOP):
+        fail(f"mode must be {MODE_SCAN} or {MODE_MAX_LOOP}")
+    try:
+        return {
+            "server": server,
+            "uuid": uuid_value,
+            "start_time": start_time,
+            "end_time": end_time,
+            "max_value": max_value,
+            "min_value": min_value,
+            "mode": options["mode"],
+            "window_ms": int(float(options["window"]) * 3600000),
+            "concurrency": max(1, int(options["parallel"])),
+            "max_rate": float(options["max_rate"]) if options["max_rate"] else None,
+            "range_delete": parse_bool(options["range_delete"]),
+            "probe": parse_bool(options["probe"]),
+            "probe_bound": float(options["probe_bound"]),
+            "probe_interval": float(options["probe_interval"]) * 1000 if options["probe_interval"] else None,
+            "shards": max(1, int(options["shards"])),
+            "archive": defaults.get("archive"),
+        }
+    except ValueError as e:
+        fail(str(e))
+
+def load_jobs(path, defaults):
+    """Load and validate all jobs of a job file"""
+    return [build_params(raw, defaults, number) for number, raw in enumerate(read_job_file(path), 1)]
+
+class BatchScheduler:
+    """
+    Run jobs on a worker pool. Every server has its own queue, the queues are
+    served round-robin and at most jobs_per_server jobs run against one server.
+    """
+
+    def __init__(self, jobs, client, log, workers=4, jobs_per_server=1):
+        self.client = client
+        self.log = log
+        self.workers = max(1, workers)
+        self.jobs_per_server = max(1, jobs_per_server)
+        self.stopping = False
+        self.engines = set()
+        self.engines_lock = threading.Lock()
+
+        # One queue per server, in order of first appearance
+        self.queues = OrderedDict()
+        for number, params in enumerate(jobs, 1):
+            self.queues.setdefault(params["server"], deque()).append((number, params))
+        self.total = len(jobs)
+
+    def stop(self):
+        """Stop all running jobs and start no new ones"""
+        self.stopping = True
+        with self.engines_lock:
+            for engine in self.engines:
+                engine.stop()
+
+    def run_job(self, number, params):
+        """Run one job with its own engine and a log prefix"""
+        prefix = f"[job {number}/{self.total} {params['server']} {params['uuid'][:8]}]"
+        engine = DeletionEngine(client=self.client, log=lambda message, level="INFO": self.log(f"{prefix} {message}", level))
+        with self.engines_lock:
+            if self.stopping:
+                return None
+            self.engines.add(engine)
+        try:
+            return engine.run(params)
+        except Exception as e:
+            self.log(f"{prefix} Unexpected error: {str(e)}", "ERROR")
+            return dict(server=params["server"], uuid=params["uuid"], status="failed", deleted=0, error=str(e))
+        finally:
+            with self.engines_lock:
+                self.engines.discard(engine)
+
+    def next_job(self, running, rotation):
+        """Pick the next job round-robin from a server below its job cap"""
+        for _ in range(len(rotation)):
+            server = rotation[0]
+            rotation.rotate(-1)
+            if self.queues[server] and running[server] < self.jobs_per_server:
+                return server, self.queues[server].popleft()
+        return None
+
+    def run(self):
+        """Run all jobs and return the list of job results in job file order"""
+        results = {}
+        running = {server: 0 for server in self.queues}
+        rotation = deque(self.queues)
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                while len(pending) < self.workers and not self.stopping:
+                    picked = self.next_job(running, rotation)
+                    if picked is None:
+                        break
+                    server, (number, params) = picked
+                    running[server] += 1
+                    pending[executor.submit(self.run_job, number, params)] = (server, number)
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    server, number = pending.pop(future)
+                    running[server] -= 1
+                    result = future.result()
+                    if result is not None:
+                        results[number] = result
+                        self.log(f"[job {number}/{self.total}] {result['status']}, deleted {result['deleted']}", "INFO")
+        return [results[number] for number in sorted(results)]
+
+def summarize(results, total, elapsed):
+    """Aggregate the job results into one summary dict"""
+    statuses = [result["status"] for result in results]
+    return {
+        "jobs": total,
+        "completed": statuses.count("completed"),
+        "failed": statuses.count("failed"),
+        "stopped": statuses.count("stopped"),
+        "not_run": total - len(results),
+        "scanned": sum(result.get("scanned", 0) for result in results),
+        "offenders": sum(result.get("offenders", 0) for result in results),
+        "deleted": sum(result.get("deleted", 0) for result in results),
+        "fetched_bytes": sum(result.get("fetched_bytes", 0) for result in results),
+        "delete_requests": sum(result.get("metrics", {}).get("delete_requests", 0) for result in results),
+        "elapsed": round(elapsed, 3),
+        "results": results,
+    }
+
+def build_parser():
+    """Create the argument parser"""
+    parser = argparse.ArgumentParser(description="Run many Volkszaehler deletion jobs from a YAML, JSON or CSV job file.")
+    parser.add_argument("job_file", help="job file (.yaml/.yml, .json or .csv)")
+    parser.add_argument("--workers", type=int, default=4, help="jobs running at the same time (default: %(default)s)")
+    parser.add_argument("--jobs-per-server", type=int, default=1, help="jobs running at the same time against one server (default: %(default)s)")
+    parser.add_argument("--mode", choices=[MODE_SCAN, MODE_MAX_LOOP], default=MODE_SCAN, help="default mode (default: %(default)s)")
+    parser.add_argument("--window", type=positive_float, default=DEFAULT_WINDOW_MS / 3600000, help="default scan window in hours (default: %(default)s)")
+    parser.add_argument("--parallel", type=int, default=4, help="default maximum deletes in flight per job (default: %(default)s)")
+    parser.add_argument("--max-rate", type=positive_float, help="default ceiling for delete requests per second per job")
+    parser.add_argument("--no-range-delete", action="store_true", help="delete consecutive values one by one")
+    parser.add_argument("--probe", action="store_true", help="skip parts that packed averages prove clean (scan mode)")
+    parser.add_argument("--probe-bound", type=float, default=0.0, help="default value no value lies beyond on the other side of the threshold (default: %(default)s)")
+    parser.add_argument("--probe-interval", type=positive_float, metavar="SECONDS", help="default smallest time between two values of a channel (needed by --probe)")
+    parser.add_argument("--shards", type=int, default=1, help="default parts of a job's range scanned at the same time (default: %(default)s)")
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE_DIR, metavar="DIR", help="archive every value in DIR before deleting it (default: %(default)s)")
+    parser.add_argument("--no-archive", action="store_true", help="delete without archiving the values")
+    parser.add_argument("--timeout", type=positive_float, default=60, help="read timeout in seconds (default: %(default)s)")
+    parser.add_argument("--retries", type=int, default=3, help="retries per request (default: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="print a JSON summary to stdout")
+    parser.add_argument("--quiet", action="store_true", help="log only warnings and errors")
+    return parser
+
+def main(argv=None):
+    """Batch entry point, returns the exit code"""
+    args = build_parser().parse_args(argv)
+    defaults = {
+        "mode": args.mode,
+        "window": args.window,
+        "parallel": args.parallel,
+        "max_rate": args.max_rate,
+        "range_delete": not args.no_range_delete,
+        "probe": args.probe,
+        "probe_bound": args.probe_bound,
+        "probe_interval": args.probe_interval,
+        "shards": args.shards,
+        "archive": None if args.no_archive else args.archive,
+    }
+    try:
+        jobs = load_jobs(args.job_file, defaults)
+    except (OSError, ValueError) as e:
+        print(f"error: {str(e)}", file=sys.stderr)
+        return EXIT_USAGE
+
+    log = make_logger("WARNING" if args.quiet else "INFO")
+    servers = {params["server"] for params in jobs}
+    client = MiddlewareClient(timeout=(5, args.timeout), retries=args.retries, log=log, pool_hosts=len(servers))
+    scheduler = BatchScheduler(jobs, client, log, args.workers, args.jobs_per_server)
+    log(f"Running {len(jobs)} jobs on {len(servers)} servers with {scheduler.workers} workers", "INFO")
+
+    started = time.monotonic()
+    outcome = {}
+    worker = threading.Thread(target=lambda: outcome.update(results=scheduler.run()), daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(0.5)
+    except KeyboardInterrupt:
+        log("Batch stopped by user", "WARNING")
+        scheduler.stop()
+        worker.join()
+    client.close()
+
+    summary = summarize(outcome["results"], len(jobs), time.monotonic() - started)
+    log(f"Jobs completed: {summary['completed']}, failed: {summary['failed']}, stopped: {summary['stopped']}, "
+        f"not run: {summary['not_run']}, deleted: {summary['deleted']}", "INFO")
+    if args.json:
+        print(json.dumps(summary, indent=2))
+
+    if summary["failed"]:
+        return EXIT_FAILED
+    if summary["stopped"] or summary["not_run"]:
+        return EXIT_STOPPED
+    return EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Benchmark of the deletion engine against the local fake middleware (vz_fakeserver.py).
+Generates a synthetic channel with spikes, then runs every selected engine mode on
+the same data and reports time, throughput, traffic and peak memory per mode.
+
+The fake server and every mode run in their own processes, so they do not share
+the GIL and the memory of one mode does not show up in the next.
+
+Example:
+    python vz_bench.py --rows 2000000 --spike-rate 0.0005 --latency 0.005
+    python vz_bench.py --modes scan,probe --json > bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+from vz_engine import DeletionEngine, MiddlewareClient, MODE_SCAN, MODE_MAX_LOOP
+from vz_fakeserver import FakeMiddleware, generate_data, serve, DEFAULT_START, DEFAULT_STEP_MS
+from vz_db import create_sqlite_database
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCH_UUID = "12345678-1234-1234-1234-123456789abc"
+
+# Engine params of every mode, on top of the common ones
+BENCH_MODES = {
+    "scan": {},
+    "no-pipeline": {"pipeline": False},
+    "single-deletes": {"range_delete": False},
+    "probe": {"probe": True},
+    "async": {"async_io": True},
+    "rules": {"rules": ["stuck:60"]},
+    "shards": {"shards": 4},
+    "max-loop": {"mode": MODE_MAX_LOOP},
+    # Same data in a SQLite stand-in of the Volkszaehler database, no middleware involved
+    "db": {"db": True},
+}
+DEFAULT_MODES = ["scan", "no-pipeline", "probe", "async"]
+
+def peak_memory_mb():
+    """Peak resident memory of this process in MB, None where the resource module is missing"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KB elsewhere
+    return round(peak / (1048576 if sys.platform == "darwin" else 1024), 1)
+
+def run_server(settings, connection):
+    """Process target: generate the data, serve it and send the port to the parent"""
+    timestamps, values = generate_data(settings["rows"], DEFAULT_START, settings["step_ms"],
+                                       settings["spike_rate"], settings["spike_value"], settings["seed"])
+    server = serve(FakeMiddleware(timestamps, values, settings["latency"], settings["fail_rate"]))
+    connection.send(server.server_address[1])
+    connection.recv()
+    server.shutdown()
+
+def run_mode(params, connection):
+    """Process target: run the engine once and send the result with the peak memory to the parent"""
+    errors = []
+    log = lambda message, level="INFO": errors.append(message) if level == "ERROR" else None
+    client = MiddlewareClient(log=log)
+    engine = DeletionEngine(client=client, log=log)
+    baseline = peak_memory_mb()
+    result = engine.run(params)
+    client.close()
+    result["peak_mb"] = peak_memory_mb()
+    result["baseline_mb"] = baseline
+    result["errors"] = errors[:5]
+    connection.send(result)
+
+def fetch_json(url):
+    """GET a control URL of the fake server"""
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return json.loads(response.read())
+
+def run_in_process(target, *args):
+    """Run target(*args, connection) in a child process and return what it sends"""
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=target, args=args + (child,), daemon=True)
+    process.start()
+    return process, parent
+
+def create_bench_database(settings, directory):
+    """Write the benchmark data into a new SQLite database, returns its URL"""
+    path = os.path.join(directory, "volkszaehler.db")
+    if os.path.exists(path):
+        os.remove(path)
+    timestamps, values = generate_data(settings["rows"], DEFAULT_START, settings["step_ms"],
+                                       settings["spike_rate"], settings["spike_value"], settings["seed"])
+    create_sqlite_database(path, BENCH_UUID, timestamps, values)
+    return f"sqlite:///{path}"
+
+def benchmark_mode(name, params, base_url, settings, directory):
+    """Run one mode on freshly reset data and return its report row"""
+    fetch_json(f"{base_url}/_fake/reset")
+    mode_params = dict(params, **BENCH_MODES[name])
+    if mode_params.get("db"):
+        mode_params["db"] = create_bench_database(settings, directory)
+    process, connection = run_in_process(run_mode, mode_params)
+    result = connection.recv()
+    process.join()
+    stats = fetch_json(f"{base_url}/_fake/stats")
+
+    metrics = result.get("metrics", {})
+    elapsed = max(result.get("elapsed", 0), 1e-9)
+    return {
+        "mode": name,
+        "status": result["status"],
+        "seconds": round(elapsed, 2),
+        "scanned": result.get("scanned", 0),
+        "deleted": result["deleted"],
+        "runs": result.get("runs", 0),
+        "runs_per_second": round(result.get("runs", 0) / elapsed, 1),
+        "values_per_second": round(result.get("scanned", 0) / elapsed),
+        "deletes_per_second": metrics.get("deletes_per_second"),
+        "delete_latency_p95": metrics.get("delete_latency_p95"),
+        "fetched_mb": round(metrics.get("bytes_fetched", 0) / 1048576, 2),
+        "requests": stats["requests"],
+        "peak_mb": result["peak_mb"],
+        "growth_mb": round(result["peak_mb"] - result["baseline_mb"], 1) if result["peak_mb"] is not None else None,
+        "errors": result["errors"],
+    }
+
+def print_table(rows):
+    """Print the report rows as a table"""
+    columns = [("mode", "mode"), ("status", "status"), ("seconds", "s"), ("scanned", "scanned"), ("deleted", "deleted"),
+               ("runs_per_second", "runs/s"), ("values_per_second", "values/s"), ("deletes_per_second", "deletes/s"),
+               ("fetched_mb", "fetched MB"), ("requests", "requests"), ("peak_mb", "peak MB"), ("growth_mb", "growth MB")]
+    table = [[title for _, title in columns]] + [[str(row[key]) for key, _ in columns] for row in rows]
+    widths = [max(len(line[index]) for line in table) for index in range(len(columns))]
+    for line in table:
+        print("  ".join(cell.rjust(width) if index else cell.ljust(width) for index, (cell, width) in enumerate(zip(line, widths))))
+    for row in rows:
+        for error in row["errors"]:
+            print(f"{row['mode']}: {error}", file=sys.stderr)
+
+def mode_list(value):
+    """Argparse type for a comma separated list of modes"""
+    modes = [mode.strip() for mode in value.split(",") if mode.strip()]
+    unknown = [mode for mode in modes if mode not in BENCH_MODES]
+    if unknown or not modes:
+        raise argparse.ArgumentTypeError(f"unknown mode {', '.join(unknown) or '(none)'}, choose from {', '.join(BENCH_MODES)}")
+    return modes
+
+def build_parser():
+    """Create the argument parser"""
+    parser = argparse.ArgumentParser(description="Benchmark the engine modes against a local fake middleware.")
+    parser.add_argument("--rows", type=int, default=1000000, help="values of the synthetic channel (default: %(default)s)")
+    parser.add_argument("--step-ms", type=int, default=DEFAULT_STEP_MS, help="ms between values (default: %(default)s)")
+    parser.add_argument("--spike-rate", type=float, default=0.0002, help="share of values that are spikes (default: %(default)s)")
+    parser.add_argument("--spike-value", type=float, default=100000.0, help="smallest spike value (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the data (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds every request waits on the server (default: %(default)s)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests failing with HTTP 503 (default: %(default)s)")
+    parser.add_argument("--modes", type=mode_list, default=DEFAULT_MODES, help=f"comma separated modes out of {', '.join(BENCH_MODES)} "
+                        f"(default: {','.join(DEFAULT_MODES)})")
+    parser.add_argument("--max", dest="max_value", type=float, default=10000.0, help="threshold (default: %(default)s)")
+    parser.add_argument("--window", type=float, default=6, help="scan window in hours (default: %(default)s)")
+    parser.add_argument("--parallel", type=int, default=4, help="maximum deletes in flight (default: %(default)s)")
+    parser.add_argument("--max-rate", type=float, help="ceiling for delete requests per second")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser
+
+def main(argv=None):
+    """Command line entry point"""
+    args = build_parser().parse_args(argv)
+    settings = {"rows": args.rows, "step_ms": args.step_ms, "spike_rate": args.spike_rate, "spike_value": args.spike_value,
+                "seed": args.seed, "latency": args.latency, "fail_rate": args.fail_rate}
+    print(f"Generating {args.rows} values with spikes at rate {args.spike_rate}...", file=sys.stderr, flush=True)
+    server, connection = run_in_process(run_server, settings)
+    port = connection.recv()
+    address = f"127.0.0.1:{port}"
+
+    params = {
+        "server": address,
+        "uuid": BENCH_UUID,
+        "start_time": DEFAULT_START,
+        "end_time": DEFAULT_START + args.rows * args.step_ms,
+        "max_value": args.max_value,
+        "mode": MODE_SCAN,
+        "window_ms": int(args.window * 3600000),
+        "concurrency": max(1, args.parallel),
+        "max_rate": args.max_rate,
+        "range_delete": True,
+        # The fake server writes one value every step, the probe needs it to bound its averages
+        "probe_interval": args.step_ms,
+    }
+    rows = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for name in args.modes:
+                print(f"Running {name}...", file=sys.stderr, flush=True)
+                started = time.monotonic()
+                rows.append(benchmark_mode(name, params, f"http://{address}", settings, directory))
+                print(f"{name}: {time.monotonic() - started:.1f}s", file=sys.stderr, flush=True)
+    finally:
+        connection.send("stop")
+        server.join(5)
+
+    if args.json:
+        print(json.dumps({"settings": settings, "params": params, "results": rows}, indent=2))
+    else:
+        print_table(rows)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Local cache of fetched channel data, so scanning the same range again (e.g. with
+another threshold) does not download it again.
+
+One directory per channel below the cache directory:
+    <cache>/<server>/<uuid>/rows.bin    segments of rows, only ever appended to
+    <cache>/<server>/<uuid>/meta.json   {"version": 2, "segments": [[from, to, offset, rows], ...],
+                                         "removed": [[from, to], ...]}
+Every fetched part of the range is appended as one segment covering [from, to]: rows
+int64 timestamps (sorted) followed by rows float64 values, little endian, starting at
+offset. numpy.memmap can map a segment column directly. The file is memory mapped for
+reading, only the rows of the requested range are copied, so multi-year 1 s channels
+need no RAM for the parts not scanned. Only the covered ranges are trusted, everything
+else is fetched and appended. Values deleted by the tool are listed in "removed" and
+skipped when reading instead of rewriting the segments.
+"""
+import array
+import bisect
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import threading
+import time
+
+CACHE_VERSION = 2
+
+# Recent data may still arrive late, ranges closer to now are never marked covered
+RECENT_MS = 15 * 60 * 1000
+
+def merge_ranges(ranges):
+    """Merge overlapping or adjacent inclusive [from, to] ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def column_bytes(column):
+    """Return the array as little endian bytes"""
+    if sys.byteorder != "little":
+        column = array.array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+class TimestampColumn:
+    """Read-only sequence over the timestamps of a mapped segment, for bisect"""
+
+    def __init__(self, data, offset, rows):
+        self.data = data
+        self.offset = offset
+        self.rows = rows
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, index):
+        return struct.unpack_from("<q", self.data, self.offset + 8 * index)[0]
+
+class ChannelCache:
+    """Segments of timestamp/value rows of one channel with the time ranges they cover"""
+
+    def __init__(self, directory, server, uuid_value):
+        self.path = os.path.join(directory, re.sub(r"[^\w.-]", "_", server), uuid_value)
+        self.segments = []
+        self.removed = []
+        self.lock = threading.Lock()
+        self.file = None
+        self.data = None
+        self.dirty = False
+
+    @property
+    def covered(self):
+        """Merged [from, to] ranges the segments cover"""
+        return merge_ranges([segment[0], segment[1]] for segment in self.segments)
+
+    @property
+    def rows(self):
+        """Number of rows in the segments, values removed later included"""
+        return sum(segment[3] for segment in self.segments)
+
+    def load(self):
+        """Read the segment list of the channel, a missing cache is simply empty"""
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != CACHE_VERSION:
+            raise ValueError(f"unsupported cache version {meta.get('version')}")
+
+        segments = sorted(meta["segments"])
+        size = os.path.getsize(os.path.join(self.path, "rows.bin")) if segments else 0
+        if any(offset + 16 * rows > size for _, _, offset, rows in segments):
+            raise ValueError("cache file is shorter than its segments, interrupted write?")
+        self.segments = segments
+        self.removed = merge_ranges(meta.get("removed", []))
+
+    def clear(self):
+        """Forget all cached data of the channel and delete its files"""
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.segments = []
+        self.removed = []
+        self.dirty = False
+
+    def missing(self, start, end):
+        """Return the inclusive (from, to) parts of the range not covered by the cache"""
+        gaps = []
+        position = start
+        for covered_start, covered_end in self.covered:
+            if covered_end < position:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > position:
+                gaps.append((position, covered_start - 1))
+            position = covered_end + 1
+        if position <= end:
+            gaps.append((position, end))
+        return gaps
+
+    def store(self, start, end, timestamps, values):
+        """
+        Append the sorted rows fetched for a range not covered yet as a new segment and
+        mark the range covered. Rows outside the range and the most recent part of it
+        are not stored, returns the end of the part stored (start - 1 if nothing).
+        """
+        end = min(end, int(time.time() * 1000) - RECENT_MS)
+        if end < start:
+            return start - 1
+        first = bisect.bisect_left(timestamps, start)
+        last = bisect.bisect_right(timestamps, end)
+        with self.lock:
+            if self.file is None:
+                os.makedirs(self.path, exist_ok=True)
+                self.file = open(os.path.join(self.path, "rows.bin"), "ab")
+            offset = self.file.seek(0, os.SEEK_END)
+            self.file.write(column_bytes(array.array("q", timestamps[first:last])))
+            self.file.write(column_bytes(array.array("d", values[first:last])))
+            self.file.flush()
+            bisect.insort(self.segments, [start, end, offset, last - first])
+            self.dirty = True
+        return end
+
+    def remove(self, first, last):
+        """Mark the rows from first to last as gone, called for values deleted on the server"""
+        with self.lock:
+            self.removed = merge_ranges(self.removed + [[first, last]])
+            self.dirty = True
+
+    def mapping(self, size):
+        """Return the rows file mapped for reading, at least size bytes of it"""
+        with self.lock:
+            if self.data is None or len(self.data) < size:
+                if self.file is not None:
+                    self.file.flush()
+                if self.data is not None:
+                    self.data.close()
+                with open(os.path.join(self.path, "rows.bin"), "rb") as f:
+                    self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self.data
+
+    def read_column(self, typecode, data, offset, low, high):
+        """Copy rows low to high of the column at offset out of the mapping"""
+        column = array.array(typecode, data[offset + 8 * low:offset + 8 * high])
+        if sys.byteorder != "little":
+            column.byteswap()
+        return column
+
+    def without_removed(self, timestamps, values):
+        """Drop the rows of a block that were removed"""
+        removed = self.removed
+        index = bisect.bisect_left(removed, [timestamps[0]])
+        if index and removed[index - 1][1] >= timestamps[0]:
+            index -= 1
+        if index >= len(removed) or removed[index][0] > timestamps[-1]:
+            return timestamps, values
+        kept_timestamps, kept_values = array.array("q"), array.array("d")
+        position = 0
+        while index < len(removed) and removed[index][0] <= timestamps[-1]:
+            low = bisect.bisect_left(timestamps, removed[index][0], position)
+            high = bisect.bisect_right(timestamps, removed[index][1], position)
+            kept_timestamps.extend(timestamps[position:low])
+            kept_values.extend(values[position:low])
+            position = max(position, high)
+            index += 1
+        kept_timestamps.extend(timestamps[position:])
+        kept_values.extend(values[position:])
+        return kept_timestamps, kept_values
+
+    def blocks(self, start, end, size):
+        """
+        Yield the cached rows of the range as (timestamps, values) arrays of up to size
+        rows, in time order. Rows removed meanwhile are skipped from the next block on.
+        """
+        for segment_start, segment_end, offset, rows in list(self.segments):
+            if segment_end < start or not rows:
+                continue
+            if segment_start > end:
+                break
+            data = self.mapping(offset + 16 * rows)
+            column = TimestampColumn(data, offset, rows)
+            low = bisect.bisect_left(column, start)
+            high = bisect.bisect_right(column, end)
+            while low < high:
+                timestamps = self.read_column("q", data, offset, low, min(high, low + size))
+                values = self.read_column("d", data, offset + 8 * rows, low, low + len(timestamps))
+                low += len(timestamps)
+                timestamps, values = self.without_removed(timestamps, values)
+                if timestamps:
+                    yield timestamps, values
+
+    def save(self):
+        """Write the segment list if anything changed, after the rows it points to are on disk"""
+        with self.lock:
+            if not self.dirty:
+                return
+            if self.file is not None:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            if not self.segments:
+                self.dirty = False
+                return
+            meta = {"version": CACHE_VERSION, "segments": self.segments, "removed": self.removed}
+            path = os.path.join(self.path, "meta.json")
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(path + ".tmp", path)
+            self.dirty = False
+
+    def close(self):
+        """Close the rows file and its mapping"""
+        with self.lock:
+            if self.data is not None:
+                self.data.close()
+                self.data = None
+            if self.file is not None:
+                self.file.close()
+                self.file = None
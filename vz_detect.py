@@ -0,0 +1,266 @@
+"""
+Detection rules of the Volkszaehler Data Deletion Tool.
+The plain threshold is checked block by block, with NumPy if installed, the other
+rules classify whole blocks of timestamps and values with NumPy.
+
+Rules are given as text:
+    band:LOW:HIGH     values below LOW or above HIGH (either may be empty)
+    rate:LIMIT        a value jumping away by more than LIMIT per second and back again
+    spike[:W[:K]]     values more than K scaled MADs away from the median of the W
+                      values around them (default W=31, K=6)
+    stuck:COUNT       COUNT or more identical values in a row, all but the first
+"""
+from itertools import chain
+
+# NumPy is imported on first use, it adds about 70 ms to the start of every command
+numpy_module = None
+
+def load_numpy():
+    """Return the numpy module, None if it is not installed"""
+    global numpy_module
+    if numpy_module is None:
+        try:
+            import numpy
+            numpy_module = numpy
+        except ImportError:
+            numpy_module = False
+    return numpy_module or None
+
+# Rows classified per block, plus the context rows each rule needs around them
+BLOCK_ROWS = 65536
+
+# Rows per chunk of the rolling median
+SPIKE_CHUNK_ROWS = 8192
+
+# MAD to standard deviation of normally distributed values
+MAD_SCALE = 1.4826
+
+def threshold_reason(max_value):
+    """Describe why a value beyond the threshold is deleted"""
+    return f"> {max_value}" if max_value >= 0 else f"< {max_value}"
+
+def value_exceeds_threshold(value, max_value):
+    """Check if a value exceeds the threshold (considering sign)"""
+    if max_value >= 0:
+        # For positive thresholds, delete if value is greater
+        return value > max_value
+    # For negative thresholds, delete if value is less (more negative)
+    return value < max_value
+
+def describe_threshold(params):
+    """Describe the threshold or band of the given params for the log"""
+    if params.get("min_value") is None:
+        return str(params["max_value"])
+    return f"{params['min_value']} .. {params['max_value']}"
+
+def iter_threshold(blocks, max_value, min_value=None):
+    """
+    Classify (timestamps, values) blocks against the plain threshold, or the band
+    min_value .. max_value if min_value is given. Yields (timestamps, values, offenders)
+    for every block, offenders being the (index, reason) of its bad values. None
+    blocks (gaps) are passed through. With NumPy every block is compared in one go.
+    """
+    np = load_numpy()
+    reason = threshold_reason(max_value)
+    above, below = f"> {max_value}", f"< {min_value}"
+    for block in blocks:
+        if block is None:
+            yield None
+            continue
+        timestamps, values = block
+        if np is not None:
+            column = np.frombuffer(values, dtype=np.float64)
+            if min_value is None:
+                indexes = np.flatnonzero(column > max_value if max_value >= 0 else column < max_value).tolist()
+                offenders = [(index, reason) for index in indexes]
+            else:
+                indexes = np.flatnonzero((column > max_value) | (column < min_value)).tolist()
+                offenders = [(index, above if values[index] > max_value else below) for index in indexes]
+        elif min_value is None and max_value >= 0:
+            offenders = [(index, reason) for index, value in enumerate(values) if value > max_value]
+        elif min_value is None:
+            offenders = [(index, reason) for index, value in enumerate(values) if value < max_value]
+        else:
+            offenders = [(index, above if value > max_value else below) for index, value in enumerate(values)
+                         if value > max_value or value < min_value]
+        yield timestamps, values, offenders
+
+class BandRule:
+    """Values below low or above high"""
+    context = 0
+
+    def __init__(self, low=None, high=None):
+        self.low = low
+        self.high = high
+
+    def classify(self, timestamps, values, reasons):
+        if self.high is not None:
+            reasons[(values > self.high) & (reasons == None)] = f"> {self.high}"
+        if self.low is not None:
+            reasons[(values < self.low) & (reasons == None)] = f"< {self.low}"
+
+class RateRule:
+    """Values jumping away from both neighbours by more than limit per second, in opposite directions"""
+    context = 1
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def classify(self, timestamps, values, reasons):
+        if len(values) < 3:
+            return
+        np = load_numpy()
+        steps = np.diff(values)
+        jumps = np.abs(steps) / (np.diff(timestamps) / 1000.0) > self.limit
+        spikes = jumps[:-1] & jumps[1:] & (steps[:-1] * steps[1:] < 0)
+        mask = np.zeros(len(values), dtype=bool)
+        mask[1:-1] = spikes
+        reasons[mask & (reasons == None)] = f"rate > {self.limit}/s"
+
+class SpikeRule:
+    """Values far from the rolling median, measured in median absolute deviations"""
+
+    def __init__(self, window=31, k=6.0):
+        self.window = window | 1
+        self.k = k
+        self.context = self.window // 2
+
+    def classify(self, timestamps, values, reasons):
+        if len(values) < 2:
+            return
+        np = load_numpy()
+        padded = np.pad(values, self.context, mode="reflect")
+        median = np.empty(len(values))
+        scale = np.empty(len(values))
+        # Small chunks of windows stay in the CPU cache, partition is enough for odd windows
+        for start in range(0, len(values), SPIKE_CHUNK_ROWS):
+            windows = np.lib.stride_tricks.sliding_window_view(padded[start:start + SPIKE_CHUNK_ROWS + 2 * self.context], self.window).copy()
+            windows.partition(self.context, axis=1)
+            chunk_median = windows[:, self.context]
+            median[start:start + len(windows)] = chunk_median
+            np.subtract(windows, chunk_median[:, None], out=windows)
+            np.abs(windows, out=windows)
+            windows.partition(self.context, axis=1)
+            scale[start:start + len(windows)] = MAD_SCALE * windows[:, self.context]
+        mask = (scale > 0) & (np.abs(values - median) > self.k * scale)
+        reasons[mask & (reasons == None)] = f"spike > {self.k} MAD"
+
+class StuckRule:
+    """Runs of count or more identical values, all but the first value of the run"""
+
+    def __init__(self, count):
+        self.count = count
+        self.context = count
+
+    def classify(self, timestamps, values, reasons):
+        if len(values) < 2:
+            return
+        np = load_numpy()
+        starts = np.concatenate(([True], values[1:] != values[:-1]))
+        run_ids = np.cumsum(starts) - 1
+        lengths = np.bincount(run_ids)
+        mask = (lengths[run_ids] >= self.count) & ~starts
+        reasons[mask & (reasons == None)] = f"stuck x{self.count}+"
+
+def parse_rule(text):
+    """Parse one rule given as text, raises ValueError for invalid rules"""
+    name, *args = text.strip().lower().split(":")
+    try:
+        numbers = [float(arg) if arg.strip() else None for arg in args]
+    except ValueError:
+        raise ValueError(f"invalid rule '{text}': arguments must be numbers")
+
+    if name == "band" and len(numbers) == 2 and numbers != [None, None]:
+        low, high = numbers
+        if low is not None and high is not None and low >= high:
+            raise ValueError(f"invalid rule '{text}': LOW must be below HIGH")
+        return BandRule(low, high)
+    if name == "rate" and len(numbers) == 1 and numbers[0] and numbers[0] > 0:
+        return RateRule(numbers[0])
+    if name == "spike" and len(numbers) <= 2 and None not in numbers:
+        window = int(numbers[0]) if numbers else 31
+        k = numbers[1] if len(numbers) > 1 else 6.0
+        if window < 3 or k <= 0:
+            raise ValueError(f"invalid rule '{text}': W must be at least 3 and K above 0")
+        return SpikeRule(window, k)
+    if name == "stuck" and len(numbers) == 1 and numbers[0] and numbers[0] >= 2:
+        return StuckRule(int(numbers[0]))
+    raise ValueError(f"invalid rule '{text}', use band:LOW:HIGH, rate:LIMIT, spike[:W[:K]] or stuck:COUNT")
+
+class Detector:
+    """Classify blocks of values against the threshold and the extra rules with NumPy"""
+
+    def __init__(self, max_value, specs, min_value=None):
+        if load_numpy() is None:
+            raise ValueError("detection rules need NumPy (pip install numpy)")
+        if min_value is not None:
+            threshold = BandRule(min_value, max_value)
+        else:
+            threshold = BandRule(high=max_value) if max_value >= 0 else BandRule(low=max_value)
+        self.rules = [threshold] + [parse_rule(spec) for spec in specs]
+        self.context = max(rule.context for rule in self.rules)
+
+    def classify(self, timestamps, values):
+        """Return the reason of every value, None for good values"""
+        np = load_numpy()
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        reasons = np.full(len(values), None, dtype=object)
+        for rule in self.rules:
+            rule.classify(timestamps, values, reasons)
+        return reasons
+
+    def iter_classified(self, blocks, block_rows=BLOCK_ROWS):
+        """
+        Classify (timestamps, values) blocks, yield (timestamps, values, offenders) in the
+        same order, offenders being the (index, reason) of the bad values. Blocks are
+        classified together, block_rows at a time with context rows of their neighbours,
+        and handed out in pieces that never span two input blocks. A None block (gap) is
+        passed through and starts a new neighbourhood.
+        """
+        np = load_numpy()
+        # Blocks not handed out yet, after look-behind rows already handed out
+        parts = []
+        rows = behind = 0
+        end = object()
+        for block in chain(blocks, [end]):
+            final = block is None or block is end
+            if not final:
+                if not len(block[0]):
+                    continue
+                parts.append(block)
+                rows += len(block[0])
+                if rows - behind < block_rows + self.context:
+                    continue
+
+            if rows > behind:
+                reasons = self.classify(np.concatenate([np.frombuffer(part[0], dtype=np.int64) for part in parts]),
+                                        np.concatenate([np.frombuffer(part[1], dtype=np.float64) for part in parts]))
+                # Rows without context rows after them wait for the next blocks
+                stop = rows if final else rows - self.context
+                position = 0
+                for timestamps, values in parts:
+                    low, high = max(behind, position), min(stop, position + len(timestamps))
+                    if low < high:
+                        offenders = [(int(index), reasons[low + index]) for index in np.flatnonzero(reasons[low:high] != None)]
+                        yield timestamps[low - position:high - position], values[low - position:high - position], offenders
+                    position += len(timestamps)
+                # Keep the rows still to classify and the look-behind rows before them
+                keep = rows if final else max(0, stop - self.context)
+                position = 0
+                kept = []
+                for timestamps, values in parts:
+                    if position + len(timestamps) > keep:
+                        first = max(0, keep - position)
+                        kept.append((timestamps[first:], values[first:]))
+                    position += len(timestamps)
+                parts = kept
+                rows, behind = rows - keep, stop - keep
+            if block is None:
+                parts = []
+                rows = behind = 0
+                yield None
+
+def build_detector(max_value, specs, min_value=None):
+    """Return a Detector for the extra rules, None if only the plain threshold or band is checked"""
+    return Detector(max_value, specs, min_value) if specs else None
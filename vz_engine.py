@@ -0,0 +1,1793 @@
+"""
+Fetch, detect and delete engine of the Volkszaehler Data Deletion Tool.
+Used by the tkinter GUI and the command line (vz_cli.py), imports no GUI modules.
+"""
+import requests
+from requests.adapters import HTTPAdapter
+import json
+import re
+import time
+import threading
+from datetime import datetime, timezone
+import uuid as uuid_lib
+import codecs
+import asyncio
+import math
+import queue
+import random
+import array
+import bisect
+import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from vz_journal import RunJournal, read_journal
+from vz_plan import write_plan, read_plan
+from vz_cache import ChannelCache
+from vz_metrics import RunMetrics
+from vz_db import VolkszaehlerDatabase, describe_db, DB_PAGE_ROWS, DB_DELETE_BATCH
+from vz_aggregate import AggregateTracker, DEFAULT_AGGREGATE_TYPES, bucket_bounds
+from vz_archive import DeleteArchive, ARCHIVE_BATCH, RESTORE_BATCH
+from vz_detect import value_exceeds_threshold, describe_threshold, iter_threshold, build_detector, load_numpy
+
+# Engine modes
+MODE_SCAN = "scan"
+MODE_MAX_LOOP = "max-loop"
+
+# Default time window for the streaming tuple reader
+DEFAULT_WINDOW_MS = 24 * 60 * 60 * 1000
+
+# Coarse probe: packets of the first request, packet limit per request and
+# packet size below which the raw values are fetched instead of probing deeper
+PROBE_PACKETS = 100
+PROBE_MAX_PACKETS = 10000
+PROBE_LEAF_ROWS = 200
+
+TUPLES_START_PATTERN = re.compile(r'"tuples"\s*:\s*\[')
+TUPLES_END_PATTERN = re.compile(r'^[\s,]*\]|\]\s*\]')
+
+# Brackets of the tuple items, turned into spaces for the flat decode
+ITEM_BRACKETS = str.maketrans("[]", "  ")
+
+def decode_items(text):
+    """Decode the comma separated JSON items in text one by one, skipping null values"""
+    decoder = json.JSONDecoder()
+    timestamps, values = array.array("q"), array.array("d")
+    pos = 0
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(text):
+            return timestamps, values
+        item, pos = decoder.raw_decode(text, pos)
+        if item[1] is not None:
+            timestamps.append(int(item[0]))
+            values.append(float(item[1]))
+
+def decode_block(text):
+    """
+    Decode complete tuple items "[ts,value,count],[ts,value,count],..." into an int64
+    timestamp and a float64 value array. The fast path parses all numbers as one flat
+    list without creating an object per tuple, null values or other surprises fall
+    back to decoding item by item.
+    """
+    np = load_numpy()
+    text = text.strip(" \t\r\n,")
+    items = text.count("]")
+    if not items:
+        return array.array("q"), array.array("d")
+    width = text.count(",", 0, text.index("]")) + 1
+    flat_text = text.translate(ITEM_BRACKETS)
+    try:
+        if np is not None:
+            with warnings.catch_warnings():
+                # Older NumPy versions only warn about unparsable text
+                warnings.simplefilter("error")
+                flat = np.fromstring(flat_text, sep=",")
+        else:
+            flat = array.array("d", map(float, flat_text.split(",")))
+    except (ValueError, DeprecationWarning):
+        flat = None
+    if flat is None or width < 2 or len(flat) != items * width:
+        return decode_items(text)
+    
+    if np is not None:
+        return array.array("q", flat[0::width].astype(np.int64).tobytes()), array.array("d", flat[1::width].tobytes())
+    return array.array("q", map(int, flat[0::width])), flat[1::width]
+
+def iter_json_blocks(chunks, metrics=None):
+    """
+    Incrementally parse the items of the "tuples" array from a stream of text chunks
+    into (timestamps, values) blocks of typed arrays, one block per chunk.
+    The parse time and item count of every chunk are added to metrics if given.
+    """
+    buffer = ""
+    in_array = False
+    for chunk in chunks:
+        started = time.perf_counter()
+        buffer += chunk
+        
+        # Skip everything before the start of the tuples array
+        if not in_array:
+            match = TUPLES_START_PATTERN.search(buffer)
+            if not match:
+                # Keep a short tail in case the key is split across chunks
+                buffer = buffer[-32:]
+                continue
+            buffer = buffer[match.end():]
+            in_array = True
+        
+        # Items hold no nested brackets: the array ends with a "]" right after an item
+        # or at the start, otherwise the last "]" ends the last complete item
+        match = TUPLES_END_PATTERN.search(buffer)
+        complete = match is not None
+        end = match.end() - 1 if complete else buffer.rfind("]") + 1
+        if not end:
+            continue
+        text = buffer[:end]
+        buffer = buffer[end:]
+        
+        timestamps, values = decode_block(text)
+        if metrics:
+            metrics.add(parse_seconds=time.perf_counter() - started, tuples_parsed=len(timestamps))
+        if timestamps:
+            yield timestamps, values
+        if complete:
+            return
+
+# Pipeline: blocks of tuples buffered between fetcher and detector, rows per cached block
+# and runs buffered between detector and deleter
+PIPELINE_BLOCKS = 64
+PIPELINE_BATCH_ROWS = 4096
+PIPELINE_RUNS = 1024
+
+def iter_prefetched(items, maxsize=PIPELINE_BLOCKS, batch_size=1):
+    """
+    Run the items iterator in a background thread, so the next items are fetched
+    while the current ones are processed. Items are handed over in batches through
+    a bounded queue, errors of the iterator are raised in the consumer.
+    """
+    handoff = queue.Queue(maxsize)
+    closed = threading.Event()
+    end = object()
+    
+    def put(item):
+        # Give up once the consumer is gone
+        while not closed.is_set():
+            try:
+                handoff.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def produce():
+        batch = []
+        try:
+            for item in items:
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    if not put(batch):
+                        return
+                    batch = []
+            if put(batch):
+                put(end)
+        except Exception as e:
+            put(e)
+    
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            batch = handoff.get()
+            if batch is end:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield from batch
+    finally:
+        closed.set()
+
+# Upper limit of shards scanned at the same time, options a sharded scan does not handle
+MAX_SHARDS = 8
+SHARD_UNSUPPORTED = ["cache", "probe", "db"]
+
+# Options the asyncio scan does not handle, the regular scan is used instead
+ASYNC_UNSUPPORTED = ["journal", "dry_run", "cache", "probe", "rules", "db"]
+
+# Upper limit of concurrent requests against one middleware server
+MAX_REQUESTS_PER_SERVER = 8
+
+# Requests count as slow (congestion) above this multiple of the fastest latency seen, plus
+# some slack for jitter of fast servers. The fastest latency follows lasting changes slowly.
+CONGESTION_LATENCY_FACTOR = 2.0
+CONGESTION_LATENCY_SLACK = 0.05
+BASE_LATENCY_DRIFT = 0.01
+
+# Connect and read timeouts in seconds for middleware requests
+DEFAULT_TIMEOUT = (5, 60)
+
+# HTTP status codes worth retrying
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class MiddlewareClient:
+    """
+    Shared connection-pooled session for all middleware calls.
+    Connections are kept alive between requests, responses are gzip compressed
+    and failed requests are retried with jittered exponential backoff.
+    Fetches and deletes are GET requests and safe to repeat. The POST requests of a
+    restore add values, they are only retried if the connection could not be opened.
+    """
+    
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=3, backoff=0.5, pool_size=MAX_REQUESTS_PER_SERVER, log=None, pool_hosts=4):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.log = log or (lambda message, level="INFO": None)
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(1, pool_hosts), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    
+    def backoff_delay(self, attempt):
+        """Return the full-jitter exponential backoff for the given attempt"""
+        return random.uniform(0, self.backoff * (2 ** attempt))
+    
+    def get(self, url, stream=False, on_retry=None):
+        """
+        Send a GET request, retrying connection errors, timeouts and retryable HTTP codes.
+        on_retry() is called before every retry.
+        """
+        return self.request("GET", url, on_retry, stream=stream)
+    
+    def post(self, url, body, on_retry=None):
+        """
+        Send body as JSON in a POST request. Only connect timeouts are retried, once the
+        body went out the server may have applied it, so it is never sent twice.
+        """
+        return self.request("POST", url, on_retry, json=body)
+    
+    def request(self, method, url, on_retry=None, **kwargs):
+        """Send a request with the retries described in get, or in post for POST requests"""
+        repeatable = method != "POST"
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+                if not repeatable or response.status_code not in RETRY_STATUS_CODES or attempt == self.retries:
+                    return response
+                response.close()
+                reason = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries or not (repeatable or isinstance(e, requests.ConnectTimeout)):
+                    raise
+                reason = str(e)
+            
+            delay = self.backoff_delay(attempt)
+            self.log(f"Request failed ({reason}), retry {attempt + 1}/{self.retries} in {delay:.1f}s", "WARNING")
+            if on_retry:
+                on_retry()
+            time.sleep(delay)
+    
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+class RateController:
+    """
+    AIMD control of request rate and concurrency.
+    Starts by doubling the rate every second (slow start) until the first
+    congestion signal, then increases rate and concurrency additively.
+    Errors and slow requests cut both in half. A request is slow if it took longer
+    than target_latency or, without one, CONGESTION_LATENCY_FACTOR times the fastest
+    latency seen, so a server that is always slow (e.g. a Raspberry Pi) is not
+    mistaken for an overloaded one.
+    """
+    
+    def __init__(self, max_rate=None, max_concurrency=8, target_latency=None, start_rate=2.0, min_rate=0.2):
+        self.max_rate = max_rate
+        self.max_concurrency = max(1, max_concurrency)
+        self.target_latency = target_latency
+        self.base_latency = None
+        self.min_rate = min_rate
+        self.rate = start_rate if max_rate is None else min(start_rate, max_rate)
+        self.window = 1.0
+        self.slow_start = True
+        self.next_send = time.monotonic()
+        self.last_decrease = 0.0
+        self.lock = threading.Lock()
+    
+    @property
+    def concurrency(self):
+        """Current number of requests allowed in flight"""
+        return max(1, min(self.max_concurrency, int(self.window)))
+    
+    def reserve(self):
+        """Reserve the next send slot, returns the seconds to wait before sending"""
+        with self.lock:
+            now = time.monotonic()
+            send_at = max(now, self.next_send)
+            self.next_send = send_at + 1.0 / self.rate
+        return send_at - now
+    
+    def acquire(self):
+        """Block until the current rate allows the next request"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+    
+    def slow_latency(self, latency, ok):
+        """Return the latency above which a request counts as slow, learning the fastest latency from answered requests"""
+        if self.target_latency is not None:
+            return self.target_latency
+        if ok:
+            if self.base_latency is None or latency < self.base_latency:
+                self.base_latency = latency
+            else:
+                self.base_latency += (latency - self.base_latency) * BASE_LATENCY_DRIFT
+        base = latency if self.base_latency is None else self.base_latency
+        return CONGESTION_LATENCY_FACTOR * base + CONGESTION_LATENCY_SLACK
+    
+    def record(self, latency, ok):
+        """Adjust rate and concurrency from the result of one request"""
+        with self.lock:
+            now = time.monotonic()
+            limit = self.slow_latency(latency, ok)
+            if ok and latency <= limit:
+                if self.slow_start:
+                    # Slow start: rate and slots double every second / round trip
+                    self.rate += 1.0
+                    self.window = min(self.max_concurrency, self.window + 1.0)
+                else:
+                    # Additive increase: about +1 req/s per second and +1 slot per round trip
+                    self.rate += 1.0 / self.rate
+                    self.window = min(self.max_concurrency, self.window + 1.0 / self.window)
+                if self.max_rate is not None:
+                    self.rate = min(self.rate, self.max_rate)
+            elif now - self.last_decrease > max(latency, limit):
+                # Multiplicative decrease, at most once per congestion episode
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.window = max(1.0, self.window / 2)
+                self.last_decrease = now
+                self.slow_start = False
+
+class DeleteDispatcher:
+    """Keep a bounded number of delete requests in flight on a thread pool"""
+    
+    # Per-server semaphores, shared by all dispatchers of this process
+    server_slots = {}
+    server_slots_lock = threading.Lock()
+    
+    def __init__(self, delete_func, controller, metrics=None):
+        self.delete_func = delete_func
+        self.controller = controller
+        self.metrics = metrics
+    
+    def get_server_slots(self, server):
+        """Return the semaphore limiting concurrent requests to the given server"""
+        with self.server_slots_lock:
+            if server not in self.server_slots:
+                self.server_slots[server] = threading.BoundedSemaphore(MAX_REQUESTS_PER_SERVER)
+            return self.server_slots[server]
+    
+    def send(self, server, url):
+        """Send one delete request within the server's concurrency limit and the controller's rate"""
+        with self.get_server_slots(server):
+            waited = time.monotonic()
+            self.controller.acquire()
+            started = time.monotonic()
+            ok = self.delete_func(url)
+            latency = time.monotonic() - started
+            self.controller.record(latency, ok)
+        if self.metrics:
+            self.metrics.record_delete(latency, ok, started - waited)
+        return ok
+    
+    def run(self, jobs, on_result, should_continue=lambda: True, before_send=lambda: True):
+        """
+        Dispatch (server, url, key) jobs and call on_result(key, ok) as they complete.
+        on_result may return follow-up jobs, they are sent before the next new job. A
+        failed job with follow-ups is not a failure, the follow-ups take its place.
+        before_send() is called once for every batch of jobs taken to fill the in-flight
+        window, before any of them is sent, the batch is dropped if it returns False.
+        Stops submitting new jobs when should_continue() is False or after the first
+        failure. Returns True if all jobs succeeded.
+        """
+        jobs = iter(jobs)
+        followups = deque()
+        pending = {}
+        failed = False
+        with ThreadPoolExecutor(max_workers=self.controller.max_concurrency) as executor:
+            while True:
+                # Fill up the in-flight window allowed by the controller
+                batch = []
+                while len(pending) + len(batch) < self.controller.concurrency and not failed and should_continue():
+                    job = followups.popleft() if followups else next(jobs, None)
+                    if job is None:
+                        break
+                    batch.append(job)
+                if batch and not before_send():
+                    failed = True
+                    batch = []
+                for server, url, key in batch:
+                    pending[executor.submit(self.send, server, url)] = key
+                
+                if not pending:
+                    break
+                
+                # Report results as they complete
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = pending.pop(future)
+                    ok = future.result()
+                    more = on_result(key, ok)
+                    if more:
+                        followups.extend(more)
+                    elif not ok:
+                        failed = True
+        return not failed
+
+def is_valid_ip_or_domain(value):
+    """Check if the value is a valid IP address or domain name"""
+    ip_pattern = r"\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b"
+    domain_pattern = r"^(?:(?!-)[A-Za-z0-9-]{1,63}(?<!-)\.)+[A-Za-z]{2,6}$"
+    return bool(re.match(ip_pattern, value) or re.match(domain_pattern, value))
+
+def is_valid_uuid(value):
+    """
+    Robuste Überprüfung, ob der Wert eine gültige UUID ist.
+    Verwendet sowohl Regex-Muster als auch die uuid-Bibliothek für maximale Sicherheit.
+    """
+    # Regex-Muster für UUID-Format
+    uuid_pattern = r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'
+    
+    # Erste Überprüfung mit Regex
+    if not re.match(uuid_pattern, value):
+        return False
+    
+    # Zweite Überprüfung mit der uuid-Bibliothek
+    try:
+        # Versuche, den String in ein UUID-Objekt zu konvertieren
+        uuid_obj = uuid_lib.UUID(value)
+        # Überprüfe, ob die String-Repräsentation mit dem Original übereinstimmt
+        return str(uuid_obj) == value.lower()
+    except ValueError:
+        # Wenn die Konvertierung fehlschlägt, ist es keine gültige UUID
+        return False
+
+def convert_to_timestamp(value):
+    """Convert a date string to UNIX timestamp or validate existing timestamp"""
+    # Check if it's already a timestamp
+    if value.isdigit():
+        return int(value)
+    
+    # Try to convert from date format
+    try:
+        dt = datetime.strptime(value, "%d.%m.%Y %H:%M")
+        timestamp = int((dt - datetime(1970, 1, 1)).total_seconds() * 1000)
+        return timestamp
+    except ValueError:
+        return None
+
+def format_timestamp(timestamp):
+    """Format a UNIX timestamp in milliseconds as dd.MM.yyyy HH:mm (UTC)"""
+    return datetime.fromtimestamp(timestamp / 1000, timezone.utc).strftime("%d.%m.%Y %H:%M")
+
+def clean_packet_size(average, max_value, bound):
+    """
+    Largest weight factor a packet with the given average may have and still be
+    proven free of values beyond the threshold, assuming no value lies beyond bound
+    on the other side (no value below bound for positive thresholds, none above it
+    for negative ones). The middleware averages sensor values weighted by the time
+    since the value before, a value weighing at least 1/factor of the packet is at
+    most factor * average - (factor - 1) * bound. The factor is the packet duration
+    divided by the smallest time between two values, for plain averages of n values
+    it is n (never more than the duration factor).
+    """
+    if max_value >= 0:
+        headroom, spread = max_value - bound, average - bound
+    else:
+        headroom, spread = bound - max_value, bound - average
+    if headroom < 0 or spread < 0:
+        # Threshold inside the bound or average outside of it, nothing can be proven
+        return 0
+    if spread == 0:
+        return math.inf
+    return headroom / spread
+
+class DeletionEngine:
+    """
+    Fetch values of one channel, find the ones beyond the threshold and delete them.
+    Progress is reported through the log, on_status and on_rate callbacks so the
+    same engine drives the GUI and the command line.
+    """
+    
+    def __init__(self, client=None, log=None, on_status=None, on_rate=None):
+        self.log = log or (lambda message, level="INFO": None)
+        self.on_status = on_status or (lambda message: None)
+        self.on_rate = on_rate or (lambda controller: None)
+        self.client = client or MiddlewareClient(log=self.log)
+        self.processing = False
+        self.deleted_count = 0
+        self.metrics = RunMetrics()
+        self.probe_requests = 0
+        self.cache = None
+        self.db = None
+        self.db_channel = None
+        self.aggregates = None
+        self.archive = None
+        self.archive_failed = False
+    
+    def stop(self):
+        """Ask a running process to stop after the requests in flight"""
+        self.processing = False
+    
+    def get_json_data(self, url):
+        """Fetch JSON data from the given URL"""
+        try:
+            started = time.perf_counter()
+            response = self.client.get(url, on_retry=self.metrics.count_retry)
+            if response.status_code == 200:
+                parsing = time.perf_counter()
+                self.metrics.add(fetch_requests=1, fetch_seconds=parsing - started, bytes_fetched=len(response.content))
+                data = response.json()
+                self.metrics.add(parse_seconds=time.perf_counter() - parsing)
+                return data
+            else:
+                self.log(f"Failed to fetch data: HTTP {response.status_code}", "ERROR")
+                return None
+        except Exception as e:
+            self.log(f"Error fetching JSON data: {str(e)}", "ERROR")
+            return None
+    
+    def iter_blocks(self, server, uuid_value, start_time, end_time, window_ms, last_timestamp=None, on_window=None):
+        """
+        Stream the range as (timestamps, values) blocks of typed arrays, one time window
+        at a time. Tuples up to last_timestamp are skipped, on_window(window_end, last_timestamp)
+        is called after every complete window.
+        """
+        window_start = start_time
+        while window_start < end_time and self.processing:
+            window_end = min(window_start + window_ms, end_time)
+            url = f"http://{server}/data/{uuid_value}.json?from={window_start}&to={window_end}"
+            self.on_status(f"Scanning: {format_timestamp(window_start)}")
+            
+            attempt = 0
+            while True:
+                started = time.perf_counter()
+                response = self.client.get(url, stream=True, on_retry=self.metrics.count_retry)
+                self.metrics.add(fetch_requests=1, fetch_seconds=time.perf_counter() - started)
+                try:
+                    if response.status_code != 200:
+                        raise IOError(f"Failed to fetch data: HTTP {response.status_code}")
+                    
+                    for timestamps, values in iter_json_blocks(self.iter_chunks(response), self.metrics):
+                        # Windows share their boundary and retried windows start over, skip tuples already seen
+                        if last_timestamp is not None and timestamps[0] <= last_timestamp:
+                            first = bisect.bisect_right(timestamps, last_timestamp)
+                            timestamps, values = timestamps[first:], values[first:]
+                            if not timestamps:
+                                continue
+                        last_timestamp = timestamps[-1]
+                        yield timestamps, values
+                    break
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                    # Connection dropped mid-stream, fetch the window again
+                    if attempt >= self.client.retries:
+                        raise
+                    delay = self.client.backoff_delay(attempt)
+                    self.log(f"Window download interrupted ({str(e)}), retry {attempt + 1}/{self.client.retries} in {delay:.1f}s", "WARNING")
+                    self.metrics.count_retry()
+                    time.sleep(delay)
+                    attempt += 1
+                finally:
+                    response.close()
+            
+            if on_window:
+                on_window(window_end, last_timestamp)
+            window_start = window_end
+    
+    def iter_chunks(self, response):
+        """Yield the body of a streamed response as text, timing and counting the download"""
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        chunks = response.iter_content(chunk_size=65536)
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            self.metrics.add(fetch_seconds=time.perf_counter() - started, bytes_fetched=len(chunk))
+            yield decoder.decode(chunk)
+    
+    def probe(self, server, uuid_value, start_time, end_time, max_value, bound, interval, packets=PROBE_PACKETS):
+        """
+        Ask the middleware for the range packed into a few packets of averages and yield
+        the (from, to) parts that cannot be proven clean, probing big packets deeper.
+        interval is the smallest time in ms between two values of the channel.
+        """
+        if not self.processing:
+            return
+        self.probe_requests += 1
+        data = self.get_json_data(f"http://{server}/data/{uuid_value}.json?from={start_time}&to={end_time}&tuples={packets}")
+        if data is None or "data" not in data:
+            raise IOError("Probe request failed")
+        
+        packet_start = None
+        for entry in data["data"].get("tuples", []):
+            packet_end = min(int(entry[0]), end_time)
+            count = entry[2] if len(entry) > 2 else None
+            limit = 0
+            # The first packet is weighted from the value before the range, its duration is unknown
+            if packet_start is not None and entry[1] is not None and count:
+                factor = (packet_end - packet_start) / interval
+                # Values closer together than the interval break the bound, prove nothing
+                if count <= factor + 1:
+                    limit = clean_packet_size(float(entry[1]), max_value, bound)
+            if packet_start is None:
+                packet_start = start_time
+            
+            if count and limit and factor <= limit:
+                # Provably clean, skip the raw values
+                pass
+            elif not count or count <= PROBE_LEAF_ROWS:
+                yield packet_start, packet_end
+            else:
+                # Aim for child packets half the size that could be proven clean
+                children = math.ceil(2 * factor / limit) if limit else PROBE_PACKETS
+                if children >= count // 2:
+                    yield packet_start, packet_end
+                else:
+                    yield from self.probe(server, uuid_value, packet_start, packet_end, max_value, bound, interval,
+                                          min(PROBE_MAX_PACKETS, children))
+            packet_start = packet_end
+    
+    def iter_probed_blocks(self, server, uuid_value, start_time, end_time, max_value, bound, interval, window_ms,
+                           last_timestamp=None, on_window=None):
+        """
+        Like iter_blocks, but only fetch the raw values of the parts a coarse probe
+        cannot prove clean. None is yielded for every skipped part, it stands for
+        good values between two raw parts.
+        """
+        position = start_time
+        pending = None
+        ranges = self.probe(server, uuid_value, start_time, end_time, max_value, bound, interval)
+        while True:
+            # Merge adjacent suspicious packets into one raw range
+            part = next(ranges, None)
+            if part is not None and pending is not None and part[0] <= pending[1]:
+                pending = (pending[0], part[1])
+                continue
+            if pending is not None:
+                if pending[0] > position:
+                    yield None
+                for block in self.iter_blocks(server, uuid_value, pending[0], pending[1], window_ms, last_timestamp):
+                    last_timestamp = block[0][-1]
+                    yield block
+                position = pending[1]
+                if on_window and self.processing:
+                    on_window(position, last_timestamp)
+            if part is None:
+                break
+            pending = part
+        
+        if position < end_time and self.processing:
+            yield None
+            if on_window:
+                on_window(end_time, last_timestamp)
+    
+    def iter_cached_blocks(self, server, uuid_value, start_time, end_time, window_ms, last_timestamp=None, on_window=None):
+        """
+        Like iter_blocks, but serve the range from the local cache. Only the parts not
+        covered yet are fetched, they are added to the cache window by window. The most
+        recent values are never cached, they are scanned straight from the download.
+        """
+        cache = self.cache
+        recent = []
+        for gap_start, gap_end in cache.missing(start_time, end_time):
+            self.log(f"Fetching {format_timestamp(gap_start)} - {format_timestamp(gap_end)} into the cache", "INFO")
+            timestamps, values = array.array("q"), array.array("d")
+            stored_to = gap_start
+            
+            def store(window_end, window_last_timestamp):
+                nonlocal stored_to
+                stored_end = cache.store(stored_to, window_end, timestamps, values)
+                first = bisect.bisect_right(timestamps, stored_end)
+                if first < len(timestamps):
+                    recent.append((timestamps[first:], values[first:]))
+                del timestamps[:]
+                del values[:]
+                stored_to = window_end + 1
+            
+            for block in self.iter_blocks(server, uuid_value, gap_start, gap_end, window_ms, on_window=store):
+                timestamps.extend(block[0])
+                values.extend(block[1])
+        
+        if not self.processing:
+            return
+        if last_timestamp is not None:
+            start_time = max(start_time, last_timestamp + 1)
+        for block in cache.blocks(start_time, end_time, PIPELINE_BATCH_ROWS):
+            last_timestamp = block[0][-1]
+            yield block
+        for timestamps, values in recent:
+            first = bisect.bisect_left(timestamps, start_time)
+            if first < len(timestamps):
+                last_timestamp = timestamps[-1]
+                yield timestamps[first:], values[first:]
+        if on_window:
+            on_window(end_time, last_timestamp)
+    
+    def iter_db_blocks(self, params, start_time, last_timestamp=None, on_window=None, offenders_only=False):
+        """
+        Like iter_blocks, but read the rows straight from the database, DB_PAGE_ROWS at a
+        time. With offenders_only the database selects only the values beyond the threshold
+        or band, every one of them comes as its own block after a None (values in between unknown).
+        """
+        end_time = params["end_time"]
+        max_value = params["max_value"]
+        min_value = params.get("min_value")
+        above = below = None
+        if offenders_only:
+            if min_value is not None:
+                above, below = max_value, min_value
+            elif max_value >= 0:
+                above = max_value
+            else:
+                below = max_value
+        
+        position = start_time - 1 if last_timestamp is None else max(start_time - 1, last_timestamp)
+        while self.processing:
+            self.on_status(f"Scanning: {format_timestamp(position + 1)}")
+            started = time.perf_counter()
+            timestamps, values = self.db.select(self.db_channel, position, end_time, DB_PAGE_ROWS, above, below)
+            self.metrics.add(fetch_requests=1, fetch_seconds=time.perf_counter() - started, tuples_parsed=len(timestamps))
+            if not timestamps:
+                break
+            position = timestamps[-1]
+            if offenders_only:
+                for index in range(len(timestamps)):
+                    yield None
+                    yield timestamps[index:index + 1], values[index:index + 1]
+            else:
+                yield timestamps, values
+            if len(timestamps) < DB_PAGE_ROWS:
+                break
+            if on_window:
+                on_window(position, position)
+        
+        if on_window and self.processing:
+            on_window(end_time, position if position >= start_time else last_timestamp)
+    
+    def archive_values(self, entries, sync=True):
+        """
+        Archive (timestamp, value, ...) entries before deleting them, False (logged) if that failed.
+        With sync=False they are only queued, sync_archive() must succeed before their deletes are sent.
+        """
+        if self.archive is None:
+            return True
+        self.archive.add(entries)
+        return self.sync_archive() if sync else True
+    
+    def sync_archive(self):
+        """Write the queued archive records to disk, False (logged) if that failed"""
+        if self.archive is None:
+            return True
+        try:
+            self.archive.sync()
+            return True
+        except OSError as e:
+            self.log(f"Cannot write archive {self.archive.path}: {str(e)}. Not deleting without a copy.", "ERROR")
+            self.archive_failed = True
+            return False
+    
+    def cancel_archived(self, timestamps):
+        """Mark archived values whose delete failed as present again, written with the next sync"""
+        if self.archive is not None:
+            self.archive.cancel(timestamps)
+    
+    def close_archive(self, archive):
+        """Write the queued records of the archive and close it"""
+        try:
+            archive.close()
+        except OSError as e:
+            self.log(f"Cannot write archive {archive.path}: {str(e)}", "WARNING")
+    
+    def restore_archive(self, params, result):
+        """
+        Add the archived values of the channel back, RESTORE_BATCH values per POST request
+        or, with the database backend, per insert transaction. Restored values are marked
+        in the archive, so restoring again does not add them twice. Returns False on errors.
+        """
+        result["restored"] = 0
+        if not params.get("archive"):
+            self.log("Restore needs the archive directory", "ERROR")
+            return False
+        archive = DeleteArchive(params["archive"], params["uuid"])
+        try:
+            timestamps, values = archive.load(params.get("start_time"), params.get("end_time"))
+        except (OSError, ValueError) as e:
+            self.log(f"Cannot read archive {archive.path}: {str(e)}", "ERROR")
+            return False
+        self.log(f"Restoring {len(timestamps)} values from {archive.path}", "INFO")
+        data_url = f"http://{params['server']}/data/{params['uuid']}.json"
+        try:
+            for index in range(0, len(timestamps), RESTORE_BATCH):
+                if not self.processing:
+                    break
+                batch_timestamps = timestamps[index:index + RESTORE_BATCH]
+                batch_values = values[index:index + RESTORE_BATCH]
+                if self.db:
+                    self.db.insert(self.db_channel, batch_timestamps, batch_values)
+                else:
+                    response = self.client.post(data_url, [[timestamp, value] for timestamp, value in zip(batch_timestamps, batch_values)],
+                                                on_retry=self.metrics.count_retry)
+                    if response.status_code != 200:
+                        self.log(f"Failed to restore values from {batch_timestamps[0]} to {batch_timestamps[-1]}: HTTP {response.status_code}", "ERROR")
+                        return False
+                archive.cancel(batch_timestamps)
+                archive.sync()
+                if self.aggregates:
+                    self.aggregates.add(batch_timestamps)
+                result["restored"] += len(batch_timestamps)
+                self.log(f"Restored {len(batch_timestamps)} values from {batch_timestamps[0]} to {batch_timestamps[-1]}", "SUCCESS")
+                self.on_status(f"Restored: {result['restored']} / {len(timestamps)}")
+        except Exception as e:
+            self.log(f"Error restoring values: {str(e)}", "ERROR")
+            return False
+        finally:
+            self.close_archive(archive)
+            if result["restored"]:
+                self.drop_cache(params)
+        self.log(f"Total entries restored: {result['restored']}", "INFO")
+        return True
+    
+    def drop_cache(self, params):
+        """Delete the local cache of the channel given in params, it lists restored values as removed"""
+        if not params.get("cache") or self.db:
+            return
+        cache = ChannelCache(params["cache"], params["server"], params["uuid"])
+        cache.clear()
+        self.log(f"Dropped the cache {cache.path}, the next cached scan fetches the channel again", "INFO")
+    
+    def open_db(self, params):
+        """Connect to the database given in params and look up the channel, False on errors"""
+        try:
+            self.db = VolkszaehlerDatabase(params["db"])
+            self.db_channel = self.db.channel_id(params["uuid"])
+        except Exception as e:
+            self.log(f"Cannot use database {describe_db(params['db'])}: {str(e)}", "ERROR")
+            self.close_db()
+            return False
+        self.log(f"Database: {describe_db(params['db'])}, channel id {self.db_channel}", "INFO")
+        return True
+    
+    def close_db(self):
+        """Close the database connection of the run"""
+        if self.db:
+            try:
+                self.db.close()
+            except Exception:
+                pass
+        self.db = None
+        self.db_channel = None
+    
+    def open_cache(self, params):
+        """Load the local cache of the channel given in params, None without cache"""
+        if not params.get("cache"):
+            return None
+        cache = ChannelCache(params["cache"], params["server"], params["uuid"])
+        try:
+            cache.load()
+        except (OSError, ValueError, KeyError) as e:
+            self.log(f"Cannot read cache {cache.path}: {str(e)}. Starting a new one.", "WARNING")
+            cache.clear()
+        if params.get("refresh_cache"):
+            cache.clear()
+        self.log(f"Cache: {cache.rows} values, {len(cache.missing(params['start_time'], params['end_time']))} parts of the range to fetch", "INFO")
+        return cache
+    
+    def delete_data(self, url):
+        """Delete data using the given URL"""
+        try:
+            response = self.client.get(url, on_retry=self.metrics.count_retry)
+            if response.status_code == 200:
+                return True
+            else:
+                self.log(f"Failed to delete data: HTTP {response.status_code}", "ERROR")
+                return False
+        except Exception as e:
+            self.log(f"Error deleting data: {str(e)}", "ERROR")
+            return False
+    
+    def run(self, params):
+        """
+        Process data deletion based on the given parameters and return a summary dict.
+        params: server, uuid, start_time, end_time, max_value (float) and optionally
+        min_value (float, deletes values outside min_value .. max_value instead),
+        mode, window_ms, concurrency, max_rate, range_delete, journal (path), resume,
+        probe with probe_bound and probe_interval (ms), cache (directory) with refresh_cache, rules (list of
+        rule texts, see vz_detect), shards (parts of the range scanned at the same time), async_io,
+        pipeline (default True), dry_run with plan_out (path), or plan_in (path) to execute a plan,
+        db (database URL, see vz_db) with reaggregate and aggregate_types (level name: aggregate.type),
+        archive (directory the deleted values are archived in first), restore to add the archived
+        values of the channel (from start_time to end_time if given) back instead of deleting.
+        """
+        plan_runs = None
+        if params.get("plan_in"):
+            try:
+                plan_params, plan_runs, summary = read_plan(params["plan_in"])
+            except (OSError, ValueError, KeyError) as e:
+                self.log(f"Cannot read plan {params['plan_in']}: {str(e)}", "ERROR")
+                return {"status": "failed", "deleted": 0, "error": str(e)}
+            params = dict(params, mode=MODE_SCAN, **plan_params)
+            self.log(f"Executing plan {params['plan_in']}: {summary['offenders']} values in {summary['runs']} runs", "INFO")
+        
+        server = params["server"]
+        uuid_value = params["uuid"]
+        start_time = params["start_time"]
+        end_time = params["end_time"]
+        max_value = params["max_value"]
+        min_value = params.get("min_value")
+        mode = params.get("mode", MODE_SCAN)
+        max_rate = params.get("max_rate")
+        
+        base_url = f"http://{server}/data/{uuid_value}.json?from={start_time}&to={end_time}"
+        self.processing = True
+        self.deleted_count = 0
+        self.metrics = RunMetrics()
+        self.probe_requests = 0
+        started = time.monotonic()
+        result = {
+            "server": server,
+            "uuid": uuid_value,
+            "from": start_time,
+            "to": end_time,
+            "max_value": max_value,
+            "min_value": min_value,
+            "mode": mode,
+            "dry_run": bool(params.get("dry_run")),
+            "scanned": 0,
+            "offenders": 0,
+            "runs": 0,
+            "deleted": 0,
+            "status": "completed",
+        }
+        
+        if params.get("restore"):
+            self.log("Starting restore of archived values...", "INFO")
+        else:
+            self.log("Starting data deletion process...", "INFO")
+            self.log(f"Using URL: {base_url}", "INFO")
+            if min_value is None:
+                self.log(f"Max value threshold: {max_value}", "INFO")
+            else:
+                self.log(f"Band: deleting values below {min_value} or above {max_value}", "INFO")
+            self.log(f"Rate ceiling: {max_rate or 'none'}", "INFO")
+            self.log(f"Mode: {mode}", "INFO")
+        
+        if params.get("db"):
+            result["db"] = describe_db(params["db"])
+            if mode == MODE_MAX_LOOP:
+                self.log("The database backend always scans, Max Loop is not used", "WARNING")
+                mode = result["mode"] = MODE_SCAN
+            if params.get("cache"):
+                self.log("The database backend reads the database directly, the cache is not used", "WARNING")
+                params = dict(params, cache=None)
+            if not self.open_db(params):
+                result.update(status="failed", deleted=0, error="database not available")
+                self.processing = False
+                return result
+            if params.get("reaggregate"):
+                if not self.db.supports_window_functions():
+                    self.log("Re-aggregation needs window functions (MySQL 8, MariaDB 10.2 or SQLite 3.25 or newer). Nothing deleted.", "ERROR")
+                    self.close_db()
+                    result.update(status="failed", deleted=0, error="database without window functions")
+                    self.processing = False
+                    return result
+                self.aggregates = AggregateTracker(params.get("aggregate_types") or DEFAULT_AGGREGATE_TYPES)
+        elif params.get("reaggregate"):
+            self.log("Re-aggregation needs the database backend, aggregates are not updated", "WARNING")
+        
+        self.archive_failed = False
+        if params.get("archive") and not params.get("dry_run") and not params.get("restore"):
+            self.archive = DeleteArchive(params["archive"], uuid_value)
+            self.log(f"Archiving deleted values in {self.archive.path}", "INFO")
+        
+        # A restore drops the cache of the channel instead of reading it
+        self.cache = None if params.get("restore") else self.open_cache(params)
+        if params.get("restore"):
+            ok = self.restore_archive(params, result)
+        elif mode == MODE_MAX_LOOP:
+            controller = RateController(max_rate, max_concurrency=1)
+            ok = self.process_max_loop(server, uuid_value, base_url, max_value, controller, min_value)
+        elif plan_runs is not None:
+            controller = RateController(max_rate, max_concurrency=params.get("concurrency", 4))
+            result.update(offenders=sum(len(run) for run in plan_runs), runs=len(plan_runs))
+            ok = self.delete_runs(params, plan_runs, controller)
+        else:
+            window_ms = params.get("window_ms", DEFAULT_WINDOW_MS)
+            self.log(f"Scan window: {window_ms // 60000} min", "INFO")
+            controller = RateController(max_rate, max_concurrency=params.get("concurrency", 4))
+            unsupported = [key for key in ASYNC_UNSUPPORTED if params.get(key)]
+            if params.get("async_io") and unsupported:
+                self.log(f"Async I/O does not support {', '.join(unsupported)}, using the regular scan", "WARNING")
+            if params.get("async_io") and not unsupported:
+                ok = self.process_async_scan(params, controller, result)
+            else:
+                ok = self.process_single_scan(params, controller, result)
+        
+        if self.cache:
+            try:
+                self.cache.save()
+            except OSError as e:
+                self.log(f"Cannot write cache {self.cache.path}: {str(e)}", "WARNING")
+            self.cache.close()
+            self.cache = None
+        if self.aggregates:
+            # Deletes are committed even if the run failed or was stopped
+            ok = self.reaggregate(params, result) and ok
+            self.aggregates = None
+        self.close_db()
+        if self.archive:
+            self.close_archive(self.archive)
+            self.archive = None
+        
+        if not ok:
+            result["status"] = "failed"
+        elif not self.processing:
+            result["status"] = "stopped"
+        result["deleted"] = self.deleted_count
+        result["elapsed"] = round(time.monotonic() - started, 3)
+        result["metrics"] = self.metrics.summary()
+        result["fetched_bytes"] = result["metrics"]["bytes_fetched"]
+        
+        if not params.get("restore"):
+            self.log(f"Total entries deleted: {self.deleted_count}", "INFO")
+        self.processing = False
+        return result
+    
+    def open_journal(self, params):
+        """
+        Open the journal given in params. Returns (journal, state) where state is the
+        progress read back for a resumed run, (None, None) without journal or on errors.
+        """
+        path = params.get("journal")
+        if not path:
+            return None, None
+        if not params.get("resume"):
+            return RunJournal(path, params), None
+        
+        try:
+            state = read_journal(path)
+        except OSError as e:
+            self.log(f"Cannot read journal {path}: {str(e)}", "ERROR")
+            return None, None
+        if not state.matches(params):
+            self.log("Journal belongs to a different server, channel, range or threshold. Not resuming.", "ERROR")
+            return None, None
+        
+        remaining = len(state.remaining_runs(state.runs)) if state.planned else "?"
+        self.log(f"Resuming from journal {path}: scanned up to {state.scanned_to}, runs left: {remaining}", "INFO")
+        return RunJournal(path), state
+    
+    def process_single_scan(self, params, controller, result):
+        """Scan the range once, collect all values beyond the threshold and delete them (or write a plan)"""
+        # A dry run only plans, there is nothing to resume
+        journal, state = (None, None) if params.get("dry_run") else self.open_journal(params)
+        if journal is None and params.get("journal") and not params.get("dry_run"):
+            return False
+        
+        ok = False
+        try:
+            ok = self.plan_and_delete(params, controller, result, journal, state)
+            return ok
+        finally:
+            if journal:
+                journal.end(("completed" if ok else "failed") if self.processing else "stopped")
+    
+    def plan_and_delete(self, params, controller, result, journal, state):
+        """Scan for runs, then write them as plan (dry run) or delete them"""
+        if params.get("pipeline", True) and not params.get("dry_run"):
+            return self.scan_and_delete(params, controller, result, journal, state)
+        
+        runs = self.scan_runs(params, result, journal, state)
+        if runs is None:
+            return False
+        if not self.processing:
+            return True
+        
+        self.log(f"Scanned {result['scanned']} values, found {result['offenders']} exceeding threshold {describe_threshold(params)} in {len(runs)} runs", "INFO")
+        
+        if params.get("dry_run"):
+            try:
+                summary = write_plan(params["plan_out"], params, runs, result["scanned"])
+            except OSError as e:
+                self.log(f"Cannot write plan {params['plan_out']}: {str(e)}", "ERROR")
+                return False
+            self.log(f"Dry run: plan with {summary['offenders']} values in {summary['runs']} runs written to {params['plan_out']}", "SUCCESS")
+            return True
+        
+        # Skip what a previous run already deleted
+        if state is not None and state.deleted:
+            runs = state.remaining_runs(runs)
+            self.deleted_count = result["offenders"] - sum(len(run) for run in runs)
+            self.log(f"Already deleted in previous run: {self.deleted_count}", "INFO")
+        
+        return self.delete_runs(params, runs, controller, journal, result["offenders"])
+    
+    def scan_and_delete(self, params, controller, result, journal, state):
+        """
+        Pipeline: fetcher, detector and deleter run at the same time with bounded
+        queues in between, every run is deleted as soon as the scan closed it.
+        """
+        runs_queue = queue.Queue(PIPELINE_RUNS)
+        end = object()
+        outcome = {"ok": False, "drained": False}
+        
+        def queued_runs():
+            while True:
+                run = runs_queue.get()
+                if run is end:
+                    outcome["drained"] = True
+                    return
+                yield run
+        
+        def delete_stage():
+            outcome["ok"] = self.delete_runs(params, queued_runs(), controller, journal, waiting=runs_queue.qsize)
+            if not outcome["ok"]:
+                # Stop the scan, there is no point in finding more values
+                self.stop()
+            # Drain the queue so the scan never blocks on a finished deleter
+            while not outcome["drained"]:
+                outcome["drained"] = runs_queue.get() is end
+        
+        deleter = threading.Thread(target=delete_stage, daemon=True)
+        deleter.start()
+        runs = None
+        try:
+            # Runs found by a previous run, without what it already deleted
+            if state is not None:
+                remaining = state.remaining_runs(state.runs)
+                self.deleted_count = sum(len(run) for run in state.runs) - sum(len(run) for run in remaining)
+                if self.deleted_count:
+                    self.log(f"Already deleted in previous run: {self.deleted_count}", "INFO")
+                for run in remaining:
+                    runs_queue.put(run)
+            
+            runs = self.scan_runs(params, result, journal, state, on_run=runs_queue.put)
+            if runs is not None and self.processing:
+                self.log(f"Scanned {result['scanned']} values, found {result['offenders']} exceeding threshold {describe_threshold(params)} in {len(runs)} runs", "INFO")
+        finally:
+            runs_queue.put(end)
+            deleter.join()
+        return runs is not None and outcome["ok"]
+    
+    def scan_runs(self, params, result, journal=None, state=None, on_run=None):
+        """
+        Stream the range once and group all offending values into runs without good
+        values in between. Returns the runs, None on fetch errors. on_run(run) is
+        called for every run as soon as it is complete.
+        """
+        max_value = params["max_value"]
+        window_ms = params.get("window_ms", DEFAULT_WINDOW_MS)
+        try:
+            detector = build_detector(max_value, params.get("rules"), params.get("min_value"))
+        except ValueError as e:
+            self.log(f"Invalid rules: {str(e)}", "ERROR")
+            return None
+        
+        # Restore the scan progress of a resumed run
+        scan_start = params["start_time"]
+        last_timestamp = None
+        scanned = 0
+        runs = []
+        in_run = False
+        if state is not None:
+            runs = list(state.runs)
+            scanned = state.scanned
+            if state.open_run:
+                runs.append(list(state.open_run))
+                in_run = True
+            if state.scanned_to is not None:
+                scan_start = state.scanned_to
+                last_timestamp = state.last_timestamp
+        journaled = len(runs) - (1 if in_run else 0)
+        
+        # The detector classifies block by block, so a window is only checkpointed
+        # once all of its values went through the loop below
+        windows = deque()
+        
+        def checkpoint(window_end, window_last_timestamp):
+            windows.append((window_end, window_last_timestamp))
+        
+        def write_checkpoints(before=None):
+            # Write the runs closed since the last checkpoint and the run still open
+            nonlocal journaled
+            while windows and (before is None or windows[0][1] is None or windows[0][1] < before):
+                window_end, window_last_timestamp = windows.popleft()
+                closed = len(runs) - (1 if in_run else 0)
+                journal.scanned(window_end, window_last_timestamp, scanned, runs[journaled:closed], runs[-1] if in_run else None)
+                journaled = closed
+        
+        shards = min(params.get("shards") or 1, MAX_SHARDS)
+        unsupported = [key for key in SHARD_UNSUPPORTED if params.get(key)]
+        if shards > 1 and unsupported:
+            self.log(f"Sharded scanning does not support {', '.join(unsupported)}, scanning in one piece", "WARNING")
+        elif shards > 1 and detector is not None and detector.context:
+            # Rules looking at neighbouring values would judge the values next to a shard border differently
+            self.log("Sharded scanning does not support rules that look at neighbouring values, scanning in one piece", "WARNING")
+            unsupported = ["rules"]
+        if shards > 1 and not unsupported and (state is None or not state.planned):
+            self.log(f"Scanning in {shards} shards at the same time", "INFO")
+            try:
+                for shard_end, shard_last_timestamp, shard_scanned, shard_runs, starts_bad, ends_bad in \
+                        self.iter_shard_results(params, detector, scan_start, shards, last_timestamp):
+                    if not self.processing:
+                        # The shard may be incomplete, resume scans it again
+                        break
+                    # Join runs across shard borders, a good value in between closes the open run
+                    scanned += shard_scanned
+                    if in_run and shard_scanned and not starts_bad:
+                        if on_run:
+                            on_run(runs[-1])
+                        in_run = False
+                    for index, run in enumerate(shard_runs):
+                        if in_run and index == 0:
+                            runs[-1].extend(run)
+                            continue
+                        if in_run and on_run:
+                            on_run(runs[-1])
+                        runs.append(run)
+                        in_run = True
+                    if in_run and shard_runs and not ends_bad:
+                        if on_run:
+                            on_run(runs[-1])
+                        in_run = False
+                    if shard_last_timestamp is not None:
+                        last_timestamp = shard_last_timestamp
+                    if journal:
+                        closed = len(runs) - (1 if in_run else 0)
+                        journal.scanned(shard_end, last_timestamp, scanned, runs[journaled:closed], runs[-1] if in_run else None)
+                        journaled = closed
+                if in_run and on_run:
+                    on_run(runs[-1])
+            except Exception as e:
+                self.log(f"Error fetching JSON data: {str(e)}", "ERROR")
+                return None
+            if journal and self.processing:
+                journal.planned()
+            result.update(scanned=scanned, offenders=sum(len(run) for run in runs), runs=len(runs), probe_requests=self.probe_requests,
+                          last_timestamp=last_timestamp)
+            return runs
+        
+        if self.db:
+            # Without rules and plans only the offenders are needed, the database finds them
+            offenders_only = detector is None and not params.get("dry_run")
+            if params.get("probe"):
+                self.log("The database backend selects the values beyond the threshold itself, not probing", "INFO")
+            blocks = self.iter_db_blocks(params, scan_start, last_timestamp, checkpoint if journal else None, offenders_only)
+        elif self.cache:
+            blocks = self.iter_cached_blocks(params["server"], params["uuid"], scan_start, params["end_time"], window_ms,
+                                             last_timestamp, checkpoint if journal else None)
+        elif params.get("probe") and detector is None and params.get("min_value") is None and params.get("probe_interval"):
+            bound, interval = params.get("probe_bound", 0.0), params["probe_interval"]
+            self.log(f"Probing with packed averages, assuming no value {'below' if max_value >= 0 else 'above'} {bound} "
+                     f"and at least {interval / 1000:g} s between two values", "INFO")
+            blocks = self.iter_probed_blocks(params["server"], params["uuid"], scan_start, params["end_time"], max_value, bound,
+                                             interval, window_ms, last_timestamp, checkpoint if journal else None)
+        else:
+            if params.get("probe") and (detector is not None or params.get("min_value") is not None):
+                self.log("Probe skipped: it only proves a one-sided threshold, not bands or other rules. Scanning all values.", "WARNING")
+            elif params.get("probe"):
+                self.log("Probe skipped: the middleware averages packets weighted by time, bounding them needs the smallest "
+                         "time between two values of the channel (probe interval). Scanning all values.", "WARNING")
+            blocks = self.iter_blocks(params["server"], params["uuid"], scan_start, params["end_time"], window_ms,
+                                      last_timestamp, checkpoint if journal else None)
+        
+        if params.get("pipeline", True):
+            blocks = iter_prefetched(blocks)
+        
+        if detector is not None:
+            self.log(f"Rules: {', '.join(params['rules'])}", "INFO")
+            classified = detector.iter_classified(blocks)
+        else:
+            classified = iter_threshold(blocks, max_value, params.get("min_value"))
+        
+        if state is None or not state.planned:
+            try:
+                for block in classified:
+                    if block is None:
+                        # Skipped clean part, good values in between
+                        if in_run and on_run:
+                            on_run(runs[-1])
+                        in_run = False
+                        continue
+                    timestamps, values, offenders = block
+                    if not timestamps:
+                        continue
+                    if windows:
+                        write_checkpoints(before=timestamps[0])
+                    scanned += len(timestamps)
+                    last_timestamp = timestamps[-1]
+                    # A run open at the start of the block goes on if its first value is bad
+                    previous = -1
+                    for index, reason in offenders:
+                        if in_run and index != previous + 1:
+                            if on_run:
+                                on_run(runs[-1])
+                            in_run = False
+                        if in_run:
+                            runs[-1].append((timestamps[index], values[index], reason))
+                        else:
+                            runs.append([(timestamps[index], values[index], reason)])
+                            in_run = True
+                        previous = index
+                    if in_run and previous != len(timestamps) - 1:
+                        if on_run:
+                            on_run(runs[-1])
+                        in_run = False
+                if windows:
+                    write_checkpoints()
+                if in_run and on_run:
+                    on_run(runs[-1])
+            except Exception as e:
+                self.log(f"Error fetching JSON data: {str(e)}", "ERROR")
+                return None
+            if journal and self.processing:
+                journal.planned()
+        
+        result.update(scanned=scanned, offenders=sum(len(run) for run in runs), runs=len(runs), probe_requests=self.probe_requests,
+                      last_timestamp=last_timestamp)
+        return runs
+    
+    def iter_shard_results(self, params, detector, start_time, shards, last_timestamp=None):
+        """
+        Split the range from start_time into shards of equal time, fetch and classify them
+        on a thread pool and yield (shard_end, last_timestamp, scanned, runs, starts_bad,
+        ends_bad) for every shard in time order. Only rules without context rows may be used,
+        they judge every value on its own.
+        Only the network waits of the shards overlap, decoding and classifying hold the GIL.
+        """
+        end_time = params["end_time"]
+        bounds = [start_time + (end_time - start_time) * index // shards for index in range(shards + 1)]
+        cancelled = threading.Event()
+        with ThreadPoolExecutor(max_workers=shards) as executor:
+            # Every shard after the first starts behind the border, the previous one includes it
+            futures = [executor.submit(self.scan_shard, params, detector, bounds[index] + (1 if index else 0), bounds[index + 1],
+                                       bounds[index] if index else last_timestamp, cancelled)
+                       for index in range(shards) if bounds[index] < bounds[index + 1]]
+            try:
+                for future in futures:
+                    shard_end, *shard_result = future.result()
+                    yield (shard_end, *shard_result)
+            finally:
+                cancelled.set()
+    
+    def scan_shard(self, params, detector, start_time, end_time, last_timestamp, cancelled):
+        """
+        Fetch and classify one shard on its own. Returns (end_time, last_timestamp, scanned,
+        runs, starts_bad, ends_bad), starts_bad and ends_bad tell if the first and the last
+        value of the shard are bad, so runs across shard borders can be joined.
+        """
+        def blocks():
+            for block in self.iter_blocks(params["server"], params["uuid"], start_time, end_time,
+                                          params.get("window_ms", DEFAULT_WINDOW_MS), last_timestamp):
+                if cancelled.is_set():
+                    return
+                yield block
+        
+        if detector is not None:
+            classified = detector.iter_classified(blocks())
+        else:
+            classified = iter_threshold(blocks(), params["max_value"], params.get("min_value"))
+        
+        scanned = 0
+        runs = []
+        in_run = False
+        starts_bad = False
+        for timestamps, values, offenders in classified:
+            if not timestamps:
+                continue
+            previous = -1
+            for index, reason in offenders:
+                if in_run and index == previous + 1:
+                    runs[-1].append((timestamps[index], values[index], reason))
+                else:
+                    runs.append([(timestamps[index], values[index], reason)])
+                    in_run = True
+                    starts_bad = starts_bad or scanned + index == 0
+                previous = index
+            in_run = in_run and previous == len(timestamps) - 1
+            scanned += len(timestamps)
+            last_timestamp = timestamps[-1]
+        return end_time, last_timestamp, scanned, runs, starts_bad, in_run
+    
+    def delete_runs(self, params, runs, controller, journal=None, total=None, waiting=None):
+        """
+        Delete the planned runs, with range requests where possible. Returns False on failed deletes.
+        Runs already there are archived together, up to ARCHIVE_BATCH values with one sync. For runs
+        still coming in, waiting() returns how many can be taken without blocking.
+        """
+        if self.db:
+            return self.delete_db_runs(runs, controller, journal, total)
+        server = params["server"]
+        uuid_value = params["uuid"]
+        if total is None and isinstance(runs, list):
+            total = sum(len(run) for run in runs)
+        dispatcher = DeleteDispatcher(self.delete_data, controller, self.metrics)
+        data_url = f"http://{server}/data/{uuid_value}.json"
+        range_refused = [not params.get("range_delete", True)]
+        # Archived values whose deletes were not answered yet
+        unsent = {}
+        
+        def count_deleted(count):
+            self.deleted_count += count
+            self.on_status(f"Deleted: {self.deleted_count} / {total}" if total is not None else f"Deleted: {self.deleted_count}")
+            self.on_rate(controller)
+        
+        def single_jobs(run):
+            for entry in run:
+                yield server, f"{data_url}?operation=delete&ts={entry[0]}", (False, entry)
+        
+        def batches():
+            remaining = iter(runs)
+            for run in remaining:
+                batch = [run]
+                size = len(run)
+                while size < ARCHIVE_BATCH and (waiting is None or waiting() > 0):
+                    run = next(remaining, None)
+                    if run is None:
+                        break
+                    batch.append(run)
+                    size += len(run)
+                yield batch
+        
+        def batch_jobs(batch):
+            for run in batch:
+                first, last = run[0][0], run[-1][0]
+                if len(run) == 1:
+                    self.log(f"Found value exceeding threshold: [{first}, {run[0][1]}]", "WARNING")
+                    yield from single_jobs(run)
+                elif range_refused[0]:
+                    # Once the server refused a range delete, every run is deleted value by value as it arrives
+                    self.log(f"Found {len(run)} consecutive values exceeding threshold: [{first} .. {last}], deleting them one by one", "WARNING")
+                    yield from single_jobs(run)
+                else:
+                    self.log(f"Found {len(run)} consecutive values exceeding threshold: [{first} .. {last}]", "WARNING")
+                    yield server, f"{data_url}?operation=delete&from={first}&to={last}", (True, run)
+        
+        def jobs():
+            for batch in batches():
+                # Written by the sync before the first job of the batch is sent
+                entries = [entry for run in batch for entry in run]
+                self.archive_values(entries, sync=False)
+                unsent.update((entry[0], entry) for entry in entries)
+                yield from batch_jobs(batch)
+        
+        def on_result(key, ok):
+            is_range, item = key
+            if is_range and ok:
+                self.log(f"Successfully deleted {len(item)} entries from {item[0][0]} to {item[-1][0]}", "SUCCESS")
+                for entry in item:
+                    unsent.pop(entry[0], None)
+                if journal:
+                    journal.deleted(item[0][0], item[-1][0])
+                if self.cache:
+                    self.cache.remove(item[0][0], item[-1][0])
+                count_deleted(len(item))
+            elif is_range:
+                if not range_refused[0]:
+                    self.log("Range delete refused, falling back to single deletes", "WARNING")
+                    range_refused[0] = True
+                # The values stay archived, their single deletes go out before the next run
+                return list(single_jobs(item))
+            elif ok:
+                unsent.pop(item[0], None)
+                self.log(f"Successfully deleted entry with timestamp {item[0]}", "SUCCESS")
+                if journal:
+                    journal.deleted(item[0], item[0])
+                if self.cache:
+                    self.cache.remove(item[0], item[0])
+                count_deleted(1)
+            else:
+                unsent.pop(item[0], None)
+                self.cancel_archived([item[0]])
+                self.log(f"Failed to delete entry [{item[0]}, {item[1]}]. Stopping process.", "ERROR")
+        
+        ok = dispatcher.run(jobs(), on_result, lambda: self.processing, self.sync_archive)
+        # Values of runs cut short by a stop or a failure were archived but never deleted
+        self.cancel_archived(unsent)
+        if not ok or self.archive_failed:
+            return False
+        if self.processing:
+            self.log("No more values exceeding threshold. Process complete.", "INFO")
+        return True
+    
+    def delete_db_runs(self, runs, controller, journal=None, total=None):
+        """
+        Delete the runs straight in the database, DB_DELETE_BATCH values per transaction.
+        Runs longer than a batch are split. Returns False on failed deletes.
+        """
+        if total is None and isinstance(runs, list):
+            total = sum(len(run) for run in runs)
+        pending = []
+        
+        def commit():
+            timestamps = [entry[0] for _, part in pending for entry in part]
+            if not self.archive_values(entry for _, part in pending for entry in part):
+                return False
+            started = time.perf_counter()
+            try:
+                count = self.db.delete(self.db_channel, timestamps)
+            except Exception as e:
+                self.cancel_archived(timestamps)
+                self.metrics.record_delete(time.perf_counter() - started, False)
+                self.log(f"Failed to delete {len(timestamps)} values from {timestamps[0]} to {timestamps[-1]}: {str(e)}. Stopping process.", "ERROR")
+                return False
+            self.metrics.record_delete(time.perf_counter() - started, True)
+            if self.aggregates:
+                self.aggregates.add(timestamps)
+            self.log(f"Successfully deleted {count} entries from {timestamps[0]} to {timestamps[-1]} in {len(pending)} runs", "SUCCESS")
+            for run, part in pending:
+                if journal and len(part) == len(run):
+                    journal.deleted(run[0][0], run[-1][0])
+                elif journal:
+                    for entry in part:
+                        journal.deleted(entry[0], entry[0])
+            pending.clear()
+            self.deleted_count += len(timestamps)
+            self.on_status(f"Deleted: {self.deleted_count} / {total}" if total is not None else f"Deleted: {self.deleted_count}")
+            self.on_rate(controller)
+            return True
+        
+        size = 0
+        for run in runs:
+            if not self.processing:
+                return True
+            index = 0
+            while index < len(run):
+                part = run[index:index + DB_DELETE_BATCH - size]
+                index += len(part)
+                pending.append((run, part))
+                size += len(part)
+                if size >= DB_DELETE_BATCH:
+                    if not commit():
+                        return False
+                    size = 0
+        if pending and self.processing and not commit():
+            return False
+        if self.processing:
+            self.log("No more values exceeding threshold. Process complete.", "INFO")
+        return True
+    
+    def reaggregate(self, params, result):
+        """Recompute the aggregates of the buckets touched by the deletes, returns False on errors"""
+        tracker = self.aggregates
+        result["reaggregated"] = 0
+        if not tracker.count():
+            return True
+        types = params.get("aggregate_types") or DEFAULT_AGGREGATE_TYPES
+        try:
+            present = self.db.aggregate_types(self.db_channel)
+            summed = "meter" in self.db.entity_type(self.db_channel).lower()
+            levels = [level for level in tracker.levels if types[level] in present]
+            if not summed:
+                # The first value after a bucket is weighted by the time since the value before it, which may be gone
+                for level in levels:
+                    for start, end in sorted(tracker.buckets[level]):
+                        following = self.db.next_timestamp(self.db_channel, end)
+                        if following is not None:
+                            tracker.buckets[level].add(bucket_bounds(level, following))
+            self.log(f"Re-aggregating {', '.join(levels) or 'no levels'} ({sum(len(tracker.buckets[level]) for level in levels)} buckets)", "INFO")
+            for level in levels:
+                for batch in tracker.iter_batches(level):
+                    self.on_status(f"Re-aggregating {level}: {format_timestamp(batch[0][0])}")
+                    self.db.rebuild_aggregates(self.db_channel, types[level], batch, summed)
+                    result["reaggregated"] += len(batch)
+        except Exception as e:
+            self.log(f"Error re-aggregating: {str(e)}. Aggregates of the channel may be stale.", "ERROR")
+            return False
+        self.log(f"Re-aggregated {result['reaggregated']} buckets", "SUCCESS")
+        return True
+    
+    def process_async_scan(self, params, controller, result):
+        """
+        Single scan on the asyncio client: the next window downloads while the
+        values of the current one are deleted, so remote servers are not idle
+        for a round trip after every request.
+        """
+        # vz_async shares the retry policy of this module, import it only when needed
+        from vz_async import AsyncMiddlewareClient
+        client = AsyncMiddlewareClient(timeout=self.client.timeout, retries=self.client.retries, backoff=self.client.backoff,
+                                       pool_size=MAX_REQUESTS_PER_SERVER, log=self.log, on_retry=self.metrics.count_retry)
+        self.log("Using async I/O, fetching ahead while deleting", "INFO")
+        return asyncio.run(self.async_scan(client, params, controller, result))
+    
+    async def async_scan(self, client, params, controller, result):
+        """Fetch the windows one ahead, delete every run as soon as it is complete. Returns False on errors."""
+        server = params["server"]
+        uuid_value = params["uuid"]
+        window_ms = params.get("window_ms", DEFAULT_WINDOW_MS)
+        data_url = f"http://{server}/data/{uuid_value}.json"
+        range_refused = not params.get("range_delete", True)
+        failed = False
+        deletes = set()
+        
+        async def fetch(window_start, window_end):
+            started = time.perf_counter()
+            response = await client.get(f"{data_url}?from={window_start}&to={window_end}")
+            if response.status_code != 200:
+                raise IOError(f"Failed to fetch data: HTTP {response.status_code}")
+            self.metrics.add(fetch_requests=1, fetch_seconds=time.perf_counter() - started, bytes_fetched=len(response.content))
+            return next(iter_json_blocks([response.content.decode("utf-8")], self.metrics), (array.array("q"), array.array("d")))
+        
+        async def send(url):
+            wait = max(0.0, controller.reserve())
+            await asyncio.sleep(wait)
+            started = time.monotonic()
+            try:
+                response = await client.get(url)
+                ok = response.status_code == 200
+                if not ok:
+                    self.log(f"Failed to delete data: HTTP {response.status_code}", "ERROR")
+            except Exception as e:
+                self.log(f"Error deleting data: {str(e)}", "ERROR")
+                ok = False
+            latency = time.monotonic() - started
+            controller.record(latency, ok)
+            self.metrics.record_delete(latency, ok, wait)
+            self.on_rate(controller)
+            return ok
+        
+        async def delete_run(run):
+            nonlocal range_refused, failed
+            # Writes the runs queued since the last sync, this one included
+            if not self.sync_archive():
+                failed = True
+                return
+            first, last = run[0][0], run[-1][0]
+            if len(run) > 1 and not range_refused:
+                self.log(f"Found {len(run)} consecutive values exceeding threshold: [{first} .. {last}]", "WARNING")
+                if await send(f"{data_url}?operation=delete&from={first}&to={last}"):
+                    self.log(f"Successfully deleted {len(run)} entries from {first} to {last}", "SUCCESS")
+                    count_deleted(len(run))
+                    return
+                if not range_refused:
+                    self.log("Range delete refused, falling back to single deletes", "WARNING")
+                    range_refused = True
+            for index, (timestamp, value, reason) in enumerate(run):
+                if failed or not self.processing:
+                    self.cancel_archived(entry[0] for entry in run[index:])
+                    return
+                if len(run) == 1:
+                    self.log(f"Found value exceeding threshold: [{timestamp}, {value}]", "WARNING")
+                if not await send(f"{data_url}?operation=delete&ts={timestamp}"):
+                    self.cancel_archived(entry[0] for entry in run[index:])
+                    self.log(f"Failed to delete entry [{timestamp}, {value}]. Stopping process.", "ERROR")
+                    failed = True
+                    return
+                self.log(f"Successfully deleted entry with timestamp {timestamp}", "SUCCESS")
+                count_deleted(1)
+        
+        def count_deleted(count):
+            self.deleted_count += count
+            self.on_status(f"Deleted: {self.deleted_count} / {result['offenders']}")
+        
+        async def submit(runs):
+            # Queued as one record, the first delete task to start writes it
+            self.archive_values((entry for run in runs for entry in run), sync=False)
+            for run in runs:
+                # Keep at most the allowed number of runs in flight
+                while len(deletes) >= controller.concurrency:
+                    done, _ = await asyncio.wait(deletes, return_when=asyncio.FIRST_COMPLETED)
+                    deletes.difference_update(done)
+                result.update(offenders=result["offenders"] + len(run), runs=result["runs"] + 1)
+                deletes.add(asyncio.ensure_future(delete_run(run)))
+        
+        windows = [(start, min(start + window_ms, params["end_time"])) for start in range(params["start_time"], params["end_time"], window_ms)]
+        last_timestamp = None
+        run = []
+        try:
+            pending = asyncio.ensure_future(fetch(*windows[0])) if windows else None
+            for index, (window_start, window_end) in enumerate(windows):
+                self.on_status(f"Scanning: {format_timestamp(window_start)}")
+                timestamps, values = await pending
+                pending = asyncio.ensure_future(fetch(*windows[index + 1])) if index + 1 < len(windows) else None
+                
+                # Windows share their boundary, skip tuples already seen
+                if last_timestamp is not None:
+                    first = bisect.bisect_right(timestamps, last_timestamp)
+                    timestamps, values = timestamps[first:], values[first:]
+                if timestamps:
+                    last_timestamp = timestamps[-1]
+                
+                # Runs closed in this window, archived and submitted together
+                closed = []
+                for _, _, offenders in iter_threshold([(timestamps, values)], params["max_value"], params.get("min_value")):
+                    result["scanned"] += len(timestamps)
+                    previous = -1
+                    for index, reason in offenders:
+                        if run and index != previous + 1:
+                            closed.append(run)
+                            run = []
+                        run.append((timestamps[index], values[index], reason))
+                        previous = index
+                    if run and previous != len(timestamps) - 1:
+                        closed.append(run)
+                        run = []
+                if closed:
+                    await submit(closed)
+                if failed or not self.processing:
+                    break
+            if run and not failed and self.processing:
+                await submit([run])
+            if pending:
+                pending.cancel()
+        except Exception as e:
+            self.log(f"Error fetching JSON data: {str(e)}", "ERROR")
+            failed = True
+        finally:
+            if deletes:
+                await asyncio.wait(deletes)
+            await client.close()
+        
+        result["last_timestamp"] = last_timestamp
+        if not failed and self.processing:
+            self.log("No more values exceeding threshold. Process complete.", "INFO")
+        return not failed
+    
+    def process_max_loop(self, server, uuid_value, base_url, max_value, controller, min_value=None):
+        """Re-fetch the range after every delete and check only the current max value (and min value for a band)"""
+        while self.processing:
+            json_data = self.get_json_data(base_url)
+            
+            if not json_data or "data" not in json_data or "max" not in json_data["data"] or \
+                    (min_value is not None and "min" not in json_data["data"]):
+                self.log("Invalid JSON data structure or no data found", "ERROR")
+                return False
+            
+            max_entry = json_data["data"]["max"]
+            timestamp = max_entry[0]
+            current_max_value = float(max_entry[1])
+            
+            if min_value is None:
+                self.log(f"Current max value: {current_max_value}, Threshold: {max_value}", "INFO")
+                exceeds = value_exceeds_threshold(current_max_value, max_value)
+            else:
+                # Band: the max against the upper bound, then the min against the lower bound
+                min_entry = json_data["data"]["min"]
+                self.log(f"Current min/max value: {float(min_entry[1])} / {current_max_value}, Band: {min_value} .. {max_value}", "INFO")
+                exceeds = current_max_value > max_value
+                if not exceeds and float(min_entry[1]) < min_value:
+                    timestamp, current_max_value = min_entry[0], float(min_entry[1])
+                    exceeds = True
+            
+            if exceeds:
+                self.log(f"Found value exceeding threshold: [{timestamp}, {current_max_value}]", "WARNING")
+                delete_url = f"http://{server}/data/{uuid_value}.json?operation=delete&ts={timestamp}"
+                if not self.archive_values([(timestamp, current_max_value)]):
+                    return False
+                
+                # Pace the delete according to the measured server speed
+                waited = time.monotonic()
+                controller.acquire()
+                started = time.monotonic()
+                ok = self.delete_data(delete_url)
+                latency = time.monotonic() - started
+                controller.record(latency, ok)
+                self.metrics.record_delete(latency, ok, started - waited)
+                self.on_rate(controller)
+                
+                if ok:
+                    self.deleted_count += 1
+                    if self.cache:
+                        self.cache.remove(timestamp, timestamp)
+                    self.log(f"Successfully deleted entry with timestamp {timestamp}", "SUCCESS")
+                    self.on_status(f"Deleted: {self.deleted_count}")
+                else:
+                    self.cancel_archived([timestamp])
+                    self.log("Failed to delete entry. Stopping process.", "ERROR")
+                    return False
+            else:
+                self.log("No values exceeding threshold found. Process complete.", "INFO")
+                break
+        return True
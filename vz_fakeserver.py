@@ -0,0 +1,361 @@
+"""
+Local stand-in for the Volkszaehler middleware, for benchmarks and trying the
+tool without a real server. Serves one synthetic channel per UUID:
+
+    /data/<uuid>.json?from=..&to=..                    raw tuples with min/max
+    /data/<uuid>.json?from=..&to=..&tuples=N           rows packed into N packets of averages
+    /data/<uuid>.json?from=..&to=..&group=hour         averages per minute/hour/day/week/month/year
+    /data/<uuid>.json?operation=delete&ts=..           delete one value
+    /data/<uuid>.json?operation=delete&from=..&to=..   delete a range
+    /data/<uuid>.json?operation=add&ts=..&value=..     add one value
+    POST /data/<uuid>.json  [[ts, value], ...]         add many values
+    /_fake/reset                                       restore all channels, reset the counters
+    /_fake/stats                                       request counters as JSON
+
+Responses are streamed with chunked transfer encoding (gzip if the client asks
+for it), every request waits the configured latency first.
+
+Example:
+    python vz_fakeserver.py --rows 5000000 --spike-rate 0.0005 --latency 0.01 --port 8080
+    python vz_cli.py --server 127.0.0.1:8080 --uuid 12345678-1234-1234-1234-123456789abc \
+        --from 1700000000000 --to 1705000000000 --max 10000
+"""
+import argparse
+import array
+import bisect
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+# First timestamp of the generated data (14.11.2023 22:13 UTC) and row interval
+DEFAULT_START = 1700000000000
+DEFAULT_STEP_MS = 1000
+
+# Rows serialized per response chunk
+CHUNK_ROWS = 8192
+
+DATA_PATH_PATTERN = re.compile(r"^/data/([0-9a-fA-F-]{36})\.json$")
+
+def generate_data(rows, start=DEFAULT_START, step_ms=DEFAULT_STEP_MS, spike_rate=0.001, spike_value=100000.0, seed=1):
+    """
+    Generate a power-like channel: a daily curve with noise, and spikes at spike_rate
+    of the rows. A fifth of the spikes are runs of 2-5 values, a tenth are negative.
+    Returns (timestamps, values) as int64 and float64 arrays.
+    """
+    rng = random.Random(seed)
+    timestamps = array.array("q", range(start, start + rows * step_ms, step_ms))
+    day = 2 * math.pi / 86400000
+    values = array.array("d", (round(300 + 200 * math.sin((timestamp - start) * day) + rng.gauss(0, 20), 2)
+                               for timestamp in timestamps))
+
+    for _ in range(int(rows * spike_rate)):
+        index = rng.randrange(rows)
+        length = rng.randint(2, 5) if rng.random() < 0.2 else 1
+        sign = -1 if rng.random() < 0.1 else 1
+        for offset in range(index, min(rows, index + length)):
+            values[offset] = sign * round(spike_value * rng.uniform(1, 2), 2)
+    return timestamps, values
+
+def group_key(timestamp, group):
+    """Return the bucket of a timestamp for the group parameter (UTC)"""
+    if group == "minute":
+        return timestamp // 60000
+    if group == "hour":
+        return timestamp // 3600000
+    if group == "day":
+        return timestamp // 86400000
+    if group == "week":
+        return (timestamp // 86400000 + 3) // 7
+    moment = datetime.fromtimestamp(timestamp / 1000, timezone.utc)
+    if group == "month":
+        return moment.year * 12 + moment.month
+    if group == "year":
+        return moment.year
+    raise ValueError(f"unknown group '{group}'")
+
+class FakeChannel:
+    """Sorted timestamp/value columns of one channel"""
+
+    def __init__(self, timestamps, values):
+        self.timestamps = array.array("q", timestamps)
+        self.values = array.array("d", values)
+
+    def bounds(self, start, end):
+        """Return the (low, high) row indexes of the inclusive range"""
+        return bisect.bisect_left(self.timestamps, start), bisect.bisect_right(self.timestamps, end)
+
+    def delete(self, start, end):
+        """Delete the rows of the inclusive range, returns the number of rows"""
+        low, high = self.bounds(start, end)
+        del self.timestamps[low:high]
+        del self.values[low:high]
+        return high - low
+
+    def add(self, rows):
+        """Insert (timestamp, value) rows in time order, returns the number of rows added"""
+        added = 0
+        for timestamp, value in rows:
+            index = bisect.bisect_left(self.timestamps, timestamp)
+            if index < len(self.timestamps) and self.timestamps[index] == timestamp:
+                # Like the unique key of the data table
+                continue
+            self.timestamps.insert(index, timestamp)
+            self.values.insert(index, value)
+            added += 1
+        return added
+
+class FakeMiddleware:
+    """
+    Channels, counters and settings of the fake middleware. Every UUID gets its own
+    copy of the template data on first use.
+    """
+
+    def __init__(self, timestamps, values, latency=0.0, fail_rate=0.0, range_delete=True):
+        self.template = (timestamps, values)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.range_delete = range_delete
+        self.channels = {}
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.reset()
+
+    def reset(self):
+        """Restore the template data of all channels and reset the counters"""
+        with self.lock:
+            self.channels.clear()
+            self.stats = {"requests": 0, "fetches": 0, "deletes": 0, "deleted_rows": 0, "adds": 0, "added_rows": 0,
+                          "failures": 0, "bytes_sent": 0}
+
+    def count(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.stats[name] += amount
+
+    def channel(self, uuid_value):
+        """Return the channel of the UUID, created from the template data"""
+        with self.lock:
+            if uuid_value not in self.channels:
+                self.channels[uuid_value] = FakeChannel(*self.template)
+            return self.channels[uuid_value]
+
+    def select(self, channel, start, end, tuples=None, group=None):
+        """
+        Return (header, rows) for a fetch: header holds rows, min and max of the raw
+        values, rows is a list of [timestamp, value, count] (packed or grouped if asked).
+        """
+        with self.lock:
+            low, high = channel.bounds(start, end)
+            timestamps = channel.timestamps[low:high]
+            values = channel.values[low:high]
+            # Packets of sensor values are weighted from the value before the range
+            previous = channel.timestamps[low - 1] if low else None
+
+        header = {"uuid": None, "from": start, "to": end}
+        if values:
+            high_index = max(range(len(values)), key=values.__getitem__)
+            low_index = min(range(len(values)), key=values.__getitem__)
+            header["min"] = [timestamps[low_index], values[low_index]]
+            header["max"] = [timestamps[high_index], values[high_index]]
+            header["average"] = round(sum(values) / len(values), 3)
+
+        if group:
+            buckets = {}
+            for timestamp, value in zip(timestamps, values):
+                bucket = buckets.setdefault(group_key(timestamp, group), [timestamp, 0.0, 0])
+                bucket[0] = timestamp
+                bucket[1] += value
+                bucket[2] += 1
+            rows = [[timestamp, total / count, count] for timestamp, total, count in buckets.values()]
+        elif tuples and len(values) > tuples:
+            # Pack consecutive rows into packets like the middleware does for sensors: timestamp of
+            # the last row, values weighted by the time since the row before
+            size = -(-len(values) // tuples)
+            rows = []
+            for first in range(0, len(values), size):
+                last = min(first + size, len(values)) - 1
+                before = timestamps[first - 1] if first else previous
+                if before is None:
+                    # The first row of the channel weighs nothing
+                    before = timestamps[first]
+                packet_start, weighted = before, 0.0
+                for index in range(first, last + 1):
+                    weighted += values[index] * (timestamps[index] - before)
+                    before = timestamps[index]
+                duration = timestamps[last] - packet_start
+                average = weighted / duration if duration else sum(values[first:last + 1]) / (last + 1 - first)
+                rows.append([timestamps[last], average, last + 1 - first])
+        else:
+            rows = None
+        header["rows"] = len(rows) if rows is not None else len(values)
+        return header, rows if rows is not None else zip(timestamps, values, [1] * len(values))
+
+def make_handler(middleware):
+    """Return the request handler class serving the given FakeMiddleware"""
+
+    class FakeMiddlewareHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = dict(parse_qsl(parts.query))
+            if parts.path == "/_fake/reset":
+                middleware.reset()
+                return self.reply(200, {"reset": True})
+            if parts.path == "/_fake/stats":
+                return self.reply(200, middleware.stats)
+            match = self.begin(parts)
+            if not match:
+                return
+            channel = middleware.channel(match.group(1).lower())
+
+            try:
+                if query.get("operation") == "add":
+                    return self.add(channel, [(int(query["ts"]), float(query["value"]))])
+                if query.get("operation") == "delete":
+                    if "ts" in query:
+                        start = end = int(query["ts"])
+                    elif not middleware.range_delete:
+                        return self.reply(400, {"exception": {"message": "Range deletes are not supported"}})
+                    else:
+                        start, end = int(query["from"]), int(query["to"])
+                    with middleware.lock:
+                        rows = channel.delete(start, end)
+                    middleware.count(deletes=1, deleted_rows=rows)
+                    return self.reply(200, {"version": "0.3", "rows": rows})
+
+                start, end = int(query["from"]), int(query["to"])
+                tuples = int(query["tuples"]) if "tuples" in query else None
+                header, rows = middleware.select(channel, start, end, tuples, query.get("group"))
+            except (KeyError, ValueError) as e:
+                return self.reply(400, {"exception": {"message": f"Invalid request: {str(e)}"}})
+            header["uuid"] = match.group(1)
+            middleware.count(fetches=1)
+            self.stream(header, rows)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            match = self.begin(urlsplit(self.path))
+            if not match:
+                return
+            try:
+                rows = [(int(row[0]), float(row[1])) for row in json.loads(body)]
+            except (ValueError, TypeError, IndexError) as e:
+                return self.reply(400, {"exception": {"message": f"Invalid request: {str(e)}"}})
+            self.add(middleware.channel(match.group(1).lower()), rows)
+
+        def begin(self, parts):
+            """Count, delay or fail a data request like configured, returns the path match or None after replying"""
+            middleware.count(requests=1)
+            if middleware.latency:
+                time.sleep(middleware.latency)
+            if middleware.fail_rate and random.random() < middleware.fail_rate:
+                middleware.count(failures=1)
+                return self.reply(503, {"exception": {"message": "Service unavailable"}})
+            match = DATA_PATH_PATTERN.match(parts.path)
+            if not match:
+                return self.reply(404, {"exception": {"message": "Unknown context"}})
+            return match
+
+        def add(self, channel, rows):
+            """Add rows to the channel and reply with the number added"""
+            with middleware.lock:
+                added = channel.add(rows)
+            middleware.count(adds=1, added_rows=added)
+            self.reply(200, {"version": "0.3", "rows": added})
+
+        def reply(self, code, body):
+            """Send a small JSON reply"""
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def stream(self, header, rows):
+            """Send the data response chunk by chunk, the tuples array last"""
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if "gzip" in self.headers.get("Accept-Encoding", "") else None
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            if compressor:
+                self.send_header("Content-Encoding", "gzip")
+            self.end_headers()
+
+            def send(text):
+                data = text.encode("utf-8")
+                if compressor:
+                    data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    middleware.count(bytes_sent=len(data))
+
+            prefix = json.dumps({"version": "0.3", "data": header})[:-2]
+            send(prefix + ',"tuples":[')
+            rows = iter(rows)
+            separator = ""
+            while True:
+                batch = [f"[{row[0]},{row[1]!r},{row[2]}]" for _, row in zip(range(CHUNK_ROWS), rows)]
+                if not batch:
+                    break
+                send(separator + ",".join(batch))
+                separator = ","
+            send("]}}")
+            if compressor:
+                tail = compressor.flush()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(tail), tail))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    return FakeMiddlewareHandler
+
+def serve(middleware, port=0, host="127.0.0.1"):
+    """Serve the fake middleware from a background thread, returns the server (server_address has the port)"""
+    server = ThreadingHTTPServer((host, port), make_handler(middleware))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def build_parser():
+    """Create the argument parser"""
+    parser = argparse.ArgumentParser(description="Local fake Volkszaehler middleware with a synthetic channel.")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on (default: %(default)s)")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    parser.add_argument("--rows", type=int, default=1000000, help="values per channel (default: %(default)s)")
+    parser.add_argument("--start", type=int, default=DEFAULT_START, help="first timestamp in ms (default: %(default)s)")
+    parser.add_argument("--step-ms", type=int, default=DEFAULT_STEP_MS, help="ms between values (default: %(default)s)")
+    parser.add_argument("--spike-rate", type=float, default=0.001, help="share of values that are spikes (default: %(default)s)")
+    parser.add_argument("--spike-value", type=float, default=100000.0, help="smallest spike value (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the data (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every request waits (default: %(default)s)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with HTTP 503 (default: %(default)s)")
+    parser.add_argument("--no-range-delete", action="store_true", help="refuse range deletes like older middleware versions")
+    return parser
+
+def main(argv=None):
+    """Command line entry point, serves until Ctrl+C"""
+    args = build_parser().parse_args(argv)
+    timestamps, values = generate_data(args.rows, args.start, args.step_ms, args.spike_rate, args.spike_value, args.seed)
+    middleware = FakeMiddleware(timestamps, values, args.latency, args.fail_rate, not args.no_range_delete)
+    server = serve(middleware, args.port, args.host)
+    print(f"Serving {args.rows} values per channel from {args.start} to {timestamps[-1] if timestamps else args.start} "
+          f"on http://{args.host}:{server.server_address[1]}/data/<uuid>.json", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
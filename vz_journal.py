@@ -0,0 +1,129 @@
+"""
+Write-ahead journal of a deletion run, so a stopped or crashed run can be resumed.
+
+The journal is an append-only file with one JSON record per line:
+    {"type": "start", "params": {...}}
+    {"type": "scanned", "to": ..., "last_ts": ..., "scanned": ..., "runs": [...], "open_run": [...]}
+    {"type": "planned"}
+    {"type": "deleted", "from": ..., "to": ...}
+    {"type": "end", "status": "completed"}
+Planned runs are written before any of them is deleted, confirmed deletes after
+the server answered. A torn last line from a crash is ignored when reading.
+"""
+import json
+import os
+import threading
+
+# Params that must match for a journal to be resumed
+RESUME_KEYS = ["server", "uuid", "start_time", "end_time", "max_value", "min_value", "rules"]
+
+class JournalState:
+    """Progress of a run as recovered from its journal"""
+
+    def __init__(self):
+        self.params = None
+        self.scanned_to = None
+        self.last_timestamp = None
+        self.scanned = 0
+        self.runs = []
+        self.open_run = None
+        self.planned = False
+        self.deleted = set()
+        self.status = None
+
+    def matches(self, params):
+        """Check if the journal belongs to a run with the given params"""
+        return self.params is not None and all(self.params.get(key) == params.get(key) for key in RESUME_KEYS)
+
+    def remaining_runs(self, runs):
+        """Return the given runs without the values already confirmed deleted"""
+        remaining = []
+        for run in runs:
+            if (run[0][0], run[-1][0]) in self.deleted:
+                continue
+            run = [entry for entry in run if (entry[0], entry[0]) not in self.deleted]
+            if run:
+                remaining.append(run)
+        return remaining
+
+def read_journal(path):
+    """Replay a journal file into a JournalState"""
+    state = JournalState()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn write at the end of a crashed run
+                break
+            kind = record.get("type")
+            if kind == "start":
+                state.params = record["params"]
+            elif kind == "scanned":
+                state.scanned_to = record["to"]
+                state.last_timestamp = record["last_ts"]
+                state.scanned = record["scanned"]
+                state.runs.extend([[tuple(entry) for entry in run] for run in record["runs"]])
+                open_run = record.get("open_run")
+                state.open_run = [tuple(entry) for entry in open_run] if open_run else None
+            elif kind == "planned":
+                state.planned = True
+                if state.open_run:
+                    state.runs.append(state.open_run)
+                    state.open_run = None
+            elif kind == "deleted":
+                state.deleted.add((record["from"], record["to"]))
+            elif kind == "end":
+                state.status = record["status"]
+    return state
+
+class RunJournal:
+    """Append-only journal writer, safe to call from the dispatcher threads"""
+
+    def __init__(self, path, params=None):
+        """Start a new journal for params, or continue the existing one if params is None"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a" if params is None else "w", encoding="utf-8")
+        if params is not None:
+            self.write({"type": "start", "params": {key: params.get(key) for key in RESUME_KEYS}}, sync=True)
+
+    def write(self, record, sync=False):
+        """Append one record, with sync=True it is forced to disk before returning"""
+        with self.lock:
+            self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+    def scanned(self, window_end, last_timestamp, scanned, runs, open_run):
+        """Record a finished scan window with the runs closed in it and the run still open"""
+        self.write({
+            "type": "scanned",
+            "to": window_end,
+            "last_ts": last_timestamp,
+            "scanned": scanned,
+            "runs": runs,
+            "open_run": open_run,
+        }, sync=True)
+
+    def planned(self):
+        """Record that the scan is complete and the plan is final"""
+        self.write({"type": "planned"}, sync=True)
+
+    def deleted(self, first, last):
+        """Record a delete confirmed by the server"""
+        self.write({"type": "deleted", "from": first, "to": last})
+
+    def end(self, status):
+        """Record the end of the run and close the file"""
+        self.write({"type": "end", "status": status}, sync=True)
+        self.close()
+
+    def close(self):
+        """Close the journal file"""
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
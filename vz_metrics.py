@@ -0,0 +1,128 @@
+"""
+Counters and timers of a deletion run: what was fetched and parsed, how long
+fetching, parsing, deleting and waiting for the rate limit took, delete latency
+percentiles and retries. Shown live, added to the run summary and optionally
+served as Prometheus text on a local port.
+"""
+import array
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Counters of a run, seconds are summed over all threads
+COUNTERS = [
+    "bytes_fetched",
+    "tuples_parsed",
+    "fetch_requests",
+    "fetch_seconds",
+    "parse_seconds",
+    "delete_requests",
+    "delete_failures",
+    "delete_seconds",
+    "wait_seconds",
+    "retries",
+]
+
+# Delete latency percentiles in the summary
+PERCENTILES = [50, 95, 99]
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted values, None without values"""
+    if not values:
+        return None
+    rank = max(1, math.ceil(percent / 100.0 * len(values)))
+    return values[rank - 1]
+
+class RunMetrics:
+    """Thread-safe counters and delete latencies of one run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.latencies = array.array("d")
+
+    def add(self, **amounts):
+        """Add to one or more counters"""
+        with self.lock:
+            for name, amount in amounts.items():
+                self.counters[name] += amount
+
+    def record_delete(self, latency, ok, wait=0.0):
+        """Record one delete request with its latency and the time it waited for the rate limit"""
+        with self.lock:
+            self.counters["delete_requests"] += 1
+            self.counters["delete_seconds"] += latency
+            self.counters["wait_seconds"] += wait
+            if not ok:
+                self.counters["delete_failures"] += 1
+            self.latencies.append(latency)
+
+    def count_retry(self, *args):
+        """Count one retried request, usable as on_retry callback"""
+        self.add(retries=1)
+
+    def summary(self):
+        """Return a snapshot of all counters, rates and latency percentiles"""
+        with self.lock:
+            counters = dict(self.counters)
+            latencies = sorted(self.latencies)
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        summary = {name: round(value, 3) if isinstance(value, float) else value for name, value in counters.items()}
+        summary["elapsed"] = round(elapsed, 3)
+        summary["requests_per_second"] = round((counters["fetch_requests"] + counters["delete_requests"]) / elapsed, 2)
+        summary["deletes_per_second"] = round(counters["delete_requests"] / elapsed, 2)
+        summary["tuples_per_second"] = round(counters["tuples_parsed"] / elapsed, 1)
+        for percent in PERCENTILES:
+            value = percentile(latencies, percent)
+            summary[f"delete_latency_p{percent}"] = round(value, 4) if value is not None else None
+        return summary
+
+    def describe(self):
+        """One line for live display"""
+        summary = self.summary()
+        latency = summary["delete_latency_p50"]
+        return (f"Fetched: {summary['bytes_fetched'] / 1048576:.1f} MB, {summary['tuples_parsed']} values "
+                f"(parse {summary['parse_seconds']:.1f}s) | Deletes: {summary['delete_requests']} "
+                f"({summary['deletes_per_second']}/s, p50 {latency * 1000 if latency is not None else 0:.0f} ms) | "
+                f"Retries: {summary['retries']}")
+
+    def prometheus(self):
+        """Return the metrics in the Prometheus text format"""
+        summary = self.summary()
+        lines = []
+        for name in COUNTERS:
+            lines.append(f"# TYPE vz_delete_{name}_total counter")
+            lines.append(f"vz_delete_{name}_total {summary[name]}")
+        lines.append("# TYPE vz_delete_latency_seconds summary")
+        for percent in PERCENTILES:
+            value = summary[f"delete_latency_p{percent}"]
+            lines.append(f'vz_delete_latency_seconds{{quantile="{percent / 100}"}} {value if value is not None else "NaN"}')
+        lines.append(f"vz_delete_latency_seconds_count {summary['delete_requests']}")
+        lines.append(f"vz_delete_latency_seconds_sum {summary['delete_seconds']}")
+        return "\n".join(lines) + "\n"
+
+def serve_metrics(get_metrics, port, host="127.0.0.1"):
+    """
+    Serve the current metrics as Prometheus text on http://host:port/metrics from a
+    background thread. get_metrics returns the RunMetrics to show. Returns the server.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = get_metrics().prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,74 @@
+"""
+Delete plans of the Volkszaehler Data Deletion Tool.
+A dry run scans the range once and writes every offending value with the reason
+into a plan file; the plan can be executed later without fetching the data again.
+
+Plan file (JSON, gzip compressed if the name ends with .gz):
+    {"version": 1, "server": ..., "uuid": ..., "from": ..., "to": ..., "max_value": ..., "min_value": ...,
+     "created": "2025-05-01 14:30:00", "summary": {...},
+     "runs": [[[timestamp, value, reason], ...], ...]}
+Every run is a group of consecutive offending values without a good value in
+between, so it can be deleted with one range request.
+"""
+import gzip
+import json
+from datetime import datetime
+
+PLAN_VERSION = 1
+
+# Plan keys copied into the engine params when a plan is executed
+PLAN_PARAM_KEYS = {"server": "server", "uuid": "uuid", "from": "start_time", "to": "end_time", "max_value": "max_value",
+                   "min_value": "min_value"}
+
+def open_plan_file(path, mode):
+    """Open a plan file as text, gzip compressed if the name ends with .gz"""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def summarize_runs(runs, scanned):
+    """Return the summary stats of the planned runs"""
+    values = [entry[1] for run in runs for entry in run]
+    reasons = {}
+    for run in runs:
+        for entry in run:
+            reasons[entry[2]] = reasons.get(entry[2], 0) + 1
+    return {
+        "scanned": scanned,
+        "offenders": len(values),
+        "runs": len(runs),
+        "longest_run": max((len(run) for run in runs), default=0),
+        "min_value": min(values, default=None),
+        "max_value": max(values, default=None),
+        "first": runs[0][0][0] if runs else None,
+        "last": runs[-1][-1][0] if runs else None,
+        "reasons": reasons,
+    }
+
+def write_plan(path, params, runs, scanned):
+    """Write the planned runs of a dry run to a plan file"""
+    plan = {
+        "version": PLAN_VERSION,
+        "server": params["server"],
+        "uuid": params["uuid"],
+        "from": params["start_time"],
+        "to": params["end_time"],
+        "max_value": params["max_value"],
+        "min_value": params.get("min_value"),
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "summary": summarize_runs(runs, scanned),
+        "runs": [[list(entry) for entry in run] for run in runs],
+    }
+    with open_plan_file(path, "w") as f:
+        json.dump(plan, f, separators=(",", ":"))
+    return plan["summary"]
+
+def read_plan(path):
+    """Read a plan file, returns (params, runs, summary)"""
+    with open_plan_file(path, "r") as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"unsupported plan version {plan.get('version')}")
+    params = {param: plan.get(key) for key, param in PLAN_PARAM_KEYS.items()}
+    runs = [[tuple(entry) for entry in run] for run in plan["runs"]]
+    return params, runs, plan["summary"]
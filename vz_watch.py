@@ -0,0 +1,122 @@
+"""
+Watch mode of the Volkszaehler Data Deletion Tool: check a channel again every
+interval, but only the values that arrived since the last check, and delete the
+ones beyond the threshold right away.
+
+The timestamp of the last checked value (high-water mark) is kept per channel:
+    <watch dir>/<server>/<uuid>.json    {"version": 1, "high_water": ...}
+so a restarted watcher continues where it stopped instead of scanning everything again.
+"""
+import json
+import os
+import re
+import threading
+import time
+from vz_engine import MODE_SCAN
+
+WATCH_VERSION = 1
+
+DEFAULT_WATCH_DIR = os.path.join(os.path.expanduser("~"), ".vz_delete_tool", "watch")
+
+# Options of a single run that make no sense for a watcher
+WATCH_UNSUPPORTED = ["journal", "resume", "dry_run", "plan_in"]
+
+class HighWaterMark:
+    """Timestamp of the last checked value of one channel, stored as a small JSON file"""
+
+    def __init__(self, directory, server, uuid_value):
+        self.path = os.path.join(directory, re.sub(r"[^\w.-]", "_", server), f"{uuid_value}.json")
+
+    def load(self):
+        """Return the stored timestamp, None if the channel was never watched"""
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("version") != WATCH_VERSION:
+            raise ValueError(f"unsupported watch state version {state.get('version')}")
+        return state["high_water"]
+
+    def save(self, timestamp):
+        """Store the timestamp atomically"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": WATCH_VERSION, "high_water": timestamp}, f)
+        os.replace(self.path + ".tmp", self.path)
+
+class Watcher:
+    """
+    Run the engine on the values newer than the high-water mark every interval seconds
+    until stopped. Has the run/stop/metrics/log interface of DeletionEngine, so the
+    command line drives both the same way.
+    """
+
+    def __init__(self, engine, directory=DEFAULT_WATCH_DIR, interval=60, lookback_ms=0, max_cycles=None):
+        self.engine = engine
+        self.log = engine.log
+        self.directory = directory
+        self.interval = interval
+        self.lookback_ms = lookback_ms
+        self.max_cycles = max_cycles
+        self.stopped = threading.Event()
+
+    @property
+    def metrics(self):
+        """Metrics of the current cycle"""
+        return self.engine.metrics
+
+    def stop(self):
+        """Stop the current cycle and the watcher"""
+        self.stopped.set()
+        self.engine.stop()
+
+    def run(self, params):
+        """
+        Watch the channel of params (server, uuid, max_value and the other scan options,
+        start_time is only used for the first check of a channel) and return a summary
+        once stopped or after max_cycles checks.
+        """
+        mark = HighWaterMark(self.directory, params["server"], params["uuid"])
+        try:
+            high_water = mark.load()
+        except (OSError, ValueError, KeyError) as e:
+            self.log(f"Cannot read watch state {mark.path}: {str(e)}. Starting from the beginning.", "WARNING")
+            high_water = None
+        # Nothing checked yet: start at the given start time, otherwise with the values from now on
+        next_start = high_water + 1 if high_water is not None else params.get("start_time") or int(time.time() * 1000)
+        self.log(f"Watching {params['uuid']} every {self.interval}s from {next_start}, state in {mark.path}", "INFO")
+
+        summary = {"status": "completed", "cycles": 0, "failed_cycles": 0, "scanned": 0, "deleted": 0, "high_water": high_water}
+        self.stopped.clear()
+        while not self.stopped.is_set():
+            end_time = int(time.time() * 1000)
+            start_time = max(0, next_start - self.lookback_ms)
+            if start_time < end_time:
+                cycle_params = dict(params, mode=MODE_SCAN, start_time=start_time, end_time=end_time,
+                                    **{key: None for key in WATCH_UNSUPPORTED})
+                result = self.engine.run(cycle_params)
+                summary["cycles"] += 1
+                summary["scanned"] += result.get("scanned", 0)
+                summary["deleted"] += result["deleted"]
+                summary["metrics"] = result.get("metrics")
+                if result["status"] == "completed":
+                    if result.get("last_timestamp") is not None and result["last_timestamp"] >= next_start:
+                        high_water = result["last_timestamp"]
+                        next_start = high_water + 1
+                        try:
+                            mark.save(high_water)
+                        except OSError as e:
+                            self.log(f"Cannot write watch state {mark.path}: {str(e)}", "WARNING")
+                    summary["high_water"] = high_water
+                elif result["status"] == "failed":
+                    # Keep the mark, the same values are checked again next time
+                    summary["failed_cycles"] += 1
+                    self.log(f"Check failed, trying again in {self.interval}s", "WARNING")
+                else:
+                    break
+
+            if self.max_cycles and summary["cycles"] >= self.max_cycles:
+                return summary
+            self.stopped.wait(self.interval)
+        summary["status"] = "stopped"
+        return summary